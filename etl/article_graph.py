@@ -0,0 +1,198 @@
+"""
+Граф перекрестных ссылок между статьями.
+
+При построении из текста каждой статьи извлекаются ссылки на другие статьи того
+же документа («в соответствии со статьей 26 настоящего Кодекса», «статьями 30 - 32
+настоящего Кодекса»). Граф хранится в формате CSR: статьи, на которые ссылается
+статья i, — indices[indptr[i]:indptr[i + 1]].
+
+При поиске ReferenceExpander дополняет найденные фрагменты фрагментами статей,
+на которые ссылаются найденные статьи. Их фрагменты выбираются из хранилища
+одним пакетом вместе с результатами плотного поиска, поэтому модель получает
+связанные нормы сразу, без повторных запросов.
+
+Построение графа:
+    python etl/article_graph.py build --corpus docx
+
+Секция `retrieval.references` конфига:
+    retrieval:
+      references:
+        graph_path: "data/processed/article_graph"
+        max_articles: 3
+        chunks_per_article: 2
+"""
+from typing import Dict, Iterable, List, Optional, Tuple
+import argparse
+import json
+import os
+import re
+
+import numpy as np
+
+from context_packer import article_number
+
+GRAPH_DIR = 'data/processed/article_graph/'
+
+# Ссылка на статьи того же документа; номера могут идти списком или диапазоном
+REFERENCE = re.compile(
+    r'(?:стать(?:я|и|е|ю|ей|ям|ями|ях)|ст\.)\s*'
+    r'(\d+(?:\.\d+)*(?:\s*(?:,|и|-|–|—)\s*\d+(?:\.\d+)*)*)\s+настоящего\s+Кодекса',
+    re.IGNORECASE
+)
+NUMBER = re.compile(r'\d+(?:\.\d+)*')
+RANGE_DASHES = re.compile(r'^\s*[-–—]\s*$')
+# Диапазон «статьи 30 - 32» разворачивается, только если он короткий
+MAX_RANGE = 20
+
+
+def referenced_articles(text: str) -> List[str]:
+    """Номера статей, на которые ссылается текст, в порядке упоминания"""
+    found = []
+    for match in REFERENCE.finditer(text):
+        numbers = match.group(1)
+        positions = list(NUMBER.finditer(numbers))
+        for i, number in enumerate(positions):
+            if i and RANGE_DASHES.match(numbers[positions[i - 1].end():number.start()]):
+                start, end = positions[i - 1].group(), number.group()
+                if start.isdigit() and end.isdigit() and 0 < int(end) - int(start) <= MAX_RANGE:
+                    found.extend(str(n) for n in range(int(start) + 1, int(end)))
+            found.append(number.group())
+    return list(dict.fromkeys(found))
+
+
+class ArticleGraph:
+    def __init__(self, articles: List[Tuple[str, str]], indptr: np.ndarray, indices: np.ndarray):
+        # Статья — пара (источник, номер): «настоящий Кодекс» у каждого документа свой
+        self.articles = [tuple(article) for article in articles]
+        self.ids = {article: i for i, article in enumerate(self.articles)}
+        self.indptr = indptr
+        self.indices = indices
+
+    @classmethod
+    def build(cls, texts: Iterable[str], metadatas: Iterable[Dict]) -> "ArticleGraph":
+        edges: Dict[Tuple[str, str], Dict[Tuple[str, str], None]] = {}
+        for text, metadata in zip(texts, metadatas):
+            number = article_number(metadata)
+            if not number:
+                continue
+            source = str(metadata.get("source") or "")
+            targets = edges.setdefault((source, number), {})
+            for target in referenced_articles(text):
+                if target != number:
+                    targets[(source, target)] = None
+
+        # Ссылки на статьи, которых нет в корпусе (утратили силу, не загружены), отбрасываются
+        articles = sorted(edges, key=lambda a: (a[0], [int(p) for p in a[1].split(".")]))
+        ids = {article: i for i, article in enumerate(articles)}
+        indptr = np.zeros(len(articles) + 1, dtype=np.int32)
+        indices = []
+        for i, article in enumerate(articles):
+            targets = [ids[t] for t in edges[article] if t in ids]
+            indices.extend(targets)
+            indptr[i + 1] = len(indices)
+        return cls(articles, indptr, np.asarray(indices, dtype=np.int32))
+
+    def references(self, article: Tuple[str, str]) -> List[Tuple[str, str]]:
+        i = self.ids.get(article)
+        if i is None:
+            return []
+        return [self.articles[j] for j in self.indices[self.indptr[i]:self.indptr[i + 1]]]
+
+    @property
+    def num_edges(self) -> int:
+        return len(self.indices)
+
+    def save(self, directory: str = GRAPH_DIR):
+        os.makedirs(directory, exist_ok=True)
+        np.save(os.path.join(directory, "indptr.npy"), self.indptr)
+        np.save(os.path.join(directory, "indices.npy"), self.indices)
+        with open(os.path.join(directory, "articles.json"), "w", encoding="utf-8") as f:
+            json.dump(self.articles, f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, directory: str = GRAPH_DIR) -> "ArticleGraph":
+        with open(os.path.join(directory, "articles.json"), "r", encoding="utf-8") as f:
+            articles = json.load(f)
+        return cls(articles, np.load(os.path.join(directory, "indptr.npy")),
+                   np.load(os.path.join(directory, "indices.npy")))
+
+
+def chunk_order(metadata: Dict) -> Tuple:
+    return metadata.get("point_number") or 0, metadata.get("chunk_index") or 0
+
+
+class ReferenceExpander:
+    """Дополняет результаты поиска фрагментами статей, на которые они ссылаются"""
+
+    def __init__(self, vectorstore, graph_path: Optional[str] = GRAPH_DIR, max_articles: int = 3,
+                 chunks_per_article: int = 2):
+        if not hasattr(vectorstore, "docstore"):
+            raise ValueError("Расширение по ссылкам строится только по индексу langchain FAISS")
+        self.max_articles = max_articles
+        self.chunks_per_article = chunks_per_article
+        self.docstore = vectorstore.docstore
+        docs = [self.docstore.search(doc_id) for doc_id in vectorstore.index_to_docstore_id.values()]
+
+        # Фрагменты каждой статьи в порядке следования в документе
+        chunks: Dict[Tuple[str, str], List] = {}
+        for doc_id, doc in zip(vectorstore.index_to_docstore_id.values(), docs):
+            key = self.article_of(doc.metadata)
+            if key is not None:
+                chunks.setdefault(key, []).append((chunk_order(doc.metadata), doc_id))
+        self.article_chunks: Dict[Tuple[str, str], List[str]] = {
+            key: [doc_id for _, doc_id in sorted(items)][:chunks_per_article] for key, items in chunks.items()
+        }
+
+        self.graph = None
+        if graph_path and os.path.exists(os.path.join(graph_path, "indptr.npy")):
+            graph = ArticleGraph.load(graph_path)
+            # Граф, построенный по другому корпусу (источник — имя файла или URL), не найдет ни одной статьи
+            if self.article_chunks and graph.ids.keys() & self.article_chunks.keys():
+                self.graph = graph
+            else:
+                print(f"Граф ссылок {graph_path} не совпадает со статьями индекса, строится заново")
+        if self.graph is None:
+            # Граф по ЖК РФ строится за доли секунды, отдельный шаг нужен для больших корпусов
+            self.graph = ArticleGraph.build((doc.page_content for doc in docs), (doc.metadata for doc in docs))
+        self.last_added: List[Tuple[str, str]] = []
+
+    @staticmethod
+    def article_of(metadata: Dict) -> Optional[Tuple[str, str]]:
+        number = article_number(metadata)
+        return (str(metadata.get("source") or ""), number) if number else None
+
+    def expand(self, docs: List) -> List:
+        found = [self.article_of(doc.metadata) for doc in docs]
+        present = set(found)
+        added: List[Tuple[str, str]] = []
+        # Ссылки более релевантных статей идут первыми
+        for article in found:
+            for target in self.graph.references(article) if article else ():
+                if target not in present and target in self.article_chunks:
+                    present.add(target)
+                    added.append(target)
+        self.last_added = added[:self.max_articles]
+        doc_ids = [doc_id for article in self.last_added for doc_id in self.article_chunks[article]]
+        return docs + [self.docstore.search(doc_id) for doc_id in doc_ids]
+
+
+if __name__ == "__main__":
+    from benchmark_retrieval import load_corpus
+
+    parser = argparse.ArgumentParser(description="Граф ссылок между статьями")
+    parser.add_argument("command", choices=["build", "show"])
+    parser.add_argument("article", nargs="?", help="номер статьи для show")
+    parser.add_argument("--corpus", choices=["docx", "html"], default="docx")
+    parser.add_argument("--directory", default=GRAPH_DIR)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        texts, metadatas = load_corpus(args.corpus)
+        graph = ArticleGraph.build(texts, metadatas)
+        graph.save(args.directory)
+        print(f"Статей: {len(graph.articles)}, ссылок: {graph.num_edges}")
+    else:
+        graph = ArticleGraph.load(args.directory)
+        for source, number in graph.articles:
+            if number == args.article:
+                print(source, number, "->", [n for _, n in graph.references((source, number))])
@@ -0,0 +1,106 @@
+"""
+Бенчмарк бэкендов эмбеддингов: PyTorch против ONNX Runtime (fp32 и int8).
+
+Для каждого варианта считаются время загрузки, скорость кодирования корпуса ЖК РФ
+(фрагментов в секунду), задержка эмбеддинга одиночного вопроса p50/p95, качество
+точного поиска (recall@k, MRR по статьям на вопросах из архива консультаций) и
+близость векторов к эталонному бэкенду той же модели.
+
+Пример:
+    python etl/benchmark_embeddings.py --corpus docx --variants torch onnx_fp32 onnx_int8 \\
+        --model-name sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2
+"""
+from datetime import datetime
+from typing import Dict, List
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+from benchmark_retrieval import build_index, evaluate_index, load_corpus, percentile
+from consultations import QA_PATH, build_query_set
+from context_packer import article_number
+from embeddings import EMBEDDING_MODEL, build_embeddings
+from tracing import rss_mb
+
+VARIANTS = {
+    "torch": {"backend": "huggingface"},
+    "onnx_fp32": {"backend": "onnx", "quantize": False},
+    "onnx_int8": {"backend": "onnx", "quantize": True},
+}
+
+
+def run_benchmark(corpus: str = "docx", variants: List[str] = tuple(VARIANTS), model_name: str = EMBEDDING_MODEL,
+                  k: int = 5, batch_size: int = 32, qa_path: str = QA_PATH,
+                  output_dir: str = "data/processed/benchmarks") -> List[Dict]:
+    texts, metadatas = load_corpus(corpus)
+    doc_articles = [article_number(m) for m in metadatas]
+    query_set = build_query_set(qa_path)
+    questions = [q["question"] for q in query_set]
+    relevant = [q["relevant"] for q in query_set]
+    print(f"Корпус {corpus}: {len(texts)} фрагментов, {len(query_set)} размеченных вопросов")
+
+    results = []
+    reference = None
+    for name in variants:
+        # Кэш отключен: измеряется сам энкодер
+        config = dict(VARIANTS[name], model_name=model_name, batch_size=batch_size, cache=False)
+        rss_before = rss_mb()
+        start = time.perf_counter()
+        embeddings = build_embeddings(config)
+        load_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        doc_vectors = np.asarray(embeddings.embed_documents(texts), dtype="float32")
+        encode_seconds = time.perf_counter() - start
+
+        latencies, query_vectors = [], []
+        for question in questions:
+            start = time.perf_counter()
+            query_vectors.append(embeddings.embed_query(question))
+            latencies.append((time.perf_counter() - start) * 1000)
+        query_vectors = np.asarray(query_vectors, dtype="float32")
+
+        metrics = evaluate_index(build_index("Flat", {}, doc_vectors), query_vectors, relevant, doc_articles, k)
+        result = {
+            "variant": name,
+            "model_name": model_name,
+            "load_seconds": load_seconds,
+            "encode_seconds": encode_seconds,
+            "docs_per_second": len(texts) / encode_seconds if encode_seconds > 0 else 0.0,
+            "query_p50_ms": percentile(latencies, 50),
+            "query_p95_ms": percentile(latencies, 95),
+            "rss_delta_mb": rss_mb() - rss_before,
+            f"recall@{k}": metrics[f"recall@{k}"],
+            f"hit_rate@{k}": metrics[f"hit_rate@{k}"],
+            "mrr": metrics["mrr"],
+        }
+        # Первый вариант — эталон: насколько совпадают векторы того же текста
+        if reference is None:
+            reference = doc_vectors
+        else:
+            result["cosine_to_reference"] = float(np.mean(np.sum(doc_vectors * reference, axis=1)))
+        results.append(result)
+        print(json.dumps(result, ensure_ascii=False))
+        del embeddings
+
+    os.makedirs(output_dir, exist_ok=True)
+    output_path = os.path.join(output_dir, f"embeddings_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump({"k": k, "corpus": corpus, "results": results}, f, ensure_ascii=False, indent=2)
+    print(f"Результаты сохранены в {output_path}")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Бенчмарк бэкендов эмбеддингов")
+    parser.add_argument("--corpus", choices=["docx", "html"], default="docx")
+    parser.add_argument("--variants", nargs="+", default=list(VARIANTS), choices=list(VARIANTS))
+    parser.add_argument("--model-name", default=EMBEDDING_MODEL)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--k", type=int, default=5)
+    args = parser.parse_args()
+
+    run_benchmark(args.corpus, args.variants, args.model_name, args.k, args.batch_size)
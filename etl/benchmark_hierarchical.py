@@ -0,0 +1,128 @@
+"""
+Бенчмарк двухэтапного поиска (статьи → фрагменты) против плоского.
+
+Корпус ЖК РФ масштабируется синтетическими статьями: у каждой свой центр
+(смесь векторов реальных статей) и несколько фрагментов вокруг него — так
+помехи имеют ту же структуру «документ → статья → фрагменты», что и RusLawOD.
+Для плоского индекса и для каждого значения top_articles считаются recall@k,
+MRR, recall относительно точного поиска, задержки и число векторов, с которыми
+сравнивается запрос (стоимость поиска).
+
+Пример:
+    python etl/benchmark_hierarchical.py --scales 0 100000 1000000 --top-articles 4 8 16
+"""
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+from benchmark_retrieval import build_index, embed_texts, evaluate_index, load_corpus
+from consultations import QA_PATH, build_query_set
+from context_packer import article_number
+from embeddings import build_embeddings
+from hierarchical_retrieval import HierarchicalIndex, article_key, normalize_rows
+
+
+def synthetic_articles(base: np.ndarray, metadatas: List[Dict], count: int, noise: float = 0.35,
+                       spread: float = 0.25, seed: int = 0) -> Tuple[np.ndarray, List[Dict]]:
+    """
+    count векторов-помех, сгруппированных в статьи. Размеры статей берутся из
+    реального корпуса, центры — смеси центроидов двух реальных статей с шумом.
+    """
+    rng = np.random.default_rng(seed)
+    groups: Dict[Tuple, List[int]] = {}
+    for i, metadata in enumerate(metadatas):
+        groups.setdefault(article_key(metadata), []).append(i)
+    sizes = np.array([len(ids) for ids in groups.values()])
+    centroids = normalize_rows(np.stack([base[ids].mean(axis=0) for ids in groups.values()]))
+    dim = base.shape[1]
+
+    vectors = np.empty((count, dim), dtype="float32")
+    synthetic_metadatas = []
+    filled, article = 0, 0
+    while filled < count:
+        n = min(int(rng.choice(sizes)), count - filled)
+        a, b = centroids[rng.integers(0, len(centroids), 2)]
+        w = rng.random(dtype="float32")
+        center = normalize_rows((w * a + (1 - w) * b + noise * rng.standard_normal(dim, dtype="float32")
+                                 / np.sqrt(dim))[None, :])
+        chunk = center + spread * rng.standard_normal((n, dim), dtype="float32") / np.sqrt(dim)
+        vectors[filled:filled + n] = normalize_rows(chunk)
+        synthetic_metadatas.extend([{"source": "synthetic", "article_number": f"s{article}"}] * n)
+        filled += n
+        article += 1
+    return vectors, synthetic_metadatas
+
+
+def run_benchmark(corpus: str = "docx", scales: List[int] = (0,), top_articles: List[int] = (4, 8, 16),
+                  k: int = 5, qa_path: str = QA_PATH, output_dir: str = "data/processed/benchmarks",
+                  embeddings_config: Optional[Dict] = None) -> List[Dict]:
+    texts, metadatas = load_corpus(corpus)
+    embeddings = build_embeddings(embeddings_config)
+    doc_vectors = normalize_rows(embed_texts(texts, embeddings))
+    query_set = build_query_set(qa_path)
+    query_vectors = normalize_rows(embed_texts([q["question"] for q in query_set], embeddings))
+    relevant = [q["relevant"] for q in query_set]
+    print(f"Корпус {corpus}: {len(texts)} фрагментов, {len(query_set)} размеченных вопросов")
+
+    results = []
+    for scale in scales:
+        extra = max(0, scale - len(texts))
+        vectors, all_metadatas = doc_vectors, list(metadatas)
+        if extra:
+            noise, noise_metadatas = synthetic_articles(doc_vectors, metadatas, extra)
+            vectors = np.vstack([doc_vectors, noise])
+            all_metadatas += noise_metadatas
+        # Синтетические статьи не относятся ни к одной статье ЖК РФ
+        doc_articles = [article_number(m) for m in metadatas] + [None] * extra
+
+        flat = build_index("Flat", {}, vectors)
+        _, exact_ids = flat.search(query_vectors, k)
+        variants = [("flat", flat, None)]
+
+        start = time.perf_counter()
+        hierarchical = HierarchicalIndex(vectors, all_metadatas)
+        build_seconds = time.perf_counter() - start
+        for top in top_articles:
+            hierarchical.top_articles = top
+            variants.append((f"hierarchical_top{top}", hierarchical, top))
+
+        for name, index, top in variants:
+            metrics = evaluate_index(index, query_vectors, relevant, doc_articles, k, exact_ids)
+            result = {
+                "corpus": corpus,
+                "num_vectors": len(vectors),
+                "index": name,
+                "top_articles": top,
+                # Число векторов, с которыми сравнивается один запрос
+                "vectors_scored": len(vectors) if top is None else
+                hierarchical.num_articles + hierarchical.last_candidates,
+                **metrics
+            }
+            if top is not None:
+                result.update(num_articles=hierarchical.num_articles, build_seconds=build_seconds)
+            results.append(result)
+            print(json.dumps(result, ensure_ascii=False))
+        del flat, hierarchical
+
+    os.makedirs(output_dir, exist_ok=True)
+    output_path = os.path.join(output_dir, f"hierarchical_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump({"k": k, "results": results}, f, ensure_ascii=False, indent=2)
+    print(f"Результаты сохранены в {output_path}")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Двухэтапный поиск против плоского")
+    parser.add_argument("--corpus", choices=["docx", "html"], default="docx")
+    parser.add_argument("--scales", type=int, nargs="+", default=[0, 100000])
+    parser.add_argument("--top-articles", type=int, nargs="+", default=[4, 8, 16])
+    parser.add_argument("--k", type=int, default=5)
+    args = parser.parse_args()
+
+    run_benchmark(args.corpus, args.scales, args.top_articles, args.k)
@@ -0,0 +1,211 @@
+"""
+Бенчмарк поиска: качество и скорость для разных типов индексов FAISS.
+
+Корпус строится из ЖК РФ (JKRF.docx или garant/1.html) и, при необходимости,
+масштабируется синтетическими векторами-помехами до 10k–5M фрагментов. Вопросы
+берутся из архива консультаций Q&A_JK.docx, релевантными считаются фрагменты
+статей ЖК РФ, на которые ссылается ответ юриста.
+
+Для каждой конфигурации индекса считаются recall@k и MRR (по статьям), recall
+относительно точного поиска, задержки p50/p95/p99, QPS, время построения и
+память. Результаты сохраняются в JSON для отслеживания регрессий.
+
+Пример:
+    python etl/benchmark_retrieval.py --corpus docx --scales 0 100000 1000000 \\
+        --indexes flat hnsw32 ivf1024 ivfpq1024
+"""
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+import argparse
+import json
+import os
+import re
+import time
+
+import numpy as np
+
+from consultations import QA_PATH, build_query_set
+from context_packer import article_number
+from embeddings import build_embeddings
+from tracing import rss_mb
+
+# Конфигурации индексов: фабричная строка FAISS и параметры поиска
+INDEX_CONFIGS = {
+    "flat": ("Flat", {}),
+    "hnsw32": ("HNSW32,Flat", {"efSearch": 64}),
+    "hnsw32_ef128": ("HNSW32,Flat", {"efSearch": 128}),
+    "ivf1024": ("IVF1024,Flat", {"nprobe": 16}),
+    "ivf4096": ("IVF4096,Flat", {"nprobe": 32}),
+    "ivfpq1024": ("IVF1024,PQ48", {"nprobe": 16}),
+}
+
+
+def load_corpus(corpus: str) -> Tuple[List[str], List[Dict]]:
+    """Фрагменты ЖК РФ и их метаданные"""
+    if corpus == "docx":
+        from get_chunks_from_docx import process_legal_docx
+
+        chunks = process_legal_docx('data/raw/housing_code/JKRF.docx')
+        return [chunk.text for chunk in chunks], [chunk.metadata for chunk in chunks]
+    elif corpus == "html":
+        from get_chunks_from_html import load_and_chunk_html_documents
+
+        return load_and_chunk_html_documents('data/raw/housing_code/garant/1.html')
+    raise ValueError(f"Неизвестный корпус: {corpus}")
+
+
+def embed_texts(texts: List[str], embeddings=None) -> np.ndarray:
+    embeddings = embeddings or build_embeddings()
+    return np.asarray(embeddings.embed_documents(texts), dtype="float32")
+
+
+def synthetic_vectors(base: np.ndarray, count: int, noise: float = 0.35,
+                      seed: int = 0, batch_size: int = 100000) -> np.ndarray:
+    """
+    Векторы-помехи для масштабирования корпуса: смеси пар реальных векторов
+    с гауссовым шумом, нормированные на единичную длину. По распределению
+    они близки к настоящим фрагментам и конкурируют с ними в выдаче.
+    """
+    rng = np.random.default_rng(seed)
+    out = np.empty((count, base.shape[1]), dtype="float32")
+    for start in range(0, count, batch_size):
+        n = min(batch_size, count - start)
+        a = base[rng.integers(0, len(base), n)]
+        b = base[rng.integers(0, len(base), n)]
+        w = rng.random((n, 1), dtype="float32")
+        batch = w * a + (1 - w) * b + noise * rng.standard_normal((n, base.shape[1]), dtype="float32") / np.sqrt(base.shape[1])
+        batch /= np.linalg.norm(batch, axis=1, keepdims=True)
+        out[start:start + n] = batch
+    return out
+
+
+def build_index(factory: str, params: Dict, vectors: np.ndarray):
+    import faiss
+
+    index = faiss.index_factory(vectors.shape[1], factory, faiss.METRIC_INNER_PRODUCT)
+    if not index.is_trained:
+        # Для обучения кластеров достаточно подвыборки
+        rng = np.random.default_rng(0)
+        sample = vectors[rng.choice(len(vectors), min(len(vectors), 100000), replace=False)]
+        index.train(sample)
+    index.add(vectors)
+    if params:
+        faiss.ParameterSpace().set_index_parameters(index, ",".join(f"{k}={v}" for k, v in params.items()))
+    return index
+
+
+def percentile(values: List[float], q: float) -> float:
+    return float(np.percentile(values, q)) if values else 0.0
+
+
+def evaluate_index(index, queries: np.ndarray, relevant: List[List[str]], doc_articles: List[Optional[str]],
+                   k: int, exact_ids: Optional[np.ndarray] = None) -> Dict[str, float]:
+    # Задержка одиночных запросов, как в диалоге
+    latencies, ids = [], []
+    for vector in queries:
+        start = time.perf_counter()
+        _, found = index.search(vector[None, :], k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        ids.append(found[0])
+    ids = np.stack(ids)
+
+    # Пропускная способность пакетного поиска
+    start = time.perf_counter()
+    index.search(queries, k)
+    qps = len(queries) / max(time.perf_counter() - start, 1e-9)
+
+    hits, reciprocal_ranks, recalls = [], [], []
+    for row, rel in zip(ids, relevant):
+        articles = [doc_articles[i] if 0 <= i < len(doc_articles) else None for i in row]
+        found = [a for a in rel if a in articles]
+        recalls.append(len(found) / len(rel))
+        hits.append(1.0 if found else 0.0)
+        rank = next((r for r, a in enumerate(articles, 1) if a in rel), None)
+        reciprocal_ranks.append(1.0 / rank if rank else 0.0)
+
+    result = {
+        f"recall@{k}": float(np.mean(recalls)),
+        f"hit_rate@{k}": float(np.mean(hits)),
+        "mrr": float(np.mean(reciprocal_ranks)),
+        "latency_p50_ms": percentile(latencies, 50),
+        "latency_p95_ms": percentile(latencies, 95),
+        "latency_p99_ms": percentile(latencies, 99),
+        "qps_batch": qps,
+    }
+    if exact_ids is not None:
+        overlap = [len(set(a) & set(b)) / k for a, b in zip(ids, exact_ids)]
+        result[f"recall_vs_exact@{k}"] = float(np.mean(overlap))
+    return result
+
+
+def run_benchmark(corpus: str = "docx", scales: List[int] = (0,), indexes: List[str] = ("flat",),
+                  k: int = 5, qa_path: str = QA_PATH, output_dir: str = "data/processed/benchmarks",
+                  embeddings_config: Optional[Dict] = None) -> List[Dict]:
+    import faiss
+
+    texts, metadatas = load_corpus(corpus)
+    embeddings = build_embeddings(embeddings_config)
+    doc_vectors = embed_texts(texts, embeddings)
+    query_set = build_query_set(qa_path)
+    query_vectors = embed_texts([q["question"] for q in query_set], embeddings)
+    relevant = [q["relevant"] for q in query_set]
+    print(f"Корпус {corpus}: {len(texts)} фрагментов, {len(query_set)} размеченных вопросов")
+
+    results = []
+    for scale in scales:
+        extra = max(0, scale - len(texts))
+        vectors = doc_vectors if not extra else np.vstack([doc_vectors, synthetic_vectors(doc_vectors, extra)])
+        # Синтетические векторы не относятся ни к одной статье
+        doc_articles = [article_number(m) for m in metadatas] + [None] * extra
+
+        exact_ids = None
+        # Точный поиск идет первым: он дает эталон для recall остальных индексов
+        for name in sorted(indexes, key=lambda n: n != "flat"):
+            factory, params = INDEX_CONFIGS[name]
+            nlist = re.match(r'IVF(\d+)', factory)
+            if nlist and len(vectors) < 39 * int(nlist.group(1)):
+                print(f"Пропуск {name}: слишком мало векторов для обучения {factory}")
+                continue
+            rss_before = rss_mb()
+            start = time.perf_counter()
+            index = build_index(factory, params, vectors)
+            build_seconds = time.perf_counter() - start
+
+            metrics = evaluate_index(index, query_vectors, relevant, doc_articles, k, exact_ids)
+            if factory == "Flat" and exact_ids is None:
+                _, exact_ids = index.search(query_vectors, k)
+                metrics[f"recall_vs_exact@{k}"] = 1.0
+
+            result = {
+                "corpus": corpus,
+                "num_vectors": len(vectors),
+                "index": name,
+                "factory": factory,
+                "params": params,
+                "build_seconds": build_seconds,
+                "index_bytes": int(faiss.serialize_index(index).size),
+                "rss_delta_mb": rss_mb() - rss_before,
+                **metrics
+            }
+            results.append(result)
+            print(json.dumps(result, ensure_ascii=False))
+            del index
+
+    os.makedirs(output_dir, exist_ok=True)
+    output_path = os.path.join(output_dir, f"retrieval_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump({"k": k, "results": results}, f, ensure_ascii=False, indent=2)
+    print(f"Результаты сохранены в {output_path}")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Бенчмарк поиска по корпусу ЖК РФ")
+    parser.add_argument("--corpus", choices=["docx", "html"], default="docx")
+    parser.add_argument("--scales", type=int, nargs="+", default=[0, 10000, 100000],
+                        help="размеры корпуса с синтетическими помехами (0 — только реальные фрагменты)")
+    parser.add_argument("--indexes", nargs="+", default=["flat", "hnsw32", "ivf1024"], choices=list(INDEX_CONFIGS))
+    parser.add_argument("--k", type=int, default=5)
+    args = parser.parse_args()
+
+    run_benchmark(args.corpus, args.scales, args.indexes, args.k)
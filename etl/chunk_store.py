@@ -0,0 +1,247 @@
+"""
+Компактное хранение фрагментов в памяти.
+
+LegalChunk и списки метаданных из чанкеров держат на каждый фрагмент свой
+словарь с одними и теми же полями документа (source, document_type,
+jurisdiction, file_name, processing_date) и свою строку текста. ChunkStore
+хранит:
+    - тексты всех фрагментов в одном буфере UTF-8 со смещениями;
+    - поля документа — один раз на документ, фрагмент ссылается на них по номеру;
+    - остальные метаданные (номер статьи, пункт, превью пункта) — интернированными
+      наборами: фрагменты одного пункта ссылаются на один набор;
+    - раздел, главу и статью — номерами в общей таблице строк;
+    - позицию фрагмента в документе (chunk_index) — числом в массиве, чтобы она
+      не делала каждый набор метаданных уникальным;
+    - chunk_id — 16 байтами md5 вместо 32-символьной строки.
+Фрагмент (CompactChunk) — легкое представление с __slots__ поверх хранилища с
+теми же атрибутами, что у LegalChunk; metadata собирается при обращении.
+
+Отчет о памяти до и после (в пересчете на миллион фрагментов):
+    python etl/chunk_store.py report --corpus docx
+"""
+from array import array
+from typing import Dict, Iterable, Iterator, List, Optional
+import argparse
+import json
+import sys
+
+DOCUMENT_FIELDS = ("source", "document_type", "jurisdiction", "file_name", "processing_date")
+POSITION_FIELD = "chunk_index"
+
+
+class InternTable:
+    """Уникальные значения и их номера"""
+
+    def __init__(self):
+        self.values: List = []
+        self._ids: Dict = {}
+
+    def add(self, value) -> int:
+        i = self._ids.get(value)
+        if i is None:
+            i = self._ids[value] = len(self.values)
+            self.values.append(value)
+        return i
+
+    def __getitem__(self, i: int):
+        return self.values[i]
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+
+def freeze(value):
+    """Значение как ключ интернирования: словари и списки — кортежи с типом первым элементом.
+
+    Имена полей — общие строки интерпретатора.
+    """
+    if isinstance(value, dict):
+        return (dict,) + tuple((sys.intern(key) if isinstance(key, str) else key, freeze(item))
+                               for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return (list if isinstance(value, list) else tuple,) + tuple(freeze(item) for item in value)
+    return value
+
+
+def thaw(value):
+    """Обратное к freeze: каждый вызов дает новые словари и списки"""
+    if isinstance(value, tuple):
+        kind, items = value[0], value[1:]
+        if kind is dict:
+            return {key: thaw(item) for key, item in items}
+        return kind(thaw(item) for item in items)
+    return value
+
+
+class CompactChunk:
+    __slots__ = ("_store", "_i")
+
+    def __init__(self, store: "ChunkStore", i: int):
+        self._store = store
+        self._i = i
+
+    @property
+    def text(self) -> str:
+        return self._store.text(self._i)
+
+    @property
+    def section(self) -> str:
+        return self._store.strings[self._store.sections[self._i]]
+
+    @property
+    def chapter(self) -> str:
+        return self._store.strings[self._store.chapters[self._i]]
+
+    @property
+    def article(self) -> str:
+        return self._store.strings[self._store.articles[self._i]]
+
+    @property
+    def metadata(self) -> Dict:
+        return self._store.metadata(self._i)
+
+    @property
+    def chunk_id(self) -> Optional[str]:
+        return self._store.chunk_id(self._i)
+
+    def __repr__(self) -> str:
+        return (f"CompactChunk(section={self.section!r}, chapter={self.chapter!r}, article={self.article!r}, "
+                f"text={self.text[:60]!r}, metadata={self.metadata!r}, chunk_id={self.chunk_id!r})")
+
+
+class ChunkStore:
+    def __init__(self):
+        self.buffer = bytearray()
+        self.offsets = array("Q", [0])
+        self.documents = InternTable()
+        self.extras = InternTable()
+        self.strings = InternTable()
+        self.strings.add("")
+        self.doc_ids = array("I")
+        self.extra_ids = array("I")
+        self.sections = array("I")
+        self.chapters = array("I")
+        self.articles = array("I")
+        self.positions = array("q")
+        self.chunk_ids = bytearray()
+
+    def add(self, text: str, metadata: Dict, section: str = "", chapter: str = "", article: str = "",
+            chunk_id: Optional[str] = None):
+        self.buffer += text.encode("utf-8")
+        self.offsets.append(len(self.buffer))
+        document = {k: metadata[k] for k in DOCUMENT_FIELDS if k in metadata}
+        extra = {k: v for k, v in metadata.items() if k not in DOCUMENT_FIELDS and k != POSITION_FIELD}
+        self.doc_ids.append(self.documents.add(freeze(document)))
+        self.extra_ids.append(self.extras.add(freeze(extra)))
+        self.sections.append(self.strings.add(section or ""))
+        self.chapters.append(self.strings.add(chapter or ""))
+        self.articles.append(self.strings.add(article or ""))
+        self.positions.append(metadata.get(POSITION_FIELD, -1))
+        self.chunk_ids += bytes.fromhex(chunk_id) if chunk_id else bytes(16)
+
+    def add_chunk(self, chunk):
+        """Переносит LegalChunk в хранилище; сам объект после этого не нужен"""
+        self.add(chunk.text, chunk.metadata, chunk.section, chunk.chapter, chunk.article, chunk.chunk_id)
+
+    def extend(self, chunks: Iterable):
+        for chunk in chunks:
+            self.add_chunk(chunk)
+
+    @classmethod
+    def from_texts(cls, texts: Iterable[str], metadatas: Iterable[Dict]) -> "ChunkStore":
+        """Для результатов HTML-чанкера: раздел, глава и статья остаются в метаданных"""
+        store = cls()
+        for text, metadata in zip(texts, metadatas):
+            store.add(text, metadata)
+        return store
+
+    def text(self, i: int) -> str:
+        return self.buffer[self.offsets[i]:self.offsets[i + 1]].decode("utf-8")
+
+    def metadata(self, i: int) -> Dict:
+        metadata = thaw(self.documents[self.doc_ids[i]])
+        metadata.update(thaw(self.extras[self.extra_ids[i]]))
+        if self.positions[i] >= 0:
+            metadata[POSITION_FIELD] = self.positions[i]
+        return metadata
+
+    def chunk_id(self, i: int) -> Optional[str]:
+        digest = self.chunk_ids[16 * i:16 * (i + 1)]
+        return digest.hex() if any(digest) else None
+
+    def texts(self) -> List[str]:
+        return [self.text(i) for i in range(len(self))]
+
+    def metadatas(self) -> List[Dict]:
+        return [self.metadata(i) for i in range(len(self))]
+
+    def __len__(self) -> int:
+        return len(self.doc_ids)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [CompactChunk(self, j) for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return CompactChunk(self, i)
+
+    def __iter__(self) -> Iterator[CompactChunk]:
+        return (CompactChunk(self, i) for i in range(len(self)))
+
+
+def deep_size(obj, seen: Optional[set] = None) -> int:
+    """Размер объекта со всем, на что он ссылается; общие объекты считаются один раз"""
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_size(k, seen) + deep_size(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_size(item, seen) for item in obj)
+    elif hasattr(obj, "__dict__"):
+        size += deep_size(vars(obj), seen)
+    elif hasattr(obj, "__slots__"):
+        size += sum(deep_size(getattr(obj, name), seen) for name in obj.__slots__ if hasattr(obj, name))
+    return size
+
+
+def memory_report(original, store: ChunkStore) -> Dict:
+    """Память на фрагмент до (список LegalChunk или тексты с метаданными) и после, в пересчете на миллион"""
+    before = deep_size(original)
+    after = deep_size(store)
+    count = max(len(store), 1)
+    per_million = 1_000_000 / count / 2 ** 20
+    return {
+        "chunks": len(store),
+        "documents": len(store.documents),
+        "metadata_sets": len(store.extras),
+        "before_bytes_per_chunk": before / count,
+        "after_bytes_per_chunk": after / count,
+        "before_mb_per_million": before * per_million,
+        "after_mb_per_million": after * per_million,
+        "ratio": before / max(after, 1),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Компактное хранилище фрагментов")
+    parser.add_argument("command", choices=["report"])
+    parser.add_argument("--corpus", choices=["docx", "html"], default="docx")
+    args = parser.parse_args()
+
+    if args.corpus == "docx":
+        from get_chunks_from_docx import iter_legal_chunks
+
+        original = list(iter_legal_chunks('data/raw/housing_code/JKRF.docx'))
+        store = ChunkStore()
+        store.extend(original)
+    else:
+        from get_chunks_from_html import load_and_chunk_html_documents, load_html_chunk_store
+
+        original = load_and_chunk_html_documents('data/raw/housing_code/garant/1.html')
+        store = load_html_chunk_store('data/raw/housing_code/garant/1.html')
+    print(json.dumps(memory_report(original, store), ensure_ascii=False, indent=2))
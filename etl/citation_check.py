@@ -0,0 +1,316 @@
+"""
+Офлайн-проверка цитат в ответах консультанта.
+
+Ответы из сохраненных диалогов (dialog_*.txt и JSONL-сегменты транскриптов)
+разбираются (JSON из role-промпта или обычный текст), каждая ссылка `reference` проверяется на существование статьи в корпусе,
+а цитата `text` — на точное или нечеткое вхождение в фрагменты этой статьи.
+Для поиска используется инвертированный индекс словесных n-грамм: кандидаты
+находятся по спискам вхождений, точное совпадение проверяется только в них.
+
+Пример:
+    python etl/citation_check.py --corpus docx --workers 8
+"""
+from collections import Counter
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+import argparse
+import glob
+import itertools
+import json
+import multiprocessing
+import os
+import re
+import time
+
+from consultations import HOUSING_CODE_REFERENCE, cited_articles
+from context_packer import ARTICLE_NUMBER, article_number
+from transcript_sink import TRANSCRIPTS_DIR
+from transcripts import (NOT_FOUND_ANSWER, RESULTS_DIR, iter_segment_records, parse_answer_json,
+                         parse_dialog_file, segment_paths)
+
+REFERENCE_NUMBER = re.compile(r'(?:ст\.|стать[а-яё]*)\s*(\d+(?:\.\d+)*)', re.IGNORECASE)
+NON_WORD = re.compile(r'[^\w]+')
+HOUSING_CODE = re.compile(r'Жилищн[а-яё]+\s+кодекс|ЖК\s*РФ', re.IGNORECASE)
+# Упоминание другого акта: «ГК РФ», «НК РФ», «Федерального закона № 190-ФЗ», «Постановления № 354»
+OTHER_ACT = re.compile(r'\b[А-ЯЁ]{1,4}К\s*РФ\b|кодекс|закон|\bФЗ\b|постановлени|приказ|указ', re.IGNORECASE)
+
+
+def normalize(text: str) -> str:
+    return NON_WORD.sub(' ', text.lower().replace('ё', 'е')).strip()
+
+
+class NgramIndex:
+    """Инвертированный индекс словесных n-грамм по фрагментам корпуса"""
+
+    def __init__(self, texts: List[str], articles: List[Optional[str]], n: int = 3,
+                 max_postings: int = 10000):
+        self.n = n
+        self.max_postings = max_postings
+        self.texts = [normalize(text) for text in texts]
+        self.articles = articles
+        self.known_articles = {a for a in articles if a}
+        self.article_chunks: Dict[str, List[int]] = {}
+        for chunk_id, article in enumerate(articles):
+            if article:
+                self.article_chunks.setdefault(article, []).append(chunk_id)
+        self.postings: Dict[int, List[int]] = {}
+
+        for chunk_id, text in enumerate(self.texts):
+            for shingle in set(self._shingles(text.split())):
+                self.postings.setdefault(shingle, []).append(chunk_id)
+
+    def _shingles(self, words: List[str]) -> List[int]:
+        n = min(self.n, len(words))
+        return [hash(" ".join(words[i:i + n])) for i in range(len(words) - n + 1)]
+
+    def match(self, quote: str, article: Optional[str] = None, min_coverage: float = 0.0) -> Dict:
+        """
+        Лучший фрагмент для цитаты: точное вхождение и доля общих n-грамм.
+
+        Сначала ищется во фрагментах статьи article: текст, повторенный в другой статье,
+        не должен уводить цитату из той статьи, на которую ссылается ответ. Нечеткое
+        совпадение в статье принимается с долей не ниже min_coverage, иначе берется
+        лучшее по всему корпусу.
+        """
+        normalized = normalize(quote)
+        if normalized and len(normalized.split()) < self.n:
+            return self._match_short(normalized, article)
+        shingles = set(self._shingles(normalized.split())) if normalized else set()
+
+        counts: Counter = Counter()
+        total = 0
+        for shingle in shingles:
+            chunk_ids = self.postings.get(shingle)
+            # Слишком частые n-граммы ничего не говорят о происхождении цитаты
+            if chunk_ids is not None and len(chunk_ids) > self.max_postings:
+                continue
+            total += 1
+            if chunk_ids:
+                counts.update(chunk_ids)
+
+        if not counts:
+            return {"exact": False, "coverage": 0.0, "chunk": None, "article": None}
+
+        in_article = [(chunk_id, counts[chunk_id]) for chunk_id in self.article_chunks.get(article, ())
+                      if chunk_id in counts]
+        if in_article:
+            result = self._best(in_article, normalized, total)
+            if result["exact"] or result["coverage"] >= min_coverage:
+                return result
+        return self._best(counts.most_common(), normalized, total)
+
+    def _best(self, candidates: List, normalized: str, total: int) -> Dict:
+        """candidates — пары (фрагмент, число общих n-грамм)"""
+        best_chunk, best_count = max(candidates, key=lambda item: item[1])
+        # Точное вхождение возможно только во фрагментах, содержащих все n-граммы
+        exact_chunk = next(
+            (chunk_id for chunk_id, count in candidates
+             if count == total and normalized in self.texts[chunk_id]),
+            None
+        )
+        chunk = exact_chunk if exact_chunk is not None else best_chunk
+        return {
+            "exact": exact_chunk is not None,
+            "coverage": best_count / total if total else 0.0,
+            "chunk": chunk,
+            "article": self.articles[chunk]
+        }
+
+    def _match_short(self, normalized: str, article: Optional[str]) -> Dict:
+        """Цитата короче n слов не дает ни одной n-граммы индекса — ищется подстрокой"""
+        padded = f" {normalized} "
+        # Сначала фрагменты цитируемой статьи, затем весь корпус
+        for chunk_id in itertools.chain(self.article_chunks.get(article, ()), range(len(self.texts))):
+            if padded in f" {self.texts[chunk_id]} ":
+                return {"exact": True, "coverage": 1.0, "chunk": chunk_id, "article": self.articles[chunk_id]}
+        return {"exact": False, "coverage": 0.0, "chunk": None, "article": None}
+
+
+def is_housing_code_reference(reference: str) -> bool:
+    """Ссылка без названия акта считается ссылкой на ЖК РФ; ссылка на другой акт — нет"""
+    reference = reference or ""
+    return bool(HOUSING_CODE_REFERENCE.search(reference) or HOUSING_CODE.search(reference)
+                or not OTHER_ACT.search(reference))
+
+
+def reference_article(reference: str) -> Optional[str]:
+    """Номер статьи ЖК РФ из ссылки; для ссылок на другие акты — None"""
+    reference = reference or ""
+    if not is_housing_code_reference(reference):
+        return None
+    match = HOUSING_CODE_REFERENCE.search(reference) or REFERENCE_NUMBER.search(reference) \
+        or ARTICLE_NUMBER.search(reference)
+    return match.group(1) if match else None
+
+
+def check_source(index: NgramIndex, source: Dict, fuzzy_threshold: float) -> Dict:
+    reference = source.get("reference", "")
+    article = reference_article(reference)
+    result = {
+        "reference": source.get("reference"),
+        "article": article,
+        # Статьи другого кодекса нет в корпусе ЖК РФ — номер совпал бы со статьей ЖК случайно
+        "other_act": not is_housing_code_reference(reference),
+        "reference_known": article in index.known_articles
+    }
+
+    quote = source.get("text")
+    if quote:
+        match = index.match(quote, article, fuzzy_threshold)
+        quote_grounded = match["exact"] or match["coverage"] >= fuzzy_threshold
+        result.update({
+            "quote_exact": match["exact"],
+            "quote_coverage": round(match["coverage"], 3),
+            "quote_grounded": quote_grounded,
+            # Цитата должна быть из той статьи, на которую ссылается ответ
+            "quote_in_article": quote_grounded and (article is None or match["article"] == article)
+        })
+        result["grounded"] = result["reference_known"] and result["quote_in_article"]
+    else:
+        result["grounded"] = result["reference_known"]
+    return result
+
+
+def check_answer(index: NgramIndex, answer: str, fuzzy_threshold: float = 0.8) -> Dict:
+    if NOT_FOUND_ANSWER in answer and len(answer) < 200:
+        return {"status": "not_found", "sources": []}
+
+    data = parse_answer_json(answer)
+    if data is not None:
+        sources = [s for s in data.get("sources") or [] if isinstance(s, dict)]
+        checked = [check_source(index, s, fuzzy_threshold) for s in sources]
+        parsed = True
+    else:
+        # Ответ обычным текстом: проверяем только упомянутые статьи ЖК РФ
+        checked = [check_source(index, {"reference": f"ст. {a}"}, fuzzy_threshold)
+                   for a in cited_articles(answer)]
+        parsed = False
+
+    if not checked:
+        status = "no_sources"
+    elif all(s["grounded"] for s in checked):
+        status = "grounded"
+    else:
+        status = "ungrounded"
+    return {"status": status, "json": parsed, "sources": checked}
+
+
+# Индекс строится в родительском процессе до fork и разделяется воркерами
+_INDEX: Optional[NgramIndex] = None
+_FUZZY_THRESHOLD = 0.8
+
+
+def _check_file(path: str) -> List[Dict]:
+    if path.endswith(".jsonl"):
+        return _check_segment(path)
+
+    dialog = parse_dialog_file(path)
+    results = []
+    for turn_number, turn in enumerate(dialog["turns"], 1):
+        result = check_answer(_INDEX, turn["answer"], _FUZZY_THRESHOLD)
+        result.update({"session": dialog["session"], "turn": turn_number})
+        results.append(result)
+    return results
+
+
+def _check_segment(path: str) -> List[Dict]:
+    results = []
+    for record in iter_segment_records(path):
+        if record.get("event") != "turn":
+            continue
+        result = check_answer(_INDEX, record["answer"], _FUZZY_THRESHOLD)
+        result.update({"session": record["session"], "turn": record["turn"]})
+        results.append(result)
+    return results
+
+
+def summarize(results: Iterable[Dict]) -> Dict:
+    statuses: Counter = Counter()
+    sources: Counter = Counter()
+    answers = 0
+    parsed = 0
+    for result in results:
+        answers += 1
+        statuses[result["status"]] += 1
+        parsed += bool(result.get("json"))
+        for source in result["sources"]:
+            sources["total"] += 1
+            sources["grounded"] += source["grounded"]
+            sources["unknown_reference"] += not source["reference_known"]
+            sources["other_act"] += source.get("other_act", False)
+            sources["ungrounded_quote"] += source.get("quote_grounded") is False
+
+    answered = statuses["grounded"] + statuses["ungrounded"]
+    return {
+        "answers": answers,
+        "json_rate": parsed / answers if answers else 0.0,
+        "statuses": dict(statuses),
+        "grounded_rate": statuses["grounded"] / answered if answered else 0.0,
+        "ungrounded_rate": statuses["ungrounded"] / answered if answered else 0.0,
+        "not_found_rate": statuses["not_found"] / answers if answers else 0.0,
+        "sources": dict(sources),
+        "source_grounded_rate": sources["grounded"] / sources["total"] if sources["total"] else 0.0
+    }
+
+
+def run_check(paths: List[str], index: NgramIndex, workers: int = os.cpu_count() or 1,
+              fuzzy_threshold: float = 0.8, details_path: Optional[str] = None) -> Dict:
+    global _INDEX, _FUZZY_THRESHOLD
+    _INDEX, _FUZZY_THRESHOLD = index, fuzzy_threshold
+
+    start = time.perf_counter()
+    results: List[Dict] = []
+    if workers > 1 and len(paths) > workers:
+        with multiprocessing.get_context("fork").Pool(workers) as pool:
+            for file_results in pool.imap_unordered(_check_file, paths, chunksize=32):
+                results.extend(file_results)
+    else:
+        for path in paths:
+            results.extend(_check_file(path))
+    elapsed = time.perf_counter() - start
+
+    if details_path:
+        os.makedirs(os.path.dirname(details_path) or ".", exist_ok=True)
+        with open(details_path, "w", encoding="utf-8") as f:
+            for result in results:
+                f.write(json.dumps(result, ensure_ascii=False) + "\n")
+
+    report = summarize(results)
+    report.update({
+        "files": len(paths),
+        "seconds": elapsed,
+        "answers_per_minute": report["answers"] / elapsed * 60 if elapsed > 0 else 0.0
+    })
+    return report
+
+
+def build_index(corpus: str = "docx", n: int = 3) -> NgramIndex:
+    from benchmark_retrieval import load_corpus
+
+    texts, metadatas = load_corpus(corpus)
+    return NgramIndex(texts, [article_number(m) for m in metadatas], n=n)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Проверка цитат в сохраненных диалогах")
+    parser.add_argument("--corpus", choices=["docx", "html"], default="docx")
+    parser.add_argument("--results-dir", default=RESULTS_DIR)
+    parser.add_argument("--transcripts-dir", default=TRANSCRIPTS_DIR)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--fuzzy-threshold", type=float, default=0.8)
+    parser.add_argument("--output-dir", default="data/processed/quality")
+    args = parser.parse_args()
+
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    paths = sorted(glob.glob(os.path.join(args.results_dir, "dialog_*.txt"))) + segment_paths(args.transcripts_dir)
+    report = run_check(
+        paths,
+        build_index(args.corpus),
+        workers=args.workers,
+        fuzzy_threshold=args.fuzzy_threshold,
+        details_path=os.path.join(args.output_dir, f"citations_{timestamp}.jsonl")
+    )
+
+    with open(os.path.join(args.output_dir, f"citation_report_{timestamp}.json"), "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
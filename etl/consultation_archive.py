@@ -0,0 +1,128 @@
+"""
+Быстрый путь через архив консультаций юристов.
+
+Вопросы архива (Q&A_JK.docx) индексируются эмбеддингами той же модели, что и
+вопросы клиентов. Для нового вопроса ищется самый похожий вопрос архива:
+    similarity >= answer_threshold — возвращается проверенный ответ юриста без LLM;
+    similarity >= ground_threshold — ответ юриста добавляется в контекст LLM;
+    иначе — обычный путь через поиск по ЖК РФ.
+
+Индекс хранится в data/processed/consultation_archive/: vectors.npy (нормированные
+векторы вопросов, читаются через mmap) и pairs.jsonl.
+
+Секция `archive` конфига:
+    archive:
+      directory: "data/processed/consultation_archive"
+      answer_threshold: 0.92
+      ground_threshold: 0.8
+
+Построение индекса:
+    python etl/consultation_archive.py build
+"""
+from typing import Dict, List, Optional
+import argparse
+import json
+import os
+
+import numpy as np
+
+from consultations import QA_PATH, cited_articles, iter_qa_pairs
+
+ARCHIVE_DIR = 'data/processed/consultation_archive/'
+
+
+def build_archive(embeddings, qa_path: str = QA_PATH, directory: str = ARCHIVE_DIR,
+                  batch_size: int = 256) -> int:
+    """Эмбеддинги вопросов архива; пары кодируются пакетами по мере разбора DOCX"""
+    os.makedirs(directory, exist_ok=True)
+    batches, batch = [], []
+
+    with open(os.path.join(directory, "pairs.jsonl"), "w", encoding="utf-8") as f:
+        def flush():
+            batches.append(np.asarray(embeddings.embed_documents([p["question"] for p in batch]), dtype="float32"))
+            f.writelines(json.dumps(p, ensure_ascii=False) + "\n" for p in batch)
+            batch.clear()
+
+        for pair in iter_qa_pairs(qa_path):
+            batch.append(pair)
+            if len(batch) >= batch_size:
+                flush()
+        if batch:
+            flush()
+
+    vectors = np.vstack(batches) if batches else np.empty((0, 0), dtype="float32")
+    if len(vectors):
+        vectors /= np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None)
+    np.save(os.path.join(directory, "vectors.npy"), vectors)
+    return len(vectors)
+
+
+def archive_sources(pair: Dict, document_title: str = "ЖК РФ") -> List[Dict]:
+    """Источники в формате ContextPacker — статьи, на которые ссылается ответ юриста"""
+    return [{"id": i, "reference": f"{document_title}, ст. {article}", "chunk_ids": []}
+            for i, article in enumerate(cited_articles(pair["answer"]), 1)]
+
+
+def archive_answer_json(pair: Dict, similarity: float, sources: List[Dict]) -> str:
+    """Ответ юриста в формате ответа консультанта (JSON из role-промпта)"""
+    return json.dumps({
+        "answer": pair["answer"],
+        "sources": [{"reference": source["reference"]} for source in sources],
+        "metadata": {"archive_question": pair["question"], "similarity": round(similarity, 3)}
+    }, ensure_ascii=False)
+
+
+class ConsultationArchive:
+    def __init__(self, directory: str = ARCHIVE_DIR, answer_threshold: float = 0.92,
+                 ground_threshold: float = 0.8):
+        self.answer_threshold = answer_threshold
+        self.ground_threshold = ground_threshold
+        self.vectors = np.load(os.path.join(directory, "vectors.npy"), mmap_mode="r")
+        with open(os.path.join(directory, "pairs.jsonl"), "r", encoding="utf-8") as f:
+            self.pairs = [json.loads(line) for line in f]
+
+    def match(self, vector: List[float]) -> Optional[Dict]:
+        """Самый похожий вопрос архива и решение: answer, ground или None"""
+        if not len(self.pairs):
+            return None
+        query = np.asarray(vector, dtype="float32")
+        query = query / max(float(np.linalg.norm(query)), 1e-12)
+        scores = self.vectors @ query
+        best = int(np.argmax(scores))
+        similarity = float(scores[best])
+
+        if similarity >= self.answer_threshold:
+            route = "answer"
+        elif similarity >= self.ground_threshold:
+            route = "ground"
+        else:
+            return None
+        return {"route": route, "similarity": similarity, "pair": self.pairs[best]}
+
+
+if __name__ == "__main__":
+    from embeddings import build_embeddings
+
+    parser = argparse.ArgumentParser(description="Индекс архива консультаций")
+    parser.add_argument("command", choices=["build", "query"])
+    parser.add_argument("question", nargs="?")
+    parser.add_argument("--config", default="configs/llm_config.yaml")
+    parser.add_argument("--qa-path", default=QA_PATH)
+    parser.add_argument("--directory", default=ARCHIVE_DIR)
+    args = parser.parse_args()
+
+    config = {}
+    if os.path.exists(args.config):
+        import yaml
+
+        with open(args.config, "r") as file:
+            config = yaml.safe_load(file) or {}
+    # Вопросы архива кодируются той же моделью, что и вопросы клиентов
+    embeddings = build_embeddings(config.get("embeddings"))
+
+    if args.command == "build":
+        print(f"Проиндексировано вопросов архива: {build_archive(embeddings, args.qa_path, args.directory)}")
+    else:
+        archive = ConsultationArchive(args.directory, **{k: v for k, v in (config.get("archive") or {}).items()
+                                                        if k != "directory"})
+        print(json.dumps(archive.match(embeddings.embed_query(args.question)), ensure_ascii=False, indent=2))
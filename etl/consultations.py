@@ -0,0 +1,98 @@
+"""
+Архив консультаций юристов (data/raw/consultations/Q&A_JK.docx).
+
+Документ содержит таблицу из двух колонок «Вопрос» / «Ответ». Ответы ссылаются
+на статьи ЖК РФ («В соответствии со ст. 71 Жилищного кодекса РФ ...»), поэтому
+из них извлекается разметка релевантных статей для оценки поиска.
+
+Таблица читается потоково прямо из word/document.xml: строки разбираются по мере
+чтения и сразу освобождаются, так что память не растет с размером архива.
+"""
+from typing import Dict, Iterator, List
+import re
+import xml.etree.ElementTree as ET
+import zipfile
+
+QA_PATH = 'data/raw/consultations/Q&A_JK.docx'
+W = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+
+# «ст. 71 Жилищного кодекса РФ», «ч. 4 ст. 31 ЖК РФ», «статьей 44.1 Жилищного кодекса»
+HOUSING_CODE_REFERENCE = re.compile(
+    r'(?:ст\.|стать[а-яё]*)\s*(\d+(?:\.\d+)*)[^.;]{0,40}?(?:Жилищн[а-яё]+\s+кодекс|ЖК\s*РФ)',
+    re.IGNORECASE
+)
+
+
+def clean_cell(text: str) -> str:
+    """Убирает служебную точку в начале ячейки и лишние пробелы"""
+    return ' '.join(text.split()).lstrip('. ')
+
+
+def _paragraph_text(paragraph: ET.Element) -> str:
+    parts = []
+    for node in paragraph.iter():
+        if node.tag == W + 't':
+            parts.append(node.text or '')
+        elif node.tag in (W + 'tab', W + 'br', W + 'cr'):
+            parts.append(' ')
+    return ''.join(parts)
+
+
+def iter_table_rows(file_path: str = QA_PATH) -> Iterator[List[str]]:
+    """Строки таблиц верхнего уровня DOCX как списки текстов ячеек"""
+    with zipfile.ZipFile(file_path) as archive, archive.open('word/document.xml') as xml:
+        depth = 0
+        cells: List[str] = []
+        for event, elem in ET.iterparse(xml, events=('start', 'end')):
+            if event == 'start':
+                if elem.tag == W + 'tbl':
+                    depth += 1
+                elif elem.tag == W + 'tr' and depth == 1:
+                    cells = []
+                continue
+
+            if elem.tag == W + 'tbl':
+                depth -= 1
+            elif depth == 1 and elem.tag == W + 'tc':
+                cells.append('\n'.join(_paragraph_text(p) for p in elem.iter(W + 'p')))
+            elif depth == 1 and elem.tag == W + 'tr':
+                yield cells
+                elem.clear()
+            elif depth == 0 and elem.tag == W + 'p':
+                elem.clear()
+
+
+def iter_qa_pairs(file_path: str = QA_PATH) -> Iterator[Dict[str, str]]:
+    """Пары вопрос/ответ из таблицы DOCX по мере чтения документа"""
+    for cells in iter_table_rows(file_path):
+        if len(cells) < 2:
+            continue
+        question, answer = clean_cell(cells[0]), clean_cell(cells[1])
+        # Пропускаем строку заголовка
+        if not question or not answer or (question == 'Вопрос' and answer == 'Ответ'):
+            continue
+        yield {'question': question, 'answer': answer}
+
+
+def load_qa_pairs(file_path: str = QA_PATH) -> List[Dict[str, str]]:
+    """Читает пары вопрос/ответ из таблицы DOCX"""
+    return list(iter_qa_pairs(file_path))
+
+
+def cited_articles(answer: str) -> List[str]:
+    """Номера статей ЖК РФ, на которые ссылается ответ юриста"""
+    articles = []
+    for number in HOUSING_CODE_REFERENCE.findall(answer):
+        if number not in articles:
+            articles.append(number)
+    return articles
+
+
+def build_query_set(file_path: str = QA_PATH) -> List[Dict]:
+    """Вопросы архива с разметкой релевантных статей; вопросы без ссылок на ЖК РФ пропускаются"""
+    queries = []
+    for pair in load_qa_pairs(file_path):
+        relevant = cited_articles(pair['answer'])
+        if relevant:
+            queries.append({'question': pair['question'], 'relevant': relevant})
+    return queries
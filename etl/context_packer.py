@@ -0,0 +1,111 @@
+"""
+Сборка контекста для LLM в пределах бюджета токенов.
+
+Найденные фрагменты группируются по статье, соседние фрагменты одной статьи
+склеиваются без дублирования перекрытия, которое дают нарезчики чанков.
+Каждый блок получает короткий заголовок-ссылку ([1] ЖК РФ, ст. 26), а список
+источников передается модели для поля `sources` ответа.
+"""
+from typing import Callable, Dict, List, Optional, Tuple
+import re
+
+ARTICLE_NUMBER = re.compile(r'Статья\s*(\d+(?:\.\d+)*)', re.IGNORECASE)
+
+
+def approx_tokens(text: str) -> int:
+    """Грубая оценка числа токенов для русского текста (≈3 символа на токен)"""
+    return len(text) // 3 + 1
+
+
+def merge_overlapping(first: str, second: str, min_overlap: int = 20) -> str:
+    """Склеивает два соседних фрагмента, убирая общий участок на стыке"""
+    if second in first:
+        return first
+    if first in second:
+        return second
+
+    # Ищем самый длинный суффикс first, совпадающий с началом second
+    probe = second[:min_overlap]
+    window_start = max(0, len(first) - len(second))
+    pos = first.find(probe, window_start)
+    while pos != -1:
+        if second.startswith(first[pos:]):
+            return first + second[len(first) - pos:]
+        pos = first.find(probe, pos + 1)
+
+    return first + "\n" + second
+
+
+def article_number(metadata: Dict) -> Optional[str]:
+    """Номер статьи фрагмента: из metadata['article_number'] или из заголовка «Статья 26. ...»"""
+    if metadata.get("article_number"):
+        return str(metadata["article_number"])
+    match = ARTICLE_NUMBER.search(metadata.get("article") or "")
+    return match.group(1) if match else None
+
+
+def article_reference(metadata: Dict, document_title: str) -> str:
+    """Компактная ссылка вида «ЖК РФ, ст. 26»"""
+    article = metadata.get("article", "")
+    number = article_number(metadata)
+    if number:
+        return f"{document_title}, ст. {number}"
+    if article:
+        return f"{document_title}, {article[:60]}"
+    return document_title
+
+
+class ContextPacker:
+    def __init__(self, max_tokens: int = 1000, document_title: str = "ЖК РФ",
+                 min_overlap: int = 20, token_counter: Optional[Callable[[str], int]] = None):
+        self.max_tokens = max_tokens
+        self.document_title = document_title
+        self.min_overlap = min_overlap
+        self.count_tokens = token_counter or approx_tokens
+
+    def group_by_article(self, docs: List) -> List[Tuple[Dict, List]]:
+        """Группирует фрагменты по статье, сохраняя порядок релевантности групп"""
+        groups: Dict[Tuple, Tuple[Dict, List]] = {}
+        for rank, doc in enumerate(docs):
+            metadata = doc.metadata or {}
+            # Фрагменты без статьи не склеиваются между собой
+            key = (metadata.get("source"), metadata.get("article")) if metadata.get("article") else ("rank", rank)
+            if key not in groups:
+                groups[key] = (metadata, [])
+            groups[key][1].append((metadata.get("chunk_index", rank), doc))
+        return list(groups.values())
+
+    def pack(self, docs: List) -> Tuple[str, List[Dict]]:
+        """Возвращает текст контекста и список источников"""
+        blocks, sources = [], []
+        used = 0
+
+        for metadata, items in self.group_by_article(docs):
+            # Соседние фрагменты статьи склеиваются в порядке следования в документе
+            items.sort(key=lambda item: item[0])
+            text = items[0][1].page_content
+            for _, doc in items[1:]:
+                text = merge_overlapping(text, doc.page_content, self.min_overlap)
+
+            reference = article_reference(metadata, self.document_title)
+            header = f"[{len(sources) + 1}] {reference}"
+            cost = self.count_tokens(header) + self.count_tokens(text)
+
+            if used + cost > self.max_tokens:
+                if blocks:
+                    # Пробуем следующие, более короткие статьи
+                    continue
+                # Самый релевантный блок обрезается, но не выбрасывается
+                budget_chars = max(0, (self.max_tokens - self.count_tokens(header)) * 3)
+                text = text[:budget_chars]
+                cost = self.max_tokens
+
+            blocks.append(f"{header}\n{text.strip()}")
+            sources.append({
+                "id": len(sources) + 1,
+                "reference": reference,
+                "chunk_ids": [doc.metadata.get("chunk_id") for _, doc in items if doc.metadata.get("chunk_id")]
+            })
+            used += cost
+
+        return "\n\n".join(blocks), sources
@@ -0,0 +1,211 @@
+"""
+Хранилище полных текстов актов RusLawOD с произвольным доступом.
+
+Документы пишутся в компактные JSONL-шарды (одна строка — один акт, без
+отступов). Рядом хранится постоянный индекс:
+    locations.npy   номер записи → (шард, смещение в байтах, длина);
+    keys.npy        отсортированные pravogovruNd и номера записей — поиск
+                    за O(log n) через searchsorted, массив читается через mmap;
+    dates.npy       отсортированные docdateIPS для диапазонов дат;
+    issuers.json    органы-издатели и CSR-списки их записей (issuer_*.npy).
+Документ читается одним os.pread по смещению, без загрузки шарда целиком.
+
+Построение из Parquet-файлов RusLawOD:
+    python etl/document_store.py build data/raw/RusLawOD/*.parquet
+
+Секция `documents` конфига подключает хранилище к LegalConsult
+(полный текст акта для отображения источника):
+    documents:
+      directory: "data/processed/documents"
+"""
+from typing import Dict, Iterable, Iterator, List, Optional
+import argparse
+import json
+import os
+
+import numpy as np
+
+from metadata_filter import metadata_value, parse_date
+
+DOCUMENTS_DIR = 'data/processed/documents/'
+KEY_FIELD = 'metadata.identification.pravogovruNd'
+DATE_FIELD = 'metadata.identification.docdateIPS'
+ISSUER_FIELD = 'metadata.identification.issuedByIPS'
+LOCATION_DTYPE = np.dtype([("shard", "<u2"), ("offset", "<u8"), ("length", "<u4")])
+
+
+def build_store(documents: Iterable[Dict], directory: str = DOCUMENTS_DIR, shard_mb: int = 256) -> Dict:
+    """Записывает документы в JSONL-шарды и строит индексы по ключу, дате и издателю"""
+    os.makedirs(directory, exist_ok=True)
+    shards: List[str] = []
+    locations, keys, dates, issuers = [], [], [], []
+    f, offset = None, 0
+
+    try:
+        for document in documents:
+            # Даты из Parquet приходят объектами datetime
+            line = (json.dumps(document, ensure_ascii=False, default=str) + "\n").encode("utf-8")
+            if f is None or offset + len(line) > shard_mb * 2 ** 20:
+                if f is not None:
+                    f.close()
+                shards.append(f"docs_{len(shards):04d}.jsonl")
+                f, offset = open(os.path.join(directory, shards[-1]), "wb"), 0
+            f.write(line)
+            locations.append((len(shards) - 1, offset, len(line)))
+            offset += len(line)
+
+            key = metadata_value(document, KEY_FIELD) or document.get("id")
+            keys.append(str(key) if key is not None else "")
+            dates.append(parse_date(metadata_value(document, DATE_FIELD)))
+            issuers.append(str(metadata_value(document, ISSUER_FIELD) or ""))
+    finally:
+        if f is not None:
+            f.close()
+
+    np.save(os.path.join(directory, "locations.npy"), np.array(locations, dtype=LOCATION_DTYPE))
+
+    # Повторный ключ (акт выгружен дважды) — действует последняя запись
+    key_array = np.array(keys, dtype=f"U{max(map(len, keys), default=1) or 1}")
+    key_order = np.lexsort((np.arange(len(keys)), key_array))
+    np.save(os.path.join(directory, "keys.npy"), key_array[key_order])
+    np.save(os.path.join(directory, "key_records.npy"), key_order.astype(np.int64))
+
+    date_array = np.array(dates, dtype="datetime64[D]")
+    known = np.flatnonzero(~np.isnat(date_array))
+    date_order = known[np.argsort(date_array[known], kind="stable")]
+    np.save(os.path.join(directory, "dates.npy"), date_array[date_order])
+    np.save(os.path.join(directory, "date_records.npy"), date_order.astype(np.int64))
+
+    names = sorted(set(issuers) - {""})
+    ids = {name: i for i, name in enumerate(names)}
+    labels = np.array([ids.get(name, -1) for name in issuers], dtype=np.int64)
+    labeled = np.flatnonzero(labels >= 0)
+    issuer_records = labeled[np.argsort(labels[labeled], kind="stable")]
+    issuer_offsets = np.zeros(len(names) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(labels[labeled], minlength=len(names)), out=issuer_offsets[1:])
+    np.save(os.path.join(directory, "issuer_records.npy"), issuer_records)
+    np.save(os.path.join(directory, "issuer_offsets.npy"), issuer_offsets)
+    with open(os.path.join(directory, "issuers.json"), "w", encoding="utf-8") as f:
+        json.dump(names, f, ensure_ascii=False)
+
+    manifest = {"num_documents": len(locations), "shards": shards, "key_field": KEY_FIELD}
+    with open(os.path.join(directory, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    return manifest
+
+
+def iter_parquet_documents(paths: Iterable[str], batch_size: int = 1000) -> Iterator[Dict]:
+    """Документы RusLawOD в формате data_loader.row_to_json; Parquet читается пакетами"""
+    import pyarrow.parquet as pq
+
+    from data_loader import row_to_json
+
+    for path in paths:
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=batch_size):
+            for row in batch.to_pylist():
+                document = row_to_json(row)
+                document["id"] = str(row.get("pravogovruNd"))
+                yield document
+
+
+class DocumentStore:
+    def __init__(self, directory: str = DOCUMENTS_DIR):
+        self.directory = directory
+        with open(os.path.join(directory, "manifest.json"), "r", encoding="utf-8") as f:
+            self.manifest = json.load(f)
+        self.locations = self._load("locations.npy")
+        self.keys = self._load("keys.npy")
+        self.key_records = self._load("key_records.npy")
+        self.dates = self._load("dates.npy")
+        self.date_records = self._load("date_records.npy")
+        self.issuer_offsets = self._load("issuer_offsets.npy")
+        self.issuer_records = self._load("issuer_records.npy")
+        with open(os.path.join(directory, "issuers.json"), "r", encoding="utf-8") as f:
+            self.issuers = {name: i for i, name in enumerate(json.load(f))}
+        self._fds: Dict[int, int] = {}
+
+    def _load(self, name: str) -> np.ndarray:
+        return np.load(os.path.join(self.directory, name), mmap_mode="r")
+
+    def __len__(self) -> int:
+        return len(self.locations)
+
+    def _fd(self, shard: int) -> int:
+        fd = self._fds.get(shard)
+        if fd is None:
+            fd = self._fds[shard] = os.open(os.path.join(self.directory, self.manifest["shards"][shard]),
+                                            os.O_RDONLY)
+        return fd
+
+    def read(self, record: int) -> Dict:
+        shard, offset, length = self.locations[record]
+        # pread не сдвигает позицию файла — чтение безопасно из нескольких потоков
+        return json.loads(os.pread(self._fd(int(shard)), int(length), int(offset)))
+
+    def read_many(self, records: Iterable[int]) -> List[Dict]:
+        """Документы в порядке records; чтение идет в порядке расположения на диске"""
+        records = list(records)
+        order = sorted(range(len(records)), key=lambda i: tuple(self.locations[records[i]])[:2])
+        result: List[Optional[Dict]] = [None] * len(records)
+        for i in order:
+            result[i] = self.read(records[i])
+        return result
+
+    def record(self, key: str) -> Optional[int]:
+        i = int(np.searchsorted(self.keys, str(key), side="right")) - 1
+        if i < 0 or self.keys[i] != str(key):
+            return None
+        return int(self.key_records[i])
+
+    def get(self, key: str) -> Optional[Dict]:
+        record = self.record(key)
+        return self.read(record) if record is not None else None
+
+    def get_many(self, keys: Iterable[str]) -> List[Optional[Dict]]:
+        records = [self.record(key) for key in keys]
+        found = self.read_many(r for r in records if r is not None)
+        documents = iter(found)
+        return [next(documents) if r is not None else None for r in records]
+
+    def by_issuer(self, issuer: str) -> np.ndarray:
+        i = self.issuers.get(issuer)
+        if i is None:
+            return np.empty(0, dtype=np.int64)
+        return np.asarray(self.issuer_records[self.issuer_offsets[i]:self.issuer_offsets[i + 1]])
+
+    def by_date(self, date_from=None, date_to=None) -> np.ndarray:
+        """Записи с docdateIPS в [date_from, date_to]; границы — строки или даты"""
+        start = np.searchsorted(self.dates, parse_date(date_from), side="left") if date_from else 0
+        end = np.searchsorted(self.dates, parse_date(date_to), side="right") if date_to else len(self.dates)
+        return np.asarray(self.date_records[start:end])
+
+    def close(self):
+        for fd in self._fds.values():
+            os.close(fd)
+        self._fds.clear()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Хранилище актов RusLawOD")
+    parser.add_argument("command", choices=["build", "get", "issuer", "dates"])
+    parser.add_argument("args", nargs="*", help="build: Parquet-файлы; get: ключи; issuer: орган; dates: от до")
+    parser.add_argument("--directory", default=DOCUMENTS_DIR)
+    parser.add_argument("--shard-mb", type=int, default=256)
+    parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        manifest = build_store(iter_parquet_documents(args.args), args.directory, args.shard_mb)
+        print(f"Документов: {manifest['num_documents']}, шардов: {len(manifest['shards'])}")
+    else:
+        store = DocumentStore(args.directory)
+        if args.command == "get":
+            documents = store.get_many(args.args)
+        else:
+            records = store.by_issuer(" ".join(args.args)) if args.command == "issuer" else \
+                store.by_date(*(args.args + [None, None])[:2])
+            print(f"Найдено: {len(records)}")
+            documents = store.read_many(records[:args.limit])
+        for document in documents:
+            identification = (document or {}).get("metadata", {}).get("identification", {})
+            print(json.dumps(identification, ensure_ascii=False))
@@ -0,0 +1,176 @@
+"""
+Дисковый кэш эмбеддингов фрагментов.
+
+Для каждой модели в data/processed/embedding_cache/<модель>/ хранятся:
+    vectors.f16 — векторы float16 подряд, читаются через memmap;
+    keys.bin    — md5 нормализованного текста (16 байт) для каждой строки vectors.f16;
+    meta.json   — имя модели и размерность.
+
+При переиндексации (другая нарезка, тип индекса, параметры) эмбеддинги уже
+встречавшихся текстов берутся из кэша, энкодер считает только новые. Файлы
+только дописываются: сначала векторы, потом ключи.
+
+Писать в кэш может один процесс: он держит эксклюзивную блокировку файла lock
+и только он обрезает хвост оборванной записи. Остальные процессы (или открытые
+с writable=False) читают кэш без изменений файлов и не дописывают новые векторы:
+они видят только строки, у которых записаны и вектор, и ключ.
+"""
+from typing import Dict, List, Optional, Sequence
+import fcntl
+import hashlib
+import json
+import os
+import re
+import threading
+import unicodedata
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+EMBEDDING_CACHE_DIR = 'data/processed/embedding_cache/'
+KEY_BYTES = 16
+
+WHITESPACE = re.compile(r'\s+')
+
+
+def normalize_text(text: str) -> str:
+    return WHITESPACE.sub(' ', unicodedata.normalize('NFC', text)).strip()
+
+
+def text_key(text: str) -> bytes:
+    return hashlib.md5(normalize_text(text).encode('utf-8')).digest()
+
+
+class EmbeddingCache:
+    def __init__(self, model_name: str, cache_dir: str = EMBEDDING_CACHE_DIR, writable: bool = True):
+        self.model_name = model_name
+        self.directory = os.path.join(cache_dir, re.sub(r'[^\w.@-]+', '__', model_name))
+        self._vectors_path = os.path.join(self.directory, 'vectors.f16')
+        self._keys_path = os.path.join(self.directory, 'keys.bin')
+        self._meta_path = os.path.join(self.directory, 'meta.json')
+        os.makedirs(self.directory, exist_ok=True)
+
+        self.writable = False
+        self._lock_file = None
+        if writable:
+            self._lock_file = open(os.path.join(self.directory, 'lock'), 'ab')
+            try:
+                fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                self.writable = True
+            except BlockingIOError:
+                # В кэш уже пишет другой процесс — этот только читает
+                self._lock_file.close()
+                self._lock_file = None
+
+        self.dim: Optional[int] = None
+        self.rows: Dict[bytes, int] = {}
+        self._lock = threading.Lock()
+        self._mmap = None
+        self.hits = 0
+        self.misses = 0
+
+        if os.path.exists(self._meta_path):
+            with open(self._meta_path, 'r', encoding='utf-8') as f:
+                self.dim = json.load(f)['dim']
+            self._load_keys()
+
+    def _load_keys(self):
+        with open(self._keys_path, 'rb') as f:
+            keys = f.read()
+        row_bytes = self.dim * 2
+        count = min(len(keys) // KEY_BYTES, os.path.getsize(self._vectors_path) // row_bytes)
+        if self.writable:
+            # Хвост незавершенной записи обрезает только владелец блокировки: у читателя
+            # «хвост» может оказаться векторами, которые писатель дописывает прямо сейчас
+            for path, size in ((self._keys_path, count * KEY_BYTES), (self._vectors_path, count * row_bytes)):
+                if os.path.getsize(path) != size:
+                    os.truncate(path, size)
+        self.rows = {keys[i * KEY_BYTES:(i + 1) * KEY_BYTES]: i for i in range(count)}
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def lookup(self, keys: Sequence[bytes]) -> np.ndarray:
+        """Номера строк для ключей, -1 — нет в кэше"""
+        return np.fromiter((self.rows.get(key, -1) for key in keys), dtype=np.int64, count=len(keys))
+
+    def vectors(self, rows: np.ndarray) -> np.ndarray:
+        with self._lock:
+            if self._mmap is None or self._mmap.shape[0] < len(self.rows):
+                self._mmap = np.memmap(self._vectors_path, dtype=np.float16, mode='r',
+                                       shape=(len(self.rows), self.dim))
+            return np.asarray(self._mmap[rows])
+
+    def add(self, keys: Sequence[bytes], vectors: np.ndarray):
+        if not self.writable:
+            raise RuntimeError(f"Кэш эмбеддингов {self.model_name} открыт только для чтения")
+        vectors = np.asarray(vectors, dtype=np.float16)
+        with self._lock:
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+                for path in (self._vectors_path, self._keys_path):
+                    open(path, 'ab').close()
+                with open(self._meta_path, 'w', encoding='utf-8') as f:
+                    json.dump({'model_name': self.model_name, 'dim': self.dim}, f, ensure_ascii=False)
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"Размерность {vectors.shape[1]} не совпадает с кэшем {self.model_name} ({self.dim})")
+
+            new = [i for i, key in enumerate(keys) if key not in self.rows]
+            new = list({keys[i]: i for i in new}.values())
+            if not new:
+                return
+            with open(self._vectors_path, 'ab') as f:
+                f.write(vectors[new].tobytes())
+            with open(self._keys_path, 'ab') as f:
+                f.write(b''.join(keys[i] for i in new))
+            for i in new:
+                self.rows[keys[i]] = len(self.rows)
+
+    def close(self):
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+            self.writable = False
+
+
+class CachedEmbeddings(Embeddings):
+    """Эмбеддинги документов через EmbeddingCache; вопросы считаются напрямую"""
+
+    def __init__(self, base: Embeddings, cache: EmbeddingCache):
+        self.base = base
+        self.cache = cache
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        texts = list(texts)
+        if not texts:
+            return []
+        keys = [text_key(text) for text in texts]
+        rows = self.cache.lookup(keys)
+
+        missing: Dict[bytes, int] = {}
+        for i in np.flatnonzero(rows < 0):
+            missing.setdefault(keys[i], int(i))
+        self.cache.hits += len(texts) - int((rows < 0).sum())
+        self.cache.misses += len(missing)
+
+        if missing and not self.cache.writable:
+            # Кэш только для чтения: новые векторы считаются, но не сохраняются
+            fresh = np.asarray(self.base.embed_documents([texts[i] for i in missing.values()]), dtype=np.float16)
+            position = {key: j for j, key in enumerate(missing)}
+            found = rows >= 0
+            vectors = np.empty((len(texts), fresh.shape[1]), dtype=np.float16)
+            if found.any():
+                vectors[found] = self.cache.vectors(rows[found])
+            for i in np.flatnonzero(~found):
+                vectors[i] = fresh[position[keys[i]]]
+            return vectors.astype(np.float32).tolist()
+        if missing:
+            vectors = self.base.embed_documents([texts[i] for i in missing.values()])
+            self.cache.add(list(missing), np.asarray(vectors, dtype=np.float32))
+            rows = self.cache.lookup(keys)
+
+        # Свежие векторы тоже проходят через float16, чтобы не отличаться от закэшированных
+        return self.cache.vectors(rows).astype(np.float32).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.base.embed_query(text)
@@ -0,0 +1,177 @@
+"""
+Модели эмбеддингов для индексации и поиска.
+
+Секция `embeddings` конфига выбирает бэкенд:
+    embeddings:
+      backend: onnx               # huggingface | onnx
+      model_name: "sentence-transformers/all-MiniLM-L6-v2"
+      quantize: true              # динамическое int8-квантование весов
+      batch_size: 32
+      max_length: 256
+      cache: false                # дисковый кэш эмбеддингов фрагментов (embedding_cache.py);
+                                  # включается при индексации, процессам-читателям не нужен
+
+Бэкенд `onnx` один раз экспортирует энкодер в ONNX (и квантует в int8) в
+data/processed/onnx/ и дальше считает эмбеддинги в ONNX Runtime без PyTorch.
+Тексты группируются в пакеты близкой длины, каждый пакет дополняется только
+до своего самого длинного текста. Индекс FAISS должен быть построен той же
+моделью, что считает эмбеддинги вопросов.
+"""
+from typing import Dict, List, Optional
+import os
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+ONNX_DIR = 'data/processed/onnx/'
+
+
+def tokenizer_dir(model_name: str = EMBEDDING_MODEL, output_dir: str = ONNX_DIR) -> str:
+    """Каталог токенизатора, сохраненного вместе с экспортированной моделью"""
+    return os.path.join(output_dir, model_name.replace("/", "__"))
+
+
+def export_onnx(model_name: str = EMBEDDING_MODEL, output_dir: str = ONNX_DIR, quantize: bool = True) -> str:
+    """Путь к ONNX-модели энкодера; экспорт и квантование выполняются один раз"""
+    base_name = model_name.replace("/", "__")
+    fp32_path = os.path.join(output_dir, f"{base_name}.onnx")
+    int8_path = os.path.join(output_dir, f"{base_name}.int8.onnx")
+    target = int8_path if quantize else fp32_path
+    if not os.path.exists(tokenizer_dir(model_name, output_dir)) and os.path.exists(fp32_path):
+        # Экспорт без сохраненного токенизатора: сохраняется тот, с которым модель экспортировалась
+        from transformers import AutoTokenizer
+
+        AutoTokenizer.from_pretrained(model_name).save_pretrained(tokenizer_dir(model_name, output_dir))
+    if os.path.exists(target):
+        return target
+
+    if not os.path.exists(fp32_path):
+        import torch
+        from transformers import AutoModel, AutoTokenizer
+
+        tokenizer = AutoTokenizer.from_pretrained(model_name)
+        model = AutoModel.from_pretrained(model_name).eval()
+        model.config.return_dict = False
+        sample = dict(tokenizer(["пример текста"], return_tensors="pt"))
+        input_names = list(sample)
+        dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+        dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+
+        os.makedirs(output_dir, exist_ok=True)
+        with torch.no_grad():
+            torch.onnx.export(
+                model, (sample,), fp32_path,
+                input_names=input_names,
+                output_names=["last_hidden_state"],
+                dynamic_axes=dynamic_axes,
+                opset_version=14
+            )
+        tokenizer.save_pretrained(tokenizer_dir(model_name, output_dir))
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+    return target
+
+
+class OnnxEmbeddings(Embeddings):
+    def __init__(self, model_name: str = EMBEDDING_MODEL, quantize: bool = True, batch_size: int = 32,
+                 max_length: int = 256, pooling: str = "mean", normalize: bool = True,
+                 num_threads: Optional[int] = None, cache_dir: str = ONNX_DIR):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        if pooling not in ("mean", "cls"):
+            raise ValueError(f"Неизвестный способ пулинга: {pooling}")
+
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.max_length = max_length
+        self.pooling = pooling
+        self.normalize = normalize
+        self.model_path = export_onnx(model_name, cache_dir, quantize)
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(self.model_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = [i.name for i in self.session.get_inputs()]
+        # Токенизатор из каталога экспорта: модель и словарь не расходятся при обновлении хаба
+        self.tokenizer = AutoTokenizer.from_pretrained(tokenizer_dir(model_name, cache_dir))
+
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        encoded = self.tokenizer(texts, padding=True, truncation=True, max_length=self.max_length,
+                                 return_tensors="np")
+        feeds = {name: encoded[name].astype(np.int64) for name in self.input_names}
+        hidden = self.session.run(None, feeds)[0]
+
+        if self.pooling == "cls":
+            vectors = hidden[:, 0]
+        else:
+            mask = encoded["attention_mask"][..., None].astype(hidden.dtype)
+            vectors = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+
+        if self.normalize:
+            vectors = vectors / np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None)
+        return vectors.astype(np.float32)
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+        # Пакеты из текстов близкой длины (по числу символов) почти не содержат паддинга
+        order = np.argsort([len(text) for text in texts], kind="stable")
+        batches = [
+            self._encode_batch([texts[i] for i in order[start:start + self.batch_size]])
+            for start in range(0, len(texts), self.batch_size)
+        ]
+        vectors = np.empty((len(texts), batches[0].shape[1]), dtype=np.float32)
+        vectors[order] = np.concatenate(batches)
+        return vectors
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.encode(list(texts)).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._encode_batch([text])[0].tolist()
+
+
+# Параметры, которые не меняют векторы и не должны делить кэш
+CACHE_NEUTRAL_OPTIONS = ("batch_size", "show_progress_bar", "num_threads", "cache_dir", "device")
+
+
+def options_key(options: Dict) -> str:
+    """Параметры кодирования в имени каталога кэша, в постоянном порядке"""
+    return ",".join(f"{name}={options[name]}" for name in sorted(options) if name not in CACHE_NEUTRAL_OPTIONS)
+
+
+def build_embeddings(config: Optional[Dict] = None) -> Embeddings:
+    """Создает модель эмбеддингов по секции `embeddings` конфига"""
+    config = dict(config or {})
+    backend = config.pop("backend", "huggingface")
+    model_name = config.pop("model_name", EMBEDDING_MODEL)
+    cache = config.pop("cache", False)
+    cache_dir = config.pop("cache_dir", None)
+
+    if backend == "huggingface":
+        from langchain_huggingface import HuggingFaceEmbeddings
+
+        encode_kwargs = {'normalize_embeddings': True, **config}
+        embeddings = HuggingFaceEmbeddings(model_name=model_name, encode_kwargs=encode_kwargs)
+        # Параметры кодирования меняют векторы (например, нормировку), поэтому входят в ключ кэша
+        cache_key = f"{model_name}@{options_key(encode_kwargs)}"
+    elif backend == "onnx":
+        embeddings = OnnxEmbeddings(model_name=model_name, **config)
+        # Квантованная модель дает другие векторы, поэтому кэшируется отдельно
+        options = {"quantize": True, "pooling": "mean", "normalize": True, "max_length": 256, **config}
+        cache_key = f"{model_name}@onnx-{options_key(options)}"
+    else:
+        raise ValueError(f"Неизвестный бэкенд эмбеддингов: {backend}")
+
+    if not cache:
+        return embeddings
+    from embedding_cache import EMBEDDING_CACHE_DIR, CachedEmbeddings, EmbeddingCache
+
+    return CachedEmbeddings(embeddings, EmbeddingCache(cache_key, cache_dir or EMBEDDING_CACHE_DIR))
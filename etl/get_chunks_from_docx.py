@@ -1,5 +1,5 @@
 import re
-from typing import List, Dict, Tuple
+from typing import List, Dict, Iterator, Tuple
 from dataclasses import dataclass
 from docx import Document
 import hashlib
@@ -124,11 +124,24 @@ def identify_document_element(text: str) -> Tuple[str, str]:
 
 def process_legal_docx(file_path: str, max_chunk_size: int = 800, overlap: int = 100) -> List[LegalChunk]:
     """Обрабатывает юридический DOCX-документ"""
+    return list(iter_legal_chunks(file_path, max_chunk_size, overlap))
+
+
+def load_chunk_store(file_path: str, max_chunk_size: int = 800, overlap: int = 100) -> "ChunkStore":
+    """Фрагменты документа в компактном хранилище (см. chunk_store.py); LegalChunk не накапливаются"""
+    from chunk_store import ChunkStore
+
+    store = ChunkStore()
+    store.extend(iter_legal_chunks(file_path, max_chunk_size, overlap))
+    return store
+
+
+def iter_legal_chunks(file_path: str, max_chunk_size: int = 800, overlap: int = 100) -> Iterator[LegalChunk]:
+    """LegalChunk по статьям документа; в памяти одновременно только фрагменты одной статьи"""
     doc = Document(file_path)
     current_section = "ОБЩИЕ ПОЛОЖЕНИЯ"
     current_chapter = ""
     current_article = ""
-    chunks = []
     
     doc_metadata = extract_document_metadata(file_path)
     
@@ -145,6 +158,9 @@ def process_legal_docx(file_path: str, max_chunk_size: int = 800, overlap: int =
             current_chapter = element_content
         elif element_type == "ARTICLE":
             current_article = element_content
+            # Номер статьи не входит в element_content, сохраняем его отдельно для ссылок
+            number = re.match(r'^Статья\s*(\d+(?:\.\d+)*)', text, re.IGNORECASE)
+            article_metadata = dict(doc_metadata, article_number=number.group(1) if number else "")
             # Передаем все необходимые аргументы, включая overlap
             article_chunks = process_article(
                 doc=doc,
@@ -152,13 +168,11 @@ def process_legal_docx(file_path: str, max_chunk_size: int = 800, overlap: int =
                 section=current_section,
                 chapter=current_chapter,
                 article=current_article,
-                metadata=doc_metadata,
+                metadata=article_metadata,
                 max_size=max_chunk_size,
                 overlap=overlap  # Добавлен отсутствующий аргумент
             )
-            chunks.extend(article_chunks)
-    
-    return chunks
+            yield from article_chunks
 
 
 def process_article(
@@ -34,7 +34,33 @@ def load_and_chunk_html_documents(file_path, chunk_size=1600, chunk_overlap=150)
         chunk_overlap (int): Перекрытие между чанками
         
     Returns:
-        FAISS: Векторное хранилище с чанками документа
+        (list, list): Тексты чанков и их метаданные
+    """
+    chunks = []
+    metadatas = []
+    for chunk, metadata in iter_html_chunks(file_path, chunk_size, chunk_overlap):
+        chunks.append(chunk)
+        # Позиция в документе нужна, чтобы склеивать соседние фрагменты статьи
+        metadatas.append(dict(metadata, chunk_index=len(chunks) - 1))
+    return chunks, metadatas
+
+
+def load_html_chunk_store(file_path, chunk_size=1600, chunk_overlap=150):
+    """Чанки документа в компактном хранилище (см. chunk_store.py), без списков текстов и метаданных"""
+    from chunk_store import ChunkStore
+
+    store = ChunkStore()
+    for chunk, metadata in iter_html_chunks(file_path, chunk_size, chunk_overlap):
+        store.add(chunk, dict(metadata, chunk_index=len(store)))
+    return store
+
+
+def iter_html_chunks(file_path, chunk_size=1600, chunk_overlap=150):
+    """
+    Чанки документа с метаданными раздела, главы и статьи.
+
+    Чанки без новых заголовков получают тот же объект метаданных, что и предыдущий:
+    словарь не копируется на каждый чанк и не должен изменяться вызывающим.
     """
     # Загрузка и парсинг HTML
     with open(file_path, 'r', encoding='utf-8') as file:
@@ -76,9 +102,6 @@ def load_and_chunk_html_documents(file_path, chunk_size=1600, chunk_overlap=150)
     )
     
     # Нарезка на чанки
-    chunks = []
-    metadatas = []
-
     metadata = dict()
 
     print(f'len(sections) {len(sections)}')
@@ -88,23 +111,22 @@ def load_and_chunk_html_documents(file_path, chunk_size=1600, chunk_overlap=150)
         # Извлечение метаданных (раздел, глава, статья) из текста
         print(f'len(section_chunks) {len(section_chunks)}')
         for chunk in section_chunks:
-            current_metadata = metadata.copy()
+            headings = {}
             lines = chunk.split('\n')
             for line in lines:
                 line = clean_text(line)
 
                 if line.startswith('Раздел'):
-                    current_metadata['section'] = line.strip()
+                    headings['section'] = line.strip()
                 elif line.startswith('Глава'):
-                    current_metadata['chapter'] = line.strip()
+                    headings['chapter'] = line.strip()
                 elif line.startswith('Статья'):
-                    current_metadata['article'] = line.strip()
+                    headings['article'] = line.strip()
 
-            chunks.append(chunk)
-            metadatas.append(metadata)
-            metadata = current_metadata
-
-    return chunks, metadatas
+            yield chunk, metadata
+            # Заголовки чанка относятся к следующим чанкам
+            if headings:
+                metadata = dict(metadata, **headings)
 
 if __name__ == "__main__":
     doc_path = 'data/raw/housing_code/garant/1.html'
@@ -0,0 +1,126 @@
+"""
+Двухэтапный поиск: сначала по статьям, затем по фрагментам найденных статей.
+
+Фрагменты группируются по иерархии из метаданных (источник → раздел → глава →
+статья). Для каждой статьи хранится центроид — нормированное среднее векторов
+ее фрагментов. Первый этап ищет top_articles ближайших центроидов (индекс FAISS
+по статьям в десятки раз меньше индекса по фрагментам), второй — точно
+перебирает только фрагменты этих статей. Векторы фрагментов переупорядочены
+по статьям, поэтому второй этап читает непрерывные отрезки массива.
+
+Стоимость поиска — число статей плюс top_articles × средний размер статьи
+вместо числа всех фрагментов. Сравнение с плоским поиском:
+    python etl/benchmark_hierarchical.py --scales 0 100000 1000000
+
+Секция `retrieval.hierarchy` конфига включает двухэтапный поиск в LegalConsult:
+    retrieval:
+      hierarchy:
+        top_articles: 8
+"""
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from context_packer import article_number
+from sharded_retrieval import top_k
+
+
+def article_key(metadata: Dict) -> Tuple:
+    """Ключ статьи в иерархии; фрагменты без статьи группируются по главе или разделу"""
+    return (
+        metadata.get("source"),
+        metadata.get("section"),
+        metadata.get("chapter"),
+        article_number(metadata) or metadata.get("article"),
+    )
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    return vectors / np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None)
+
+
+class HierarchicalIndex:
+    """Интерфейс search как у индекса FAISS: (scores, ids) для пакета запросов"""
+
+    def __init__(self, vectors: np.ndarray, metadatas: List[Dict], top_articles: int = 8,
+                 article_factory: str = "Flat", article_params: Optional[Dict] = None):
+        import faiss
+
+        self.top_articles = top_articles
+        self.ntotal = len(vectors)
+
+        groups: Dict[Tuple, int] = {}
+        labels = np.fromiter((groups.setdefault(article_key(m or {}), len(groups)) for m in metadatas),
+                             dtype=np.int64, count=len(metadatas))
+        self.keys = list(groups)
+
+        # CSR: фрагменты статьи g — order[offsets[g]:offsets[g + 1]]
+        self.order = np.argsort(labels, kind="stable")
+        self.offsets = np.zeros(len(groups) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(labels, minlength=len(groups)), out=self.offsets[1:])
+        self.vectors = np.ascontiguousarray(vectors[self.order], dtype="float32")
+
+        sums = np.add.reduceat(self.vectors, self.offsets[:-1], axis=0)
+        self.centroids = normalize_rows(sums.astype("float32"))
+
+        self.article_index = faiss.index_factory(self.centroids.shape[1], article_factory,
+                                                 faiss.METRIC_INNER_PRODUCT)
+        if not self.article_index.is_trained:
+            self.article_index.train(self.centroids)
+        self.article_index.add(self.centroids)
+        if article_params:
+            faiss.ParameterSpace().set_index_parameters(
+                self.article_index, ",".join(f"{k}={v}" for k, v in article_params.items()))
+        self.last_candidates = 0
+
+    @property
+    def num_articles(self) -> int:
+        return len(self.keys)
+
+    def candidates(self, articles: np.ndarray) -> np.ndarray:
+        """Позиции фрагментов выбранных статей в переупорядоченном массиве"""
+        articles = articles[articles >= 0]
+        return np.concatenate([np.arange(self.offsets[a], self.offsets[a + 1]) for a in articles]) \
+            if len(articles) else np.empty(0, dtype=np.int64)
+
+    def search(self, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        queries = np.asarray(queries, dtype="float32").reshape(-1, self.vectors.shape[1])
+        _, articles = self.article_index.search(queries, self.top_articles)
+
+        scores = np.full((len(queries), k), -np.inf, dtype="float32")
+        ids = np.full((len(queries), k), -1, dtype=np.int64)
+        total = 0
+        for row, (query, found) in enumerate(zip(queries, articles)):
+            positions = self.candidates(found)
+            total += len(positions)
+            if not len(positions):
+                continue
+            row_scores, row_ids = top_k((self.vectors[positions] @ query)[None, :], positions[None, :], k)
+            n = row_ids.shape[1]
+            scores[row, :n] = row_scores[0]
+            ids[row, :n] = self.order[row_ids[0]]
+        self.last_candidates = total / max(len(queries), 1)
+        return scores, ids
+
+
+class HierarchicalSearch:
+    """Двухэтапный поиск поверх langchain FAISS; подменяет хранилище в RetrievalPipeline"""
+
+    def __init__(self, vectorstore, top_articles: int = 8, article_factory: str = "Flat",
+                 article_params: Optional[Dict] = None):
+        if not hasattr(vectorstore, "docstore"):
+            raise ValueError("Двухэтапный поиск строится только по индексу langchain FAISS")
+        self.vectorstore = vectorstore
+        self.embeddings = vectorstore.embeddings
+        index = vectorstore.index
+        docstore, mapping = vectorstore.docstore, vectorstore.index_to_docstore_id
+        metadatas = [docstore.search(mapping[i]).metadata for i in range(index.ntotal)]
+        # Центроиды и второй этап считаются по нормированным векторам (косинусная близость)
+        vectors = normalize_rows(index.reconstruct_n(0, index.ntotal))
+        self.index = HierarchicalIndex(vectors, metadatas, top_articles, article_factory, article_params)
+
+    def similarity_search_by_vector(self, vector: List[float], k: int = 4, **kwargs) -> List:
+        query = np.asarray(vector, dtype="float32")
+        _, ids = self.index.search(query / max(float(np.linalg.norm(query)), 1e-12), k)
+        docstore, mapping = self.vectorstore.docstore, self.vectorstore.index_to_docstore_id
+        return [docstore.search(mapping[int(i)]) for i in ids[0] if i >= 0]
@@ -0,0 +1,222 @@
+"""
+Реестр версий индекса и горячая замена без перезапуска.
+
+Версии лежат в data/processed/index_registry/<версия>/ (каталоги FAISS.save_local),
+файл CURRENT содержит имя активной версии и заменяется атомарно. HotSwapIndex
+следит за CURRENT: новая версия загружается и прогревается в фоновом потоке,
+затем новые запросы атомарно переключаются на нее. Старая версия освобождается,
+когда завершатся начатые на ней поиски. Версия удерживается только на время
+поиска в FAISS, поэтому сессии не прерываются, а в памяти одновременно не
+больше двух версий. IndexFlat и IVF-Flat открываются через mmap (IO_FLAG_MMAP_IFC),
+остальные типы индексов загружаются в кучу каждого процесса.
+
+Секция `index_registry` конфига:
+    index_registry:
+      directory: "data/processed/index_registry"
+      poll_interval_s: 5
+
+Публикация новой версии:
+    python etl/index_registry.py publish legal_docs_faiss_index
+"""
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+import argparse
+import gc
+import json
+import os
+import shutil
+import threading
+
+REGISTRY_DIR = 'data/processed/index_registry/'
+CURRENT_FILE = 'CURRENT'
+
+
+def current_version(directory: str = REGISTRY_DIR) -> Optional[str]:
+    try:
+        with open(os.path.join(directory, CURRENT_FILE), 'r', encoding='utf-8') as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def list_versions(directory: str = REGISTRY_DIR) -> List[str]:
+    if not os.path.isdir(directory):
+        return []
+    return sorted(name for name in os.listdir(directory)
+                  if not name.endswith(".tmp") and os.path.isfile(os.path.join(directory, name, "index.faiss")))
+
+
+def publish(source_dir: str, directory: str = REGISTRY_DIR, version: Optional[str] = None) -> str:
+    """Копирует сохраненный индекс в реестр и делает его текущей версией"""
+    version = version or datetime.now().strftime("v%Y%m%d_%H%M%S")
+    target = os.path.join(directory, version)
+    if os.path.exists(target):
+        raise ValueError(f"Версия {version} уже есть в реестре")
+
+    # Каталог версии и указатель появляются целиком или не появляются вовсе
+    shutil.copytree(source_dir, target + ".tmp")
+    os.replace(target + ".tmp", target)
+    pointer = os.path.join(directory, CURRENT_FILE)
+    with open(pointer + ".tmp", 'w', encoding='utf-8') as f:
+        f.write(version)
+    os.replace(pointer + ".tmp", pointer)
+    return version
+
+
+class IndexVersion:
+    def __init__(self, version: str, vectorstore, filtered=None):
+        self.version = version
+        self.vectorstore = vectorstore
+        self.filtered = filtered
+        self.in_flight = 0
+        self.retired = False
+
+
+class HotSwapIndex:
+    """Заменяет langchain FAISS в RetrievalPipeline; поиск всегда идет по активной версии"""
+
+    def __init__(self, embeddings, directory: str = REGISTRY_DIR, poll_interval_s: float = 5.0,
+                 watch: bool = True, warmup_query: str = "Прогрев модели"):
+        self.embeddings = embeddings
+        self.directory = directory
+        self.poll_interval_s = poll_interval_s
+        self.filters_config: Optional[Dict] = None
+        self.swaps = 0
+
+        self._lock = threading.Condition()
+        self._draining: List[IndexVersion] = []
+        self._failed_version: Optional[str] = None
+        self._warmup_vector = embeddings.embed_query(warmup_query)
+
+        version = current_version(directory)
+        if version is None:
+            raise FileNotFoundError(f"В реестре {directory} нет текущей версии индекса")
+        self._active = self._load(version)
+
+        self._stopped = threading.Event()
+        self._watcher = None
+        if watch:
+            self.start_watching()
+
+    @property
+    def version(self) -> str:
+        return self._active.version
+
+    def _load(self, version: str) -> IndexVersion:
+        from langchain_community.vectorstores import FAISS
+
+        from prefork_server import read_index_mmap
+
+        path = os.path.join(self.directory, version)
+        vectorstore = FAISS.load_local(path, self.embeddings)
+        # Каждый воркер pre-fork сервера загружает новую версию сам; через mmap страницы индекса
+        # берутся из общего page cache, а не копируются в кучу каждого процесса
+        index = read_index_mmap(os.path.join(path, "index.faiss"))
+        if index is not None:
+            vectorstore.index = index
+        filtered = None
+        if self.filters_config is not None:
+            from metadata_filter import FilteredSearch
+
+            filtered = FilteredSearch(vectorstore, **self.filters_config)
+        # Первый поиск подкачивает страницы индекса до переключения запросов
+        vectorstore.similarity_search_by_vector(self._warmup_vector, k=1)
+        return IndexVersion(version, vectorstore, filtered)
+
+    def enable_filters(self, config: Dict):
+        """Фильтры по метаданным строятся для каждой загружаемой версии"""
+        from metadata_filter import FilteredSearch
+
+        self.filters_config = dict(config)
+        with self._lock:
+            self._active.filtered = FilteredSearch(self._active.vectorstore, **self.filters_config)
+
+    def _acquire(self) -> IndexVersion:
+        with self._lock:
+            active = self._active
+            active.in_flight += 1
+            return active
+
+    def _release(self, version: IndexVersion):
+        with self._lock:
+            version.in_flight -= 1
+            if version.retired and version.in_flight == 0:
+                self._unload(version)
+
+    def _unload(self, version: IndexVersion):
+        # Последняя ссылка на индекс — память FAISS освобождается вместе с объектом
+        version.vectorstore = None
+        version.filtered = None
+        if version in self._draining:
+            self._draining.remove(version)
+        self._lock.notify_all()
+
+    def swap_to(self, version: str):
+        new = self._load(version)
+        with self._lock:
+            old, self._active = self._active, new
+            old.retired = True
+            if old.in_flight == 0:
+                self._unload(old)
+            else:
+                self._draining.append(old)
+            self.swaps += 1
+        gc.collect()
+        print(f"Индекс переключен: {old.version} -> {version}")
+
+    def _watch(self):
+        while not self._stopped.wait(self.poll_interval_s):
+            version = current_version(self.directory)
+            if not version or version in (self._active.version, self._failed_version):
+                continue
+            # Третья версия не загружается, пока не освобождена предыдущая
+            with self._lock:
+                self._lock.wait_for(lambda: not self._draining)
+            try:
+                self.swap_to(version)
+            except Exception as e:
+                self._failed_version = version
+                print(f"Не удалось загрузить версию индекса {version}: {e}")
+
+    def start_watching(self):
+        if self._watcher is None or not self._watcher.is_alive():
+            self._stopped.clear()
+            self._watcher = threading.Thread(target=self._watch, name="index-watcher", daemon=True)
+            self._watcher.start()
+
+    def close(self):
+        self._stopped.set()
+
+    def similarity_search_by_vector(self, vector: List[float], k: int = 4, **kwargs) -> List:
+        version = self._acquire()
+        try:
+            return version.vectorstore.similarity_search_by_vector(vector, k=k, **kwargs)
+        finally:
+            self._release(version)
+
+    def search(self, vector: List[float], k: int, filters: Dict[str, Any]) -> List:
+        """Тот же интерфейс, что у FilteredSearch.search"""
+        version = self._acquire()
+        try:
+            if version.filtered is None:
+                raise ValueError("Фильтры не настроены: добавьте секцию retrieval.filters")
+            return version.filtered.search(vector, k, filters)
+        finally:
+            self._release(version)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Реестр версий индекса")
+    parser.add_argument("command", choices=["publish", "list"])
+    parser.add_argument("source", nargs="?", help="каталог FAISS.save_local для publish")
+    parser.add_argument("--directory", default=REGISTRY_DIR)
+    parser.add_argument("--version")
+    args = parser.parse_args()
+
+    if args.command == "publish":
+        if not args.source:
+            parser.error("укажите каталог индекса")
+        print(f"Опубликована версия {publish(args.source, args.directory, args.version)}")
+    else:
+        print(json.dumps({"current": current_version(args.directory), "versions": list_versions(args.directory)},
+                         ensure_ascii=False, indent=2))
@@ -1,29 +1,44 @@
-from langchain_community.document_loaders import TextLoader, CSVLoader
-from langchain.text_splitter import CharacterTextSplitter
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_community.vectorstores import FAISS
-from langchain.chains import RetrievalQA
-from langchain_compressa import ChatCompressa
-# from data_loader import load_data
-from tqdm import tqdm
-from get_chunks_from_html import load_and_chunk_html_documents
-from typing import List
-import re
+"""
+Консультант по ЖК РФ: поиск контекста в индексе FAISS и генерация ответа LLM.
+
+Тяжелые зависимости (langchain FAISS, модели) импортируются при создании
+LegalConsult, а не при импорте модуля, чтобы интерфейс диалога стартовал сразу.
+"""
+from embeddings import build_embeddings
+from llm_backends import build_llm
+from retrieval import build_retriever
+from context_packer import ContextPacker
+from tracing import Tracer
+from prefix_cache import compose_system_prompt
+import copy
+import os
+import time
+import uuid
 
 
 class LegalConsult:
     doc_path = 'data/raw/housing_code/garant/1.html'
+    index_path = 'legal_docs_faiss_index'
+    # Сколько раз шаг дописывается к сессии, одновременно измененной другим процессом
+    session_retries = 3
 
-    def __init__(self, api_key, role):
+    def __init__(self, api_key, role, config=None, session_id=None, defer_llm=False, mmap_index=False):
+        """
+        config — содержимое configs/llm_config.yaml (секции llm, embeddings, retrieval, context, tracing, archive, documents, sessions).
+        defer_llm — не создавать LLM сразу (pre-fork: LLM создается в каждом воркере через load_llm).
+        mmap_index — открыть индекс FAISS через mmap только для чтения (pre-fork: страницы общие у воркеров).
+        """
         self.api_key = api_key
+        config = config or {}
+        self.session_id = session_id or str(uuid.uuid4())[:8]
+        self.turn = 0
+        self.index_mmap = False
 
-        chunks, metadatas = tqdm(load_and_chunk_html_documents(self.doc_path))
+        # Замеры этапов каждого шага диалога (по умолчанию выключены)
+        self.tracer = Tracer(**(config.get("tracing") or {}))
 
-        # Инициализация эмбеддингов
-        embeddings = HuggingFaceEmbeddings(
-            model_name="sentence-transformers/all-MiniLM-L6-v2",
-            encode_kwargs={'normalize_embeddings': True}
-        )
+        # Инициализация эмбеддингов (PyTorch или ONNX Runtime, секция `embeddings`)
+        embeddings = build_embeddings(config.get("embeddings"))
         
         # # Создание векторного хранилища
         # self.vectorstore = FAISS.from_texts(
@@ -35,42 +50,217 @@ class LegalConsult:
         # Сохранение векторного хранилища для последующего использования
         # self.vectorstore.save_local("legal_docs_faiss_index")
 
-        # Загрузка при необходимости
-        self.vectorstore = FAISS.load_local("legal_docs_faiss_index", embeddings)
+        # Загрузка при необходимости; большой корпус ищется по шардам в процессах-воркерах
+        if config.get("shards"):
+            from sharded_retrieval import ShardedIndex
+
+            self.vectorstore = ShardedIndex(embeddings=embeddings, **config["shards"])
+        elif config.get("index_registry"):
+            # Версия индекса из реестра, новые версии подхватываются без перезапуска
+            from index_registry import HotSwapIndex
+
+            self.vectorstore = HotSwapIndex(embeddings, **config["index_registry"])
+        else:
+            from langchain_community.vectorstores import FAISS
+
+            self.vectorstore = FAISS.load_local(self.index_path, embeddings)
+            if mmap_index:
+                # До build_retriever: обвязки поиска запоминают объект индекса
+                from prefork_server import remap_index_readonly
+
+                self.index_mmap = remap_index_readonly(self.vectorstore,
+                                                       os.path.join(self.index_path, "index.faiss"))
+
+        # Плотный поиск с необязательным переранжированием кросс-энкодером
+        self.retriever = build_retriever(self.vectorstore, config.get("retrieval"), self.tracer)
+
+        # Контекст заполняется найденными фрагментами в пределах бюджета токенов
+        self.packer = ContextPacker(**(config.get("context") or {}))
+        self.last_sources = []
+        self.last_chunk_ids = []
+        self.last_timings = {}
+        self.last_route = "llm"
+
+        # Полные тексты актов для отображения источников, читаются по смещению при запросе
+        self.documents = None
+        if config.get("documents"):
+            from document_store import DocumentStore
+
+            self.documents = DocumentStore(**config["documents"])
 
-        self.llm = ChatCompressa(
-            base_url="https://compressa-api.mil-team.ru/v1",
-            api_key=api_key,
-            temperature=0.2,
-            max_tokens=50,
-            stream="false"
-        )
+        # История сессий во внешнем хранилище: шаг диалога может обработать любой процесс
+        self.session_store = None
+        if config.get("sessions"):
+            from session_store import build_session_store
+
+            self.session_store = build_session_store(config["sessions"])
+
+        # Архив консультаций: на очень похожий вопрос отвечает юрист, а не LLM
+        self.archive = None
+        if config.get("archive"):
+            from consultation_archive import ConsultationArchive
+
+            self.archive = ConsultationArchive(**config["archive"])
+
+        # Системный промпт вместе с few-shot примерами — общий префикс всех запросов,
+        # локальные бэкенды кэшируют его KV-состояние
+        self.llm_config = config.get("llm") or {}
+        role = compose_system_prompt(role, self.llm_config.get("prompts"))
 
         self.messages = [
             ("system",
              role),
         ]
 
-    def get_answer(self, client_answer):
-        # Извлечение релевантной информации из базы знаний
-        docs = self.vectorstore.similarity_search(client_answer, k=2)  # Ищем 2 наиболее релевантных фрагмента
-        context = " ".join([doc.page_content for doc in docs])
+        self.llm = None
+        if not defer_llm:
+            self.load_llm()
 
-        # Добавляем контекст в сообщения
-        self.messages.append(("system", f"Context: {context}"))
-        self.messages.append(("human", client_answer))
+    def load_llm(self):
+        """LLM выбирается секцией `llm` конфига: удаленный Compressa или локальная модель"""
+        self.llm = build_llm(self.api_key, self.llm_config, system_prompt=self.messages[0][1])
+
+    def warmup(self, query="Прогрев модели"):
+        """
+        Первый прогон эмбеддинга и поиска: ленивая инициализация модели и
+        подкачка страниц индекса происходят до вопроса клиента. В замеры не попадает.
+        """
+        vector = self.vectorstore.embeddings.embed_query(query)
+        self.vectorstore.similarity_search_by_vector(vector, k=1)
+
+    def source_document(self, key):
+        """Полный акт по pravogovruNd; None, если хранилище не подключено или акта нет"""
+        if self.documents is None:
+            return None
+        return self.documents.get(key)
+
+    def new_session(self, session_id=None):
+        """Новая сессия с общими индексом, моделью эмбеддингов и LLM; история — своя"""
+        session = copy.copy(self)
+        session.session_id = session_id or str(uuid.uuid4())[:8]
+        session.turn = 0
+        session.messages = self.messages[:1]
+        session.last_sources = []
+        session.last_chunk_ids = []
+        session.last_timings = {}
+        session.last_route = "llm"
+        return session
 
-        # Генерация ответа
-        ai_msg = self.llm.invoke(self.messages)
+    def restore_session(self):
+        """История сессии из хранилища и ее версия; новая или истекшая сессия начинается с начала (версия 0)"""
+        stored = self.session_store.get(self.session_id)
+        if stored is None:
+            self.turn, self.messages = 0, self.messages[:1]
+            return 0
+        from session_store import load_session
 
-        # Добавляем ответ в историю
-        self.messages.append(("assistant", ai_msg.content))
+        data, version = stored
+        self.turn, history = load_session(data)
+        self.messages = self.messages[:1] + history
+        return version
+
+    def save_session(self, version, new_messages):
+        """
+        Сохраняет историю поверх версии version. Если сессию тем временем изменил
+        другой процесс, реплики шага new_messages дописываются к свежей версии.
+        """
+        from session_store import HISTORY_ROLES, SessionConflictError, dump_session
+
+        for _ in range(self.session_retries):
+            # Системный промпт общий для всех сессий, контекст шага нужен только самому шагу
+            history = [message for message in self.messages[1:] if message[0] in HISTORY_ROLES]
+            try:
+                self.session_store.put(self.session_id, dump_session(self.turn, history), version)
+                return
+            except SessionConflictError:
+                version = self.restore_session()
+                self.turn += 1
+                self.messages += new_messages
+        raise SessionConflictError(f"Не удалось сохранить сессию {self.session_id}: "
+                                   f"{self.session_retries} конфликтов подряд")
+
+    def get_answer(self, client_answer, filters=None):
+        """filters — условия на метаданные фрагментов, например {"status": "Действует"}"""
+        if self.session_store is None:
+            return self._answer(client_answer, filters)
+        from session_store import HISTORY_ROLES
+
+        version = self.restore_session()
+        start = len(self.messages)
+        answer = self._answer(client_answer, filters)
+        self.save_session(version, [m for m in self.messages[start:] if m[0] in HISTORY_ROLES])
+        return answer
+
+    def _answer(self, client_answer, filters=None):
+        self.turn += 1
+        with self.tracer.turn(self.session_id, self.turn):
+            start = time.perf_counter()
+            vector, match = None, None
+            if self.archive is not None:
+                # Эмбеддинг вопроса считается один раз — для архива и для поиска по ЖК РФ
+                vector = self.retriever.embed_query(client_answer)
+                with self.tracer.span("archive_lookup"):
+                    match = self.archive.match(vector)
+
+            if match is not None and match["route"] == "answer":
+                return self._archive_answer(client_answer, match, start)
+
+            # Извлечение релевантной информации из базы знаний
+            docs = self.retriever.retrieve(client_answer, filters, vector)
+            retrieval_ms = (time.perf_counter() - start) * 1000
+            self.last_chunk_ids = [
+                doc.metadata.get("chunk_id", doc.metadata.get("chunk_index")) for doc in docs
+            ]
+            with self.tracer.span("context_pack"):
+                context, self.last_sources = self.packer.pack(docs)
+
+            # Добавляем контекст в сообщения
+            self.messages.append(("system", f"Context: {context}"))
+            self.last_route = "llm"
+            if match is not None:
+                # Ответ юриста на похожий вопрос — дополнительная опора для LLM
+                self.messages.append(("system", f"Архив консультаций. Вопрос: {match['pair']['question']}\n"
+                                                f"Ответ юриста: {match['pair']['answer']}"))
+                self.last_route = "grounded"
+            self.messages.append(("human", client_answer))
+
+            # Генерация ответа
+            start = time.perf_counter()
+            ai_msg = self.llm.invoke(self.messages)
+            llm_ms = (time.perf_counter() - start) * 1000
+            self.tracer.record("llm_total", llm_ms)
+            self.last_timings = {"retrieval_ms": round(retrieval_ms, 3), "llm_ms": round(llm_ms, 3)}
+            # Время до первого токена сообщают только потоковые бэкенды
+            ttft_ms = getattr(self.llm, "last_stats", {}).get("ttft_ms")
+            if ttft_ms is not None:
+                self.tracer.record("llm_ttft", ttft_ms)
+
+            # Добавляем ответ в историю
+            self.messages.append(("assistant", ai_msg.content))
 
         return ai_msg.content
 
+    def _archive_answer(self, client_answer, match, start):
+        """Проверенный ответ юриста из архива вместо генерации"""
+        from consultation_archive import archive_answer_json, archive_sources
+
+        self.last_sources = archive_sources(match["pair"], self.packer.document_title)
+        self.last_chunk_ids = []
+        answer = archive_answer_json(match["pair"], match["similarity"], self.last_sources)
+        self.last_timings = {"retrieval_ms": round((time.perf_counter() - start) * 1000, 3), "llm_ms": 0.0}
+        self.last_route = "archive"
+
+        self.messages.append(("human", client_answer))
+        self.messages.append(("assistant", answer))
+        return answer
+
 
 # Пример использования
 if __name__ == "__main__":
+    from langchain_community.vectorstores import FAISS
+    from tqdm import tqdm
+    from get_chunks_from_html import load_and_chunk_html_documents
+
     doc_path = 'data/raw/housing_code/garant/1.html'
     print('h'*50)
     # Загрузка документа и создание векторного хранилища
@@ -83,10 +273,7 @@ if __name__ == "__main__":
 
 
     # Инициализация эмбеддингов
-    embeddings = HuggingFaceEmbeddings(
-        model_name="sentence-transformers/all-MiniLM-L6-v2",
-        encode_kwargs={'normalize_embeddings': True}
-    )
+    embeddings = build_embeddings()
     
     
     # Создание векторного хранилища
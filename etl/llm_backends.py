@@ -0,0 +1,411 @@
+"""
+Бэкенды LLM для LegalConsult.
+
+Бэкенд выбирается секцией `llm` в configs/llm_config.yaml:
+    llm:
+      backend: compressa      # compressa | http | llamacpp | transformers | mock
+      ...
+      client:                 # необязательно: повторы, параллелизм, хеджирование (llm_client.py)
+        max_concurrency: 4
+
+Любой бэкенд предоставляет метод invoke(messages), принимающий историю
+в формате LangChain [("system", ...), ("human", ...), ("assistant", ...)]
+и возвращающий объект с полем `content`.
+"""
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+import hashlib
+import json
+import os
+import pickle
+import random
+import threading
+import time
+
+
+# Соответствие ролей LangChain ролям chat-шаблона
+ROLE_MAP = {
+    "system": "system",
+    "human": "user",
+    "user": "user",
+    "assistant": "assistant",
+    "ai": "assistant",
+}
+
+
+@dataclass
+class LLMResponse:
+    content: str
+    usage: Dict[str, float] = field(default_factory=dict)
+
+
+def to_chat_messages(messages: List[Tuple[str, str]]) -> List[Dict[str, str]]:
+    """Преобразует историю LangChain в список сообщений chat-шаблона"""
+    return [{"role": ROLE_MAP.get(role, role), "content": content} for role, content in messages]
+
+
+class LlamaCppBackend:
+    """
+    Локальный CPU-бэкенд на llama.cpp для дообученной модели в формате GGUF
+    (см. save_pretrained_gguf в llama3_2_(8b)_conversations_3.py, например q4_k_m или q8_0).
+
+    Системный промпт (role) прогоняется через модель один раз, состояние KV-кэша
+    сохраняется на диск и переиспользуется при следующих запусках.
+    """
+
+    # Модель и KV-кэш общие для всех запросов: LLMClient выполняет их по одному
+    concurrent = False
+
+    def __init__(self, model_path: str, system_prompt: Optional[str] = None,
+                 n_ctx: int = 4096, n_threads: Optional[int] = None,
+                 temperature: float = 0.2, max_tokens: int = 512,
+                 cache_dir: Optional[str] = "data/processed/kv_cache", verbose: bool = False):
+        from llama_cpp import Llama
+
+        self.model_path = model_path
+        self.temperature = temperature
+        self.max_tokens = max_tokens
+        self.verbose = verbose
+        self.last_stats: Dict[str, float] = {}
+
+        self.model = Llama(
+            model_path=model_path,
+            n_ctx=n_ctx,
+            n_threads=n_threads or os.cpu_count(),
+            verbose=False
+        )
+
+        if system_prompt:
+            self.warmup_prefix(system_prompt, cache_dir)
+
+    def warmup_prefix(self, system_prompt: str, cache_dir: Optional[str] = None):
+        """Заполняет KV-кэш системным промптом, загружая его с диска при наличии"""
+        state_path = None
+
+        if cache_dir:
+            key = hashlib.md5(
+                f"{os.path.abspath(self.model_path)}_{self.model.n_ctx()}_{system_prompt}".encode()
+            ).hexdigest()
+            state_path = os.path.join(cache_dir, f"prefix_{key}.pkl")
+
+            if os.path.exists(state_path):
+                with open(state_path, "rb") as f:
+                    self.model.load_state(pickle.load(f))
+                return
+
+        # Прогоняем только системное сообщение: chat-шаблон отрендерит его так же,
+        # как в начале каждого запроса, и вычисленный префикс будет переиспользован
+        start = time.perf_counter()
+        self.model.reset()
+        self.model.create_chat_completion(
+            messages=[{"role": "system", "content": system_prompt}],
+            max_tokens=1
+        )
+        self.last_stats = {
+            "prefix_tokens": self.model.n_tokens,
+            "prefix_seconds": time.perf_counter() - start
+        }
+
+        if state_path:
+            os.makedirs(cache_dir, exist_ok=True)
+            with open(state_path, "wb") as f:
+                pickle.dump(self.model.save_state(), f)
+
+    def invoke(self, messages: List[Tuple[str, str]]) -> LLMResponse:
+        # llama.cpp сам находит общий префикс с уже вычисленными токенами
+        # и прогоняет через модель только новую часть диалога.
+        # Ответ читается потоком, чтобы замерить время до первого токена
+        start = time.perf_counter()
+        first_token = None
+        parts = []
+        for chunk in self.model.create_chat_completion(
+            messages=to_chat_messages(messages),
+            temperature=self.temperature,
+            max_tokens=self.max_tokens,
+            stream=True
+        ):
+            content = chunk["choices"][0]["delta"].get("content")
+            if content:
+                if first_token is None:
+                    first_token = time.perf_counter()
+                parts.append(content)
+        elapsed = time.perf_counter() - start
+
+        # В потоковом режиме каждый фрагмент соответствует одному токену
+        completion_tokens = len(parts)
+        self.last_stats = {
+            "completion_tokens": completion_tokens,
+            "seconds": elapsed,
+            "ttft_ms": ((first_token or time.perf_counter()) - start) * 1000,
+            "tokens_per_second": completion_tokens / elapsed if elapsed > 0 else 0.0
+        }
+        if self.verbose:
+            print(f"[llm] {completion_tokens} токенов за {elapsed:.2f} с "
+                  f"({self.last_stats['tokens_per_second']:.1f} ток/с)")
+
+        return LLMResponse("".join(parts), dict(self.last_stats))
+
+
+class TransformersBackend:
+    """
+    Локальный бэкенд на transformers (или Unsloth для LoRA-модели из
+    llama3_2_(8b)_conversations_3.py) с переиспользованием KV-кэша системного промпта.
+    """
+
+    # Модель и KV-кэш общие для всех запросов: LLMClient выполняет их по одному
+    concurrent = False
+
+    def __init__(self, model_path: str, system_prompt: Optional[str] = None,
+                 use_unsloth: bool = False, max_seq_length: int = 2048,
+                 temperature: float = 0.2, max_tokens: int = 512,
+                 cache_dir: Optional[str] = "data/processed/kv_cache", verbose: bool = False):
+        from prefix_cache import PrefixKVCache
+
+        if use_unsloth:
+            from unsloth import FastLanguageModel
+
+            model, tokenizer = FastLanguageModel.from_pretrained(
+                model_name=model_path,
+                max_seq_length=max_seq_length,
+                load_in_4bit=True
+            )
+            FastLanguageModel.for_inference(model)
+        else:
+            from transformers import AutoModelForCausalLM, AutoTokenizer
+
+            tokenizer = AutoTokenizer.from_pretrained(model_path)
+            model = AutoModelForCausalLM.from_pretrained(model_path, torch_dtype="auto")
+            model.eval()
+
+        self.temperature = temperature
+        self.max_tokens = max_tokens
+        self.verbose = verbose
+        self.prefix_cache = PrefixKVCache(model, tokenizer, cache_dir)
+
+        if system_prompt:
+            self.prefix_cache.build([{"role": "system", "content": system_prompt}])
+
+    @property
+    def last_stats(self) -> Dict[str, float]:
+        return self.prefix_cache.last_stats
+
+    def invoke(self, messages: List[Tuple[str, str]]) -> LLMResponse:
+        content = self.prefix_cache.generate(
+            to_chat_messages(messages),
+            max_new_tokens=self.max_tokens,
+            do_sample=self.temperature > 0,
+            temperature=self.temperature if self.temperature > 0 else None
+        )
+        stats = self.last_stats
+        if self.verbose:
+            print(f"[llm] {stats['completion_tokens']} токенов за {stats['seconds']:.2f} с "
+                  f"({stats['tokens_per_second']:.1f} ток/с, из кэша {stats['cached_tokens']} "
+                  f"из {stats['prompt_tokens']} токенов промпта)")
+
+        return LLMResponse(content, dict(stats))
+
+
+# Один пул соединений на процесс: все сессии переиспользуют keep-alive соединения
+_http_session = None
+_http_session_lock = threading.Lock()
+
+
+def get_http_session(pool_size: int = 16):
+    global _http_session
+    with _http_session_lock:
+        if _http_session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+
+            _http_session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            _http_session.mount("https://", adapter)
+            _http_session.mount("http://", adapter)
+        return _http_session
+
+
+class HTTPChatBackend:
+    """
+    OpenAI-совместимый /chat/completions (в т.ч. Compressa) через общий пул
+    HTTP-соединений с таймаутами.
+    """
+
+    def __init__(self, api_key: str, base_url: str = "https://compressa-api.mil-team.ru/v1",
+                 model: Optional[str] = None, temperature: float = 0.2, max_tokens: int = 512,
+                 connect_timeout: float = 5.0, read_timeout: float = 60.0, pool_size: int = 16,
+                 stream: bool = False):
+        self.url = base_url.rstrip("/") + "/chat/completions"
+        self.headers = {
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json"
+        }
+        self.model = model
+        self.temperature = temperature
+        self.max_tokens = max_tokens
+        self.timeout = (connect_timeout, read_timeout)
+        self.stream = stream
+        self.session = get_http_session(pool_size)
+        self.last_stats: Dict[str, float] = {}
+
+    def invoke(self, messages: List[Tuple[str, str]]) -> LLMResponse:
+        import requests
+        from llm_client import LLMRequestError, RetryableLLMError
+
+        payload = {
+            "messages": to_chat_messages(messages),
+            "temperature": self.temperature,
+            "max_tokens": self.max_tokens,
+            "stream": self.stream
+        }
+        if self.model:
+            payload["model"] = self.model
+
+        start = time.perf_counter()
+        try:
+            response = self.session.post(
+                self.url, headers=self.headers, json=payload,
+                timeout=self.timeout, stream=self.stream
+            )
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            raise RetryableLLMError(str(e)) from e
+
+        if response.status_code == 429 or response.status_code >= 500:
+            raise RetryableLLMError(f"{response.status_code}: {response.text[:200]}")
+        if response.status_code >= 400:
+            raise LLMRequestError(f"{response.status_code}: {response.text[:200]}")
+
+        if self.stream:
+            return self._read_stream(response, start)
+
+        elapsed = time.perf_counter() - start
+        result = response.json()
+        usage = result.get("usage", {})
+        self.last_stats = {
+            "prompt_tokens": usage.get("prompt_tokens", 0),
+            "completion_tokens": usage.get("completion_tokens", 0),
+            "seconds": elapsed
+        }
+        return LLMResponse(result["choices"][0]["message"]["content"], dict(self.last_stats))
+
+    def _read_stream(self, response, start: float) -> LLMResponse:
+        """Читает ответ в формате server-sent events, замеряя время до первого токена"""
+        first_token = None
+        parts = []
+        with response:
+            for line in response.iter_lines(decode_unicode=True):
+                if not line or not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                choices = json.loads(data).get("choices") or [{}]
+                content = choices[0].get("delta", {}).get("content")
+                if content:
+                    if first_token is None:
+                        first_token = time.perf_counter()
+                    parts.append(content)
+
+        elapsed = time.perf_counter() - start
+        self.last_stats = {
+            "completion_tokens": len(parts),
+            "seconds": elapsed,
+            "ttft_ms": ((first_token or time.perf_counter()) - start) * 1000
+        }
+        return LLMResponse("".join(parts), dict(self.last_stats))
+
+
+class MockLLMBackend:
+    """
+    Локальная заглушка для тестов и бенчмарков: отвечает шаблонным текстом
+    с задержкой из заданного распределения, поддерживает пакетные запросы.
+    """
+
+    def __init__(self, answer: str = "Информация не найдена в моей базе. "
+                                     "Рекомендую обратиться к юристу для консультации.",
+                 latency_ms: float = 0, jitter_ms: float = 0, distribution: str = "fixed",
+                 batch_overhead: float = 0.1, failure_rate: float = 0.0, seed: Optional[int] = None):
+        self.answer = answer
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.distribution = distribution
+        self.batch_overhead = batch_overhead
+        self.failure_rate = failure_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.last_stats: Dict[str, float] = {}
+
+    def sample_latency(self) -> float:
+        """Задержка ответа в секундах"""
+        with self._lock:
+            if self.distribution == "normal":
+                ms = self._random.gauss(self.latency_ms, self.jitter_ms)
+            elif self.distribution == "lognormal":
+                # Медиана latency_ms, хвост определяется jitter_ms
+                sigma = self.jitter_ms / self.latency_ms if self.latency_ms else 0.0
+                ms = self.latency_ms * self._random.lognormvariate(0, sigma)
+            elif self.distribution == "uniform":
+                ms = self._random.uniform(self.latency_ms - self.jitter_ms, self.latency_ms + self.jitter_ms)
+            else:
+                ms = self.latency_ms
+            failed = self._random.random() < self.failure_rate
+            self.calls += 1
+        if failed:
+            from llm_client import RetryableLLMError
+            raise RetryableLLMError("mock failure")
+        return max(ms, 0.0) / 1000
+
+    def invoke(self, messages: List[Tuple[str, str]]) -> LLMResponse:
+        latency = self.sample_latency()
+        time.sleep(latency)
+        self.last_stats = {
+            "seconds": latency,
+            "ttft_ms": latency * 1000,
+            "completion_tokens": len(self.answer.split())
+        }
+        return LLMResponse(self.answer, dict(self.last_stats))
+
+    def invoke_batch(self, batch: List[List[Tuple[str, str]]]) -> List[LLMResponse]:
+        # Пакет стоит как самый долгий запрос плюс небольшая доля за каждый дополнительный
+        latencies = [self.sample_latency() for _ in batch]
+        latency = max(latencies) * (1 + self.batch_overhead * (len(batch) - 1))
+        time.sleep(latency)
+        self.last_stats = {"seconds": latency, "batch_size": len(batch)}
+        return [LLMResponse(self.answer, {"seconds": latency}) for _ in batch]
+
+
+def build_llm(api_key: str, config: Optional[Dict] = None, system_prompt: Optional[str] = None):
+    """Создает LLM по секции `llm` конфигурации (по умолчанию — Compressa)"""
+    config = dict(config or {})
+    backend = config.pop("backend", "compressa")
+    client_config = config.pop("client", None)
+    # Дополнительные промпты уже добавлены в system_prompt (см. LegalConsult)
+    config.pop("prompts", None)
+
+    if backend == "compressa":
+        from langchain_compressa import ChatCompressa
+
+        llm = ChatCompressa(
+            base_url=config.get("base_url", "https://compressa-api.mil-team.ru/v1"),
+            api_key=api_key,
+            temperature=config.get("temperature", 0.2),
+            max_tokens=config.get("max_tokens", 50),
+            stream="false"
+        )
+    elif backend == "http":
+        llm = HTTPChatBackend(api_key, **config)
+    elif backend == "llamacpp":
+        llm = LlamaCppBackend(system_prompt=system_prompt, **config)
+    elif backend == "transformers":
+        llm = TransformersBackend(system_prompt=system_prompt, **config)
+    elif backend == "mock":
+        llm = MockLLMBackend(**config)
+    else:
+        raise ValueError(f"Неизвестный LLM-бэкенд: {backend}")
+
+    if client_config is not None:
+        from llm_client import LLMClient
+
+        llm = LLMClient(llm, **client_config)
+
+    return llm
@@ -0,0 +1,187 @@
+"""
+Клиентский слой поверх LLM-бэкендов (см. llm_backends.py).
+
+LLMClient оборачивает любой бэкенд с методом invoke(messages) и добавляет:
+  - ограничение числа одновременных запросов;
+  - повторы с экспоненциальной задержкой и джиттером;
+  - хеджирование: дублирующий запрос, если первый не ответил за hedge_after_ms;
+  - пакетирование одновременных запросов, если бэкенд умеет invoke_batch.
+
+Параметры задаются подсекцией `client` секции `llm` конфига. Локальные бэкенды
+(concurrent = False: llama.cpp, transformers) не допускают одновременных вызовов:
+запросы к ним выполняются по одному, а хеджирование для них запрещено.
+"""
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from contextlib import nullcontext
+from typing import Callable, List, Optional, Tuple
+import queue
+import random
+import threading
+import time
+
+
+class LLMRequestError(Exception):
+    """Ошибка запроса, которую бессмысленно повторять (неверный ключ, формат и т.п.)"""
+
+
+class RetryableLLMError(Exception):
+    """Временная ошибка бэкенда (таймаут, 429, 5xx) — запрос можно повторить"""
+
+
+# Ошибки транспорта из клиентских библиотек (requests, httpx, openai) узнаются по имени класса,
+# чтобы не импортировать их здесь
+TRANSPORT_ERROR_NAMES = ("Timeout", "TimeoutException", "ConnectionError", "ConnectError",
+                         "TransportError", "APIConnectionError", "APITimeoutError")
+
+
+def is_retryable(error: BaseException) -> bool:
+    """Повторяются только временные ошибки: таймауты, обрывы соединения, 429 и 5xx"""
+    if isinstance(error, (RetryableLLMError, TimeoutError, ConnectionError)):
+        return True
+    status = getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+    if isinstance(status, int):
+        return status == 429 or status >= 500
+    return any(cls.__name__ in TRANSPORT_ERROR_NAMES for cls in type(error).__mro__)
+
+
+class LLMClient:
+    def __init__(self, backend, max_concurrency: int = 4, max_retries: int = 3,
+                 backoff_ms: float = 500, max_backoff_ms: float = 8000,
+                 hedge_after_ms: Optional[float] = None,
+                 batch_window_ms: float = 0, max_batch_size: int = 8):
+        if hedge_after_ms and not getattr(backend, "concurrent", True):
+            raise ValueError(f"Хеджирование не поддерживается для {type(backend).__name__}: "
+                             f"локальная модель обрабатывает запросы по одному")
+        self.backend = backend
+        self.max_retries = max_retries
+        self.backoff_ms = backoff_ms
+        self.max_backoff_ms = max_backoff_ms
+        self.hedge_after_ms = hedge_after_ms
+
+        self._semaphore = threading.BoundedSemaphore(max_concurrency)
+        # Вызовы локальной модели не должны пересекаться, даже если max_concurrency > 1
+        self._serial = nullcontext() if getattr(backend, "concurrent", True) else threading.Lock()
+        # Потоки нужны для хеджирования: исходный и дублирующий запросы идут параллельно
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_concurrency * 2,
+            thread_name_prefix="llm"
+        )
+        # Внешние задачи (элементы пакета) ждут семафор в отдельном пуле,
+        # чтобы не занимать потоки, нужные для самих запросов
+        self._dispatcher = ThreadPoolExecutor(
+            max_workers=max_concurrency,
+            thread_name_prefix="llm-dispatch"
+        )
+
+        self._batcher = None
+        if batch_window_ms > 0 and hasattr(backend, "invoke_batch"):
+            self._batcher = _MicroBatcher(self, batch_window_ms / 1000, max_batch_size)
+
+    @property
+    def last_stats(self):
+        return getattr(self.backend, "last_stats", {})
+
+    def invoke(self, messages: List[Tuple[str, str]]):
+        if self._batcher is not None:
+            return self._batcher.submit(messages).result()
+        return self.call(lambda: self.backend.invoke(messages))
+
+    def invoke_batch(self, batch: List[List[Tuple[str, str]]]):
+        """Отвечает на несколько независимых диалогов; пакетом, если бэкенд это поддерживает"""
+        if hasattr(self.backend, "invoke_batch"):
+            return self.call(lambda: self.backend.invoke_batch(batch))
+        futures = [self._dispatcher.submit(self.invoke, messages) for messages in batch]
+        return [future.result() for future in futures]
+
+    def call(self, fn: Callable):
+        """Выполняет запрос с ограничением параллелизма, повторами и хеджированием"""
+        attempt = 0
+        while True:
+            try:
+                with self._semaphore, self._serial:
+                    return self._hedged(fn)
+            except Exception as e:
+                # Ошибки разбора ответа и LLMRequestError детерминированы — повтор их не исправит
+                if isinstance(e, LLMRequestError) or not is_retryable(e) or attempt >= self.max_retries:
+                    raise
+                delay = min(self.max_backoff_ms, self.backoff_ms * 2 ** attempt)
+                time.sleep(random.uniform(delay / 2, delay) / 1000)
+                attempt += 1
+
+    def _hedged(self, fn: Callable):
+        if not self.hedge_after_ms:
+            return fn()
+
+        futures = {self._executor.submit(fn)}
+        done, _ = wait(futures, timeout=self.hedge_after_ms / 1000)
+        if not done:
+            futures.add(self._executor.submit(fn))
+
+        # Возвращаем первый успешный ответ; ошибку — только если упали оба запроса
+        error = None
+        while futures:
+            done, futures = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    def close(self):
+        if self._batcher is not None:
+            self._batcher.stop()
+        self._dispatcher.shutdown(wait=False)
+        self._executor.shutdown(wait=False)
+
+
+class _MicroBatcher:
+    """Собирает запросы, пришедшие в пределах окна, в один вызов invoke_batch"""
+
+    def __init__(self, client: LLMClient, window: float, max_batch_size: int):
+        self.client = client
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self._queue: "queue.Queue[Tuple[List[Tuple[str, str]], Future]]" = queue.Queue()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="llm-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, messages: List[Tuple[str, str]]) -> Future:
+        future: Future = Future()
+        self._queue.put((messages, future))
+        return future
+
+    def stop(self):
+        self._stopped.set()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                batch = [self._queue.get(timeout=0.1)]
+            except queue.Empty:
+                continue
+
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+
+            self.client._dispatcher.submit(self._dispatch, batch)
+
+    def _dispatch(self, batch):
+        try:
+            responses = self.client.call(
+                lambda: self.client.backend.invoke_batch([messages for messages, _ in batch])
+            )
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+
+        for (_, future), response in zip(batch, responses):
+            future.set_result(response)
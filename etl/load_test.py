@@ -0,0 +1,174 @@
+"""
+Нагрузочное тестирование воспроизведением сохраненных диалогов.
+
+Диалоги из data/processed/results/ разбираются в многошаговые сессии, которые
+запускаются параллельно с заданной интенсивностью (пуассоновский поток сессий)
+против LegalConsult. LLM подменяется локальной заглушкой с настраиваемым
+распределением задержки, так что измеряется собственная производительность
+сервиса: пропускная способность, перцентили задержки шага и рост памяти на сессию.
+
+Пример:
+    python etl/load_test.py --rate 5 --sessions 200 --llm-latency-ms 800 \\
+        --llm-jitter-ms 400 --llm-distribution lognormal
+"""
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Optional
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+
+from tracing import rss_mb
+from transcripts import RESULTS_DIR, iter_dialogs
+
+
+def load_sessions(results_dir: str = RESULTS_DIR) -> List[List[str]]:
+    """Вопросы клиента по сессиям; пустые диалоги пропускаются"""
+    return [
+        [turn['question'] for turn in dialog['turns']]
+        for dialog in iter_dialogs(results_dir)
+        if dialog['turns']
+    ]
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(q / 100 * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+def session_state_bytes(consult) -> int:
+    """Объем истории сессии — то, что сервис хранит на каждого клиента"""
+    return sum(len(content.encode('utf-8')) for _, content in consult.messages)
+
+
+class LoadTest:
+    def __init__(self, consult, sessions: List[List[str]], rate: float = 1.0, total_sessions: int = 100,
+                 max_concurrency: int = 64, think_time_ms: float = 0, seed: int = 0):
+        self.consult = consult
+        self.sessions = sessions
+        self.rate = rate
+        self.total_sessions = total_sessions
+        self.max_concurrency = max_concurrency
+        self.think_time_ms = think_time_ms
+        self._random = random.Random(seed)
+
+        self._lock = threading.Lock()
+        self.turn_latencies: List[float] = []
+        self.session_bytes: List[int] = []
+        self.errors = 0
+        self.active = 0
+        self.peak_active = 0
+
+    def _run_session(self, questions: List[str]):
+        session = self.consult.new_session()
+        with self._lock:
+            self.active += 1
+            self.peak_active = max(self.peak_active, self.active)
+        try:
+            for question in questions:
+                start = time.perf_counter()
+                try:
+                    session.get_answer(question)
+                except Exception:
+                    with self._lock:
+                        self.errors += 1
+                    continue
+                with self._lock:
+                    self.turn_latencies.append((time.perf_counter() - start) * 1000)
+                if self.think_time_ms:
+                    time.sleep(self.think_time_ms / 1000)
+        finally:
+            with self._lock:
+                self.active -= 1
+                self.session_bytes.append(session_state_bytes(session))
+
+    def run(self) -> Dict:
+        rss_before = rss_mb()
+        start = time.perf_counter()
+
+        with ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="session") as executor:
+            for i in range(self.total_sessions):
+                executor.submit(self._run_session, self.sessions[i % len(self.sessions)])
+                # Открытая модель нагрузки: интервалы между сессиями экспоненциальные
+                time.sleep(self._random.expovariate(self.rate))
+
+        elapsed = time.perf_counter() - start
+        rss_growth = rss_mb() - rss_before
+        turns = len(self.turn_latencies)
+
+        return {
+            "sessions": self.total_sessions,
+            "arrival_rate": self.rate,
+            "turns": turns,
+            "errors": self.errors,
+            "seconds": elapsed,
+            "throughput_turns_per_s": turns / elapsed if elapsed > 0 else 0.0,
+            "latency_p50_ms": percentile(self.turn_latencies, 50),
+            "latency_p95_ms": percentile(self.turn_latencies, 95),
+            "latency_p99_ms": percentile(self.turn_latencies, 99),
+            "latency_max_ms": max(self.turn_latencies, default=0.0),
+            "peak_active_sessions": self.peak_active,
+            "rss_growth_mb": rss_growth,
+            "rss_growth_per_session_kb": rss_growth * 1024 / self.total_sessions if self.total_sessions else 0.0,
+            "session_state_kb_mean": sum(self.session_bytes) / max(len(self.session_bytes), 1) / 1024
+        }
+
+
+def build_consult(config_path: Optional[str], llm_config: Dict):
+    """LegalConsult с заглушкой LLM вместо настроенного бэкенда"""
+    import yaml
+    from legal_consult import LegalConsult
+    from retrieval_qa import role
+
+    config = {}
+    if config_path and os.path.exists(config_path):
+        with open(config_path, 'r') as file:
+            config = yaml.safe_load(file) or {}
+    config["llm"] = llm_config
+    return LegalConsult(None, role, config)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Воспроизведение диалогов под нагрузкой")
+    parser.add_argument("--results-dir", default=RESULTS_DIR)
+    parser.add_argument("--config", default="configs/llm_config.yaml")
+    parser.add_argument("--rate", type=float, default=1.0, help="новых сессий в секунду")
+    parser.add_argument("--sessions", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--think-time-ms", type=float, default=0)
+    parser.add_argument("--llm-latency-ms", type=float, default=800)
+    parser.add_argument("--llm-jitter-ms", type=float, default=300)
+    parser.add_argument("--llm-distribution", choices=["fixed", "normal", "lognormal", "uniform"], default="lognormal")
+    parser.add_argument("--output-dir", default="data/processed/benchmarks")
+    args = parser.parse_args()
+
+    sessions = load_sessions(args.results_dir)
+    if not sessions:
+        sys.exit(f"В {args.results_dir} нет диалогов для воспроизведения")
+
+    consult = build_consult(args.config, {
+        "backend": "mock",
+        "latency_ms": args.llm_latency_ms,
+        "jitter_ms": args.llm_jitter_ms,
+        "distribution": args.llm_distribution
+    })
+    report = LoadTest(
+        consult, sessions,
+        rate=args.rate,
+        total_sessions=args.sessions,
+        max_concurrency=args.concurrency,
+        think_time_ms=args.think_time_ms
+    ).run()
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    output_path = os.path.join(args.output_dir, f"load_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
@@ -0,0 +1,201 @@
+"""
+Поиск с фильтрами по метаданным фрагментов.
+
+Для каждого поля из `fields` строятся битовые маски «значение → фрагменты»,
+для полей-дат из `date_fields` — массив дат для диапазонных условий. Фильтр
+собирается из масок (И между полями, ИЛИ между значениями одного поля) и
+передается внутрь поиска FAISS через IDSelectorBitmap, поэтому k ближайших
+ищутся только среди подходящих фрагментов, без дозапроса и отбрасывания.
+Если под фильтр попадает мало фрагментов, они перебираются точно. Редкие значения
+(номер статьи, имя файла) хранятся списком номеров фрагментов, а не маской на весь
+корпус, поэтому память индекса не растет как N × число значений.
+
+Пример фильтра (секция `retrieval.filters` задает поля):
+    {"status": "Действует", "doc_type": ["Федеральный закон", "Кодекс"],
+     "docdateIPS": {"from": "2005-03-01"}}
+"""
+from datetime import date, datetime
+from typing import Any, Dict, Iterable, List, Tuple
+
+import numpy as np
+
+DATE_FORMATS = ("%Y-%m-%d", "%d.%m.%Y", "%Y-%m-%dT%H:%M:%S", "%Y-%m-%d %H:%M:%S")
+
+
+def metadata_value(metadata: Dict, field: str) -> Any:
+    """Значение поля; вложенные поля RusLawOD задаются через точку (identification.status)"""
+    value = metadata
+    for part in field.split("."):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return value
+
+
+def parse_date(value: Any) -> np.datetime64:
+    if isinstance(value, (date, datetime)):
+        return np.datetime64(value.strftime("%Y-%m-%d"), "D")
+    if value:
+        for fmt in DATE_FORMATS:
+            try:
+                return np.datetime64(datetime.strptime(str(value).strip(), fmt).date(), "D")
+            except ValueError:
+                continue
+    return np.datetime64("NaT", "D")
+
+
+def set_bits(mask: np.ndarray, rows: np.ndarray):
+    """Выставляет биты rows в упакованной маске (bitorder little)"""
+    np.bitwise_or.at(mask, rows >> 3, np.left_shift(1, rows & 7).astype(np.uint8))
+
+
+class MetadataIndex:
+    def __init__(self, metadatas: List[Dict], fields: Iterable[str] = (), date_fields: Iterable[str] = ()):
+        self.size = len(metadatas)
+        # Значение поля → упакованная маска (uint8) или номера фрагментов (int32) для редких значений
+        self.bitmaps: Dict[str, Dict[str, np.ndarray]] = {}
+        self.dates: Dict[str, np.ndarray] = {}
+        nbytes = (self.size + 7) // 8
+
+        for field in fields:
+            rows: List[int] = []
+            keys: List[str] = []
+            for i, metadata in enumerate(metadatas):
+                value = metadata_value(metadata, field)
+                # Многозначные поля (classifier) — список или строка через запятую
+                values = value if isinstance(value, (list, tuple)) else \
+                    str(value).split(",") if field.endswith("classifier") and value else [value]
+                for item in values:
+                    if item is None or item == "":
+                        continue
+                    rows.append(i)
+                    keys.append(str(item).strip())
+
+            self.bitmaps[field] = {}
+            if not keys:
+                continue
+            names, inverse = np.unique(np.asarray(keys), return_inverse=True)
+            order = np.argsort(inverse, kind="stable")
+            grouped = np.asarray(rows, dtype=np.int64)[order]
+            bounds = np.concatenate([[0], np.cumsum(np.bincount(inverse, minlength=len(names)))])
+            for j, name in enumerate(names):
+                group = grouped[bounds[j]:bounds[j + 1]]
+                if group.size * 4 < nbytes:
+                    self.bitmaps[field][str(name)] = group.astype(np.int32)
+                else:
+                    # Частое значение — 1 бит на фрагмент
+                    mask = np.zeros(nbytes, dtype=np.uint8)
+                    set_bits(mask, group)
+                    self.bitmaps[field][str(name)] = mask
+
+        for field in date_fields:
+            self.dates[field] = np.array([parse_date(metadata_value(m, field)) for m in metadatas],
+                                         dtype="datetime64[D]")
+
+    def values(self, field: str) -> List[str]:
+        return sorted(self.bitmaps.get(field, {}))
+
+    def _field_mask(self, field: str, condition: Any) -> np.ndarray:
+        if field in self.dates:
+            if not isinstance(condition, dict):
+                condition = {"from": condition, "to": condition}
+            dates = self.dates[field]
+            mask = ~np.isnat(dates)
+            if condition.get("from"):
+                mask &= dates >= parse_date(condition["from"])
+            if condition.get("to"):
+                mask &= dates <= parse_date(condition["to"])
+            return np.packbits(mask, bitorder="little")
+
+        if field not in self.bitmaps:
+            raise KeyError(f"Поле {field} не проиндексировано для фильтрации")
+        bitmaps = self.bitmaps[field]
+        wanted = condition if isinstance(condition, (list, tuple, set)) else [condition]
+        mask = np.zeros((self.size + 7) // 8, dtype=np.uint8)
+        for value in wanted:
+            bitmap = bitmaps.get(str(value))
+            if bitmap is None:
+                continue
+            if bitmap.dtype == np.uint8:
+                mask |= bitmap
+            else:
+                set_bits(mask, bitmap)
+        return mask
+
+    def bitmap(self, filters: Dict[str, Any]) -> np.ndarray:
+        """Упакованная маска фрагментов (bitorder little, как ждет faiss.IDSelectorBitmap)"""
+        mask = np.full((self.size + 7) // 8, 0xFF, dtype=np.uint8)
+        for field, condition in filters.items():
+            mask &= self._field_mask(field, condition)
+        return mask
+
+    def ids(self, filters: Dict[str, Any]) -> np.ndarray:
+        return np.flatnonzero(np.unpackbits(self.bitmap(filters), count=self.size, bitorder="little"))
+
+
+def search_parameters(index, selector):
+    """Параметры поиска с селектором того типа, который ждет индекс (HNSW, IVF или плоский)"""
+    import faiss
+
+    index = faiss.downcast_index(index)
+    if isinstance(index, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=index.hnsw.efSearch)
+    try:
+        ivf = faiss.extract_index_ivf(index)
+    except RuntimeError:
+        ivf = None
+    if ivf is not None:
+        return faiss.SearchParametersIVF(sel=selector, nprobe=ivf.nprobe)
+    return faiss.SearchParameters(sel=selector)
+
+
+class FilteredSearch:
+    """Поиск по индексу FAISS из langchain-хранилища с фильтром внутри поиска"""
+
+    def __init__(self, vectorstore, fields: Iterable[str] = (), date_fields: Iterable[str] = (),
+                 exact_below: int = 256):
+        self.vectorstore = vectorstore
+        self.index = vectorstore.index
+        self.exact_below = exact_below
+        metadatas = [
+            vectorstore.docstore.search(vectorstore.index_to_docstore_id[i]).metadata
+            for i in range(self.index.ntotal)
+        ]
+        self.metadata_index = MetadataIndex(metadatas, fields, date_fields)
+
+    def _exact(self, vector: np.ndarray, ids: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        import faiss
+
+        candidates = self.index.reconstruct_batch(ids)
+        if self.index.metric_type == faiss.METRIC_INNER_PRODUCT:
+            scores = candidates @ vector
+            order = np.argsort(-scores)[:k]
+        else:
+            scores = ((candidates - vector) ** 2).sum(axis=1)
+            order = np.argsort(scores)[:k]
+        return scores[order], ids[order]
+
+    def search(self, vector: List[float], k: int, filters: Dict[str, Any]) -> List:
+        import faiss
+
+        vector = np.asarray(vector, dtype="float32")
+        bitmap = self.metadata_index.bitmap(filters)
+        selected = np.flatnonzero(np.unpackbits(bitmap, count=self.metadata_index.size, bitorder="little"))
+        if len(selected) == 0:
+            return []
+
+        ids = None
+        if len(selected) <= self.exact_below:
+            # Графовые и IVF-индексы теряют полноту на очень узких фильтрах — перебираем точно
+            try:
+                _, ids = self._exact(vector, selected, k)
+            except RuntimeError:
+                # Индекс без восстановления векторов (IVF без direct map)
+                ids = None
+        if ids is None:
+            selector = faiss.IDSelectorBitmap(self.metadata_index.size, faiss.swig_ptr(bitmap))
+            _, found = self.index.search(vector[None, :], k, params=search_parameters(self.index, selector))
+            ids = found[0][found[0] >= 0]
+
+        docstore, mapping = self.vectorstore.docstore, self.vectorstore.index_to_docstore_id
+        return [docstore.search(mapping[int(i)]) for i in ids]
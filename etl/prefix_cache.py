@@ -0,0 +1,136 @@
+"""
+Кэширование KV-префикса для локальных HF-моделей (pipeline из RAG-ноутбука, Unsloth).
+
+Системный промпт (role) и few-shot примеры из etl/prompts/ одинаковы для всех
+консультаций, поэтому их ключи/значения внимания вычисляются один раз. На каждом
+шаге диалога модель обрабатывает только новые токены после закэшированного префикса.
+"""
+from typing import Dict, List, Optional, Tuple
+import copy
+import hashlib
+import os
+import time
+
+PROMPTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "prompts")
+
+
+def load_prompt(name: str, prompts_dir: str = PROMPTS_DIR) -> str:
+    """Читает промпт из etl/prompts/"""
+    with open(os.path.join(prompts_dir, name), "r", encoding="utf-8") as f:
+        return f.read().strip()
+
+
+def compose_system_prompt(role: str, prompt_names: Optional[List[str]] = None,
+                          prompts_dir: str = PROMPTS_DIR) -> str:
+    """Склеивает role и дополнительные промпты (например, few-shot) в одно системное сообщение"""
+    parts = [role.strip()]
+    for name in prompt_names or []:
+        parts.append(load_prompt(name, prompts_dir))
+    return "\n\n".join(parts)
+
+
+class PrefixKVCache:
+    """
+    Снимки KV-кэша для фиксированных префиксов диалога.
+
+    Снимок строится по сообщениям-префиксу (обычно одно системное сообщение),
+    хранится в памяти и, при заданном cache_dir, на диске. Перед генерацией
+    снимок копируется, т.к. generate дописывает в кэш новые токены.
+    """
+
+    def __init__(self, model, tokenizer, cache_dir: Optional[str] = None):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.cache_dir = cache_dir
+        self.snapshots: Dict[str, Tuple[List[int], object]] = {}
+        self.last_stats: Dict[str, float] = {}
+
+    def _render(self, messages: List[Dict[str, str]], add_generation_prompt: bool) -> List[int]:
+        return self.tokenizer.apply_chat_template(
+            messages,
+            tokenize=True,
+            add_generation_prompt=add_generation_prompt
+        )
+
+    def _snapshot_path(self, key: str) -> Optional[str]:
+        if not self.cache_dir:
+            return None
+        return os.path.join(self.cache_dir, f"hf_prefix_{key}.pt")
+
+    def build(self, prefix_messages: List[Dict[str, str]]) -> str:
+        """Вычисляет (или загружает с диска) снимок KV-кэша для префикса, возвращает его ключ"""
+        import torch
+        from transformers import DynamicCache
+
+        ids = self._render(prefix_messages, add_generation_prompt=False)
+        key = hashlib.md5(
+            f"{self.model.config.name_or_path}_{ids}".encode()
+        ).hexdigest()
+        if key in self.snapshots:
+            return key
+
+        path = self._snapshot_path(key)
+        if path and os.path.exists(path):
+            legacy = torch.load(path, map_location=self.model.device)
+            self.snapshots[key] = (ids, DynamicCache.from_legacy_cache(legacy))
+            return key
+
+        start = time.perf_counter()
+        cache = DynamicCache()
+        with torch.no_grad():
+            cache = self.model(
+                input_ids=torch.tensor([ids], device=self.model.device),
+                past_key_values=cache,
+                use_cache=True
+            ).past_key_values
+        self.last_stats = {
+            "prefix_tokens": len(ids),
+            "prefix_seconds": time.perf_counter() - start
+        }
+        self.snapshots[key] = (ids, cache)
+
+        if path:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            torch.save(cache.to_legacy_cache(), path)
+
+        return key
+
+    def _longest_snapshot(self, ids: List[int]):
+        best = None
+        for prefix_ids, cache in self.snapshots.values():
+            # Снимок применим, только если префикс строго короче запроса:
+            # хотя бы один токен должен пройти через модель для получения логитов
+            if len(prefix_ids) < len(ids) and ids[:len(prefix_ids)] == prefix_ids:
+                if best is None or len(prefix_ids) > len(best[0]):
+                    best = (prefix_ids, cache)
+        return best
+
+    def generate(self, messages: List[Dict[str, str]], **generate_kwargs) -> str:
+        """Генерирует ответ, переиспользуя подходящий снимок префикса"""
+        import torch
+
+        ids = self._render(messages, add_generation_prompt=True)
+        input_ids = torch.tensor([ids], device=self.model.device)
+
+        snapshot = self._longest_snapshot(ids)
+        if snapshot is not None:
+            generate_kwargs["past_key_values"] = copy.deepcopy(snapshot[1])
+
+        start = time.perf_counter()
+        with torch.no_grad():
+            output = self.model.generate(
+                input_ids=input_ids,
+                attention_mask=torch.ones_like(input_ids),
+                **generate_kwargs
+            )
+        elapsed = time.perf_counter() - start
+
+        new_tokens = output[0][len(ids):]
+        self.last_stats = {
+            "prompt_tokens": len(ids),
+            "cached_tokens": len(snapshot[0]) if snapshot else 0,
+            "completion_tokens": len(new_tokens),
+            "seconds": elapsed,
+            "tokens_per_second": len(new_tokens) / elapsed if elapsed > 0 else 0.0
+        }
+        return self.tokenizer.decode(new_tokens, skip_special_tokens=True)
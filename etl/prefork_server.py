@@ -0,0 +1,367 @@
+"""
+Pre-fork сервер консультаций.
+
+Мастер один раз загружает модель эмбеддингов и индекс FAISS, открывает индекс
+через mmap только для чтения (IndexFlat и IVF-Flat, до построения обвязок поиска),
+прогревает их, замораживает объекты для сборщика мусора (gc.freeze) и форкает воркеров.
+Страницы модели и индекса остаются общими (copy-on-write), у каждого воркера
+свои только LLM-клиент, сессии и запись транскриптов.
+
+Воркеры принимают соединения с общего слушающего сокета. Соединение HTTP/1.1
+(keep-alive) обслуживается одним воркером, поэтому сессия держится на нем же.
+С секцией `sessions` конфига история хранится вне процесса (см. session_store.py)
+и сессию продолжает любой воркер.
+    POST /answer  {"session": "...", "question": "...", "filters": {...}}
+    GET  /stats   память и число сессий воркера
+    GET  /document/<pravogovruNd>  полный текст акта (секция `documents` конфига)
+
+Мастер перезапускает упавших воркеров и раз в report_interval_s печатает
+память каждого (RSS, PSS, общие и собственные страницы). Воркер, проработавший
+меньше min_uptime_s, считается упавшим при запуске: его перезапуск откладывается
+с экспоненциальной задержкой, а после max_fast_crashes таких падений подряд мастер
+останавливает остальных воркеров и завершается с кодом 1.
+
+Пример:
+    python etl/prefork_server.py --workers 4 --port 8080
+"""
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from urllib.parse import unquote
+import argparse
+import gc
+import json
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+import traceback
+import uuid
+
+from tracing import rss_mb
+from transcript_sink import TranscriptSink
+
+
+def memory_mb(pid="self") -> Dict[str, float]:
+    """RSS, PSS и разбивка на общие/собственные страницы процесса (Linux, smaps_rollup)"""
+    fields = {"Rss": "rss_mb", "Pss": "pss_mb", "Shared_Clean": "shared_clean_mb",
+              "Shared_Dirty": "shared_dirty_mb", "Private_Clean": "private_clean_mb",
+              "Private_Dirty": "private_dirty_mb"}
+    result = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                name, _, value = line.partition(":")
+                if name in fields:
+                    result[fields[name]] = int(value.split()[0]) / 1024
+    except FileNotFoundError:
+        result["rss_mb"] = rss_mb(pid)
+    return result
+
+
+def limit_threads(threads: int):
+    """Ограничивает пулы потоков torch: потоки OpenMP мастера не переживают fork"""
+    try:
+        import torch
+    except ImportError:
+        return
+    torch.set_num_threads(threads)
+
+
+def read_index_mmap(path: str):
+    """Индекс, векторы которого отображены из файла; None — тип индекса или версия FAISS этого не позволяют"""
+    import faiss
+
+    # IO_FLAG_MMAP отображает только списки IVF, векторы IndexFlat он читает в кучу
+    flag = getattr(faiss, "IO_FLAG_MMAP_IFC", None)
+    if flag is None:
+        return None
+    try:
+        index = faiss.read_index(path, flag | faiss.IO_FLAG_READ_ONLY)
+    except RuntimeError:
+        return None
+    # Остальные типы индексов читаются с этим флагом в кучу — выгоды от замены нет
+    if not isinstance(faiss.downcast_index(index), (faiss.IndexFlat, faiss.IndexIVFFlat)):
+        return None
+    return index
+
+
+def remap_index_readonly(vectorstore, path: str) -> bool:
+    """Заменяет индекс в памяти на отображение файла; False — индекс остался в куче.
+
+    Вызывается до build_retriever: обвязки поиска (фильтры, иерархия, ссылки) запоминают индекс.
+    """
+    if not hasattr(vectorstore, "index"):
+        return False
+    index = read_index_mmap(path)
+    if index is None:
+        # Копия в куче мастера все равно разделяется воркерами до первой записи
+        return False
+    vectorstore.index = index
+    return True
+
+
+class SessionPool:
+    """Сессии воркера; самые давние вытесняются при превышении max_sessions"""
+
+    def __init__(self, consult, max_sessions: int = 1000):
+        self.consult = consult
+        self.max_sessions = max_sessions
+        self._sessions: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id: Optional[str]):
+        session_id = session_id or str(uuid.uuid4())[:8]
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                entry = (self.consult.new_session(session_id), threading.Lock())
+                self._sessions[session_id] = entry
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+            self._sessions.move_to_end(session_id)
+        return entry
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+
+class ConsultHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    sessions: SessionPool = None
+    sink: TranscriptSink = None
+
+    def _send(self, status: int, payload: Dict):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.startswith("/document/"):
+            document = self.sessions.consult.source_document(unquote(self.path[len("/document/"):]))
+            if document is None:
+                return self._send(404, {"error": "документ не найден"})
+            return self._send(200, document)
+        if self.path != "/stats":
+            return self._send(404, {"error": "not found"})
+        self._send(200, {"pid": os.getpid(), "sessions": len(self.sessions), **memory_mb()})
+
+    def do_POST(self):
+        if self.path != "/answer":
+            return self._send(404, {"error": "not found"})
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            question = request["question"]
+        except (ValueError, KeyError):
+            return self._send(400, {"error": "ожидается JSON с полем question"})
+
+        session, lock = self.sessions.get(request.get("session"))
+        with lock:
+            try:
+                answer = session.get_answer(question, request.get("filters"))
+            except Exception as e:
+                traceback.print_exc()
+                return self._send(500, {"error": str(e)})
+            try:
+                self.sink.write_turn(session.session_id, session.turn, question, answer,
+                                     chunk_ids=session.last_chunk_ids, timings=session.last_timings)
+            except RuntimeError as e:
+                # Ответ уже получен: сбой записи транскрипта не должен его терять
+                print(e, flush=True)
+            self._send(200, {
+                "session": session.session_id,
+                "answer": answer,
+                "sources": session.last_sources,
+                "timings_ms": session.last_timings,
+                "route": session.last_route,
+                "worker": os.getpid()
+            })
+
+    def log_message(self, format, *args):
+        pass
+
+
+class PreforkServer:
+    def __init__(self, api_key: str, role: str, config: Optional[Dict] = None, host: str = "127.0.0.1",
+                 port: int = 8080, workers: int = 4, threads_per_worker: int = 1, max_sessions: int = 1000,
+                 report_interval_s: float = 60, restart_delay_s: float = 0.5, max_restart_delay_s: float = 30,
+                 min_uptime_s: float = 10, max_fast_crashes: int = 5):
+        self.api_key = api_key
+        self.role = role
+        self.config = dict(config or {})
+        self.address = (host, port)
+        self.workers = workers
+        self.threads_per_worker = threads_per_worker
+        self.max_sessions = max_sessions
+        self.report_interval_s = report_interval_s
+        self.restart_delay_s = restart_delay_s
+        self.max_restart_delay_s = max_restart_delay_s
+        self.min_uptime_s = min_uptime_s
+        self.max_fast_crashes = max_fast_crashes
+        self.pids: List[int] = []
+        self._started: Dict[int, float] = {}
+        self._respawn_at: List[float] = []
+        self._fast_crashes = 0
+        self._crash_loop = False
+        self._stopping = False
+
+        if self.config.get("shards"):
+            raise ValueError("Шардированный индекс уже работает в своих процессах и не форкается вместе с мастером")
+        if self.config.get("index_registry"):
+            # Поток слежения за реестром не переживает fork — каждый воркер запускает свой
+            self.config["index_registry"] = dict(self.config["index_registry"], watch=False)
+        embeddings_config = dict(self.config.get("embeddings") or {})
+        if embeddings_config.get("backend") == "onnx":
+            # Пул потоков ONNX Runtime не переживает fork; с одним потоком вычисления идут в вызывающем
+            embeddings_config["num_threads"] = 1
+            self.config["embeddings"] = embeddings_config
+
+    def load(self):
+        from legal_consult import LegalConsult
+
+        limit_threads(1)
+        self.consult = LegalConsult(self.api_key, self.role, self.config, defer_llm=True, mmap_index=True)
+        mapped = self.consult.index_mmap
+        self.consult.warmup()
+        # Объекты мастера больше не обходятся сборщиком мусора, их страницы не копируются при записи
+        gc.collect()
+        gc.freeze()
+
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.socket.bind(self.address)
+        self.socket.listen(128)
+        print(json.dumps({"event": "master_ready", "pid": os.getpid(), "index_mmap": mapped,
+                          **memory_mb()}, ensure_ascii=False), flush=True)
+
+    def _spawn(self) -> int:
+        pid = os.fork()
+        if pid:
+            return pid
+        code = 0
+        try:
+            self._serve()
+        except BaseException:
+            traceback.print_exc()
+            code = 1
+        finally:
+            os._exit(code)
+
+    def _start_worker(self):
+        pid = self._spawn()
+        self.pids.append(pid)
+        self._started[pid] = time.monotonic()
+
+    def _worker_exited(self, pid: int, status: int):
+        uptime = time.monotonic() - self._started.pop(pid)
+        # Счетчик сбрасывает только воркер, успевший поработать
+        self._fast_crashes = self._fast_crashes + 1 if uptime < self.min_uptime_s else 0
+        delay = min(self.max_restart_delay_s, self.restart_delay_s * 2 ** (self._fast_crashes - 1)) \
+            if self._fast_crashes else 0.0
+        print(json.dumps({"event": "worker_exit", "pid": pid, "code": os.waitstatus_to_exitcode(status),
+                          "uptime_s": round(uptime, 1), "restart_in_s": delay}), flush=True)
+        if self._fast_crashes >= self.max_fast_crashes:
+            print(f"Воркеры падают при запуске {self._fast_crashes} раз подряд, сервер останавливается",
+                  file=sys.stderr, flush=True)
+            self._crash_loop = True
+            self.stop()
+            return
+        self._respawn_at.append(time.monotonic() + delay)
+
+    def _serve(self):
+        limit_threads(self.threads_per_worker)
+        self.consult.load_llm()
+        if hasattr(self.consult.vectorstore, "start_watching"):
+            self.consult.vectorstore.start_watching()
+
+        sink = TranscriptSink(**(self.config.get("transcripts") or {}))
+        handler = type("Handler", (ConsultHandler,), {
+            "sessions": SessionPool(self.consult, self.max_sessions),
+            "sink": sink
+        })
+        server = ThreadingHTTPServer(self.address, handler, bind_and_activate=False)
+        server.socket.close()
+        server.socket = self.socket
+
+        # shutdown() ждет выхода из serve_forever, поэтому вызывается не из обработчика сигнала
+        def shutdown(*_):
+            threading.Thread(target=server.shutdown, daemon=True).start()
+
+        signal.signal(signal.SIGTERM, shutdown)
+        signal.signal(signal.SIGINT, shutdown)
+        print(json.dumps({"event": "worker_ready", "pid": os.getpid(), **memory_mb()}, ensure_ascii=False),
+              flush=True)
+        try:
+            server.serve_forever()
+        finally:
+            sink.close()
+
+    def report(self):
+        workers = [{"pid": pid, **memory_mb(pid)} for pid in self.pids]
+        print(json.dumps({"event": "memory", "master": memory_mb(), "workers": workers}, ensure_ascii=False),
+              flush=True)
+
+    def stop(self, *_):
+        self._stopping = True
+        for pid in self.pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def run(self):
+        self.load()
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        for _ in range(self.workers):
+            self._start_worker()
+
+        last_report = time.monotonic()
+        while self.pids or (self._respawn_at and not self._stopping):
+            pid, status = os.waitpid(-1, os.WNOHANG) if self.pids else (0, 0)
+            if pid:
+                self.pids.remove(pid)
+                if self._stopping:
+                    self._started.pop(pid, None)
+                else:
+                    self._worker_exited(pid, status)
+                continue
+            now = time.monotonic()
+            if not self._stopping and self._respawn_at and min(self._respawn_at) <= now:
+                self._respawn_at.remove(min(self._respawn_at))
+                self._start_worker()
+                continue
+            if not self._stopping and now - last_report >= self.report_interval_s:
+                self.report()
+                last_report = now
+            time.sleep(0.2)
+        return 1 if self._crash_loop else 0
+
+
+if __name__ == "__main__":
+    from retrieval_qa import load_config, load_yaml_to_env, role
+
+    parser = argparse.ArgumentParser(description="Pre-fork сервер консультаций")
+    parser.add_argument("--config", default="configs/llm_config.yaml")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--threads-per-worker", type=int, default=1)
+    parser.add_argument("--max-sessions", type=int, default=1000)
+    parser.add_argument("--report-interval-s", type=float, default=60)
+    parser.add_argument("--max-fast-crashes", type=int, default=5)
+    args = parser.parse_args()
+
+    load_yaml_to_env(args.config)
+    server = PreforkServer(
+        os.getenv('API_COMPRESSA_KEY'), role, load_config(args.config),
+        host=args.host, port=args.port, workers=args.workers,
+        threads_per_worker=args.threads_per_worker, max_sessions=args.max_sessions,
+        report_interval_s=args.report_interval_s, max_fast_crashes=args.max_fast_crashes
+    )
+    sys.exit(server.run())
@@ -0,0 +1,91 @@
+"""
+Переранжирование кандидатов из FAISS кросс-энкодером на CPU.
+
+Плотный поиск (MiniLM) выбирает fetch_k кандидатов, кросс-энкодер оценивает пары
+(вопрос, фрагмент) пакетами, пока не исчерпан бюджет времени. Неоцененные
+кандидаты остаются в плотном порядке после оцененных.
+"""
+from typing import Dict, List, Optional, Sequence
+import time
+
+DEFAULT_RERANKER = "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1"
+
+
+class CrossEncoderReranker:
+    def __init__(self, model_name: str = DEFAULT_RERANKER, batch_size: int = 16,
+                 budget_ms: float = 200, max_length: int = 512, device: str = "cpu"):
+        from sentence_transformers import CrossEncoder
+
+        self.model = CrossEncoder(model_name, max_length=max_length, device=device)
+        self.batch_size = batch_size
+        self.budget_ms = budget_ms
+        self.last_stats: Dict[str, float] = {}
+
+    def rerank(self, query: str, docs: List, k: Optional[int] = None) -> List:
+        """Возвращает документы в порядке убывания релевантности (не более k)"""
+        start = time.perf_counter()
+        deadline = start + self.budget_ms / 1000
+        scores: List[float] = []
+
+        for i in range(0, len(docs), self.batch_size):
+            # Первый пакет оцениваем всегда, дальше — только пока укладываемся в бюджет
+            if scores and time.perf_counter() >= deadline:
+                break
+            batch = docs[i:i + self.batch_size]
+            scores.extend(
+                self.model.predict(
+                    [(query, doc.page_content) for doc in batch],
+                    batch_size=self.batch_size,
+                    show_progress_bar=False
+                ).tolist()
+            )
+
+        scored = len(scores)
+        order = sorted(range(scored), key=lambda i: scores[i], reverse=True)
+        ranked = [docs[i] for i in order] + docs[scored:]
+
+        self.last_stats = {
+            "rerank_ms": (time.perf_counter() - start) * 1000,
+            "candidates": len(docs),
+            "scored": scored,
+            "fallback": scored < len(docs)
+        }
+        return ranked[:k] if k else ranked
+
+
+def recall_at_k(retrieved: Sequence[str], relevant: Sequence[str], k: int) -> float:
+    """Доля релевантных идентификаторов, попавших в первые k результатов"""
+    if not relevant:
+        return 0.0
+    top = set(retrieved[:k])
+    return sum(1 for item in relevant if item in top) / len(relevant)
+
+
+def evaluate_reranking(pipeline, queries: List[Dict], k: int = 2, key: str = "article") -> Dict[str, float]:
+    """
+    Сравнивает плотный порядок и переранжирование на размеченных вопросах.
+
+    queries: [{"question": "...", "relevant": ["Статья 26. ..."]}], где relevant —
+    значения поля metadata[key] релевантных фрагментов.
+    """
+    dense_recall, rerank_recall, dense_ms, rerank_ms = [], [], [], []
+
+    for item in queries:
+        candidates = pipeline.dense_search(item["question"])
+        dense_ms.append(pipeline.last_stats["dense_ms"])
+        dense_ids = [doc.metadata.get(key) for doc in candidates]
+        dense_recall.append(recall_at_k(dense_ids, item["relevant"], k))
+
+        reranked = pipeline.reranker.rerank(item["question"], candidates)
+        rerank_ms.append(pipeline.reranker.last_stats["rerank_ms"])
+        rerank_ids = [doc.metadata.get(key) for doc in reranked]
+        rerank_recall.append(recall_at_k(rerank_ids, item["relevant"], k))
+
+    n = max(len(queries), 1)
+    return {
+        f"dense_recall@{k}": sum(dense_recall) / n,
+        f"rerank_recall@{k}": sum(rerank_recall) / n,
+        "dense_ms_mean": sum(dense_ms) / n,
+        "rerank_ms_mean": sum(rerank_ms) / n,
+        "rerank_ms_max": max(rerank_ms, default=0.0)
+    }
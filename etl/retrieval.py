@@ -0,0 +1,114 @@
+"""
+Конвейер поиска контекста для LegalConsult.
+
+Плотный поиск по FAISS выбирает fetch_k кандидатов, затем (если включен)
+кросс-энкодер переранжирует их и оставляет k лучших. Из этих k фрагментов
+ContextPacker набирает контекст в пределах бюджета токенов. Параметры задаются
+секцией `retrieval` конфига; подсекция `filters` включает поиск с фильтрами
+по метаданным (см. metadata_filter.py), подсекция `hierarchy` — двухэтапный
+поиск по статьям и их фрагментам (см. hierarchical_retrieval.py), подсекция
+`references` — добавление статей, на которые ссылаются найденные (см. article_graph.py).
+"""
+from typing import Any, Dict, List, Optional
+import time
+
+from tracing import Tracer
+
+
+class RetrievalPipeline:
+    def __init__(self, vectorstore, k: int = 8, fetch_k: int = 30, reranker=None,
+                 tracer: Optional[Tracer] = None, filtered_search=None, expander=None):
+        self.vectorstore = vectorstore
+        self.filtered_search = filtered_search
+        self.expander = expander
+        self.tracer = tracer or Tracer()
+        self.k = k
+        # Без переранжирования нет смысла забирать больше k кандидатов
+        self.fetch_k = max(fetch_k, k) if reranker is not None else k
+        self.reranker = reranker
+        self.last_stats: Dict[str, float] = {}
+
+    def embed_query(self, query: str) -> List[float]:
+        with self.tracer.span("embed_query"):
+            return self.vectorstore.embeddings.embed_query(query)
+
+    def dense_search(self, query: str, filters: Optional[Dict[str, Any]] = None,
+                     vector: Optional[List[float]] = None) -> List:
+        """vector — уже посчитанный эмбеддинг запроса (например, после поиска по архиву)"""
+        if filters and self.filtered_search is None:
+            raise ValueError("Фильтры не настроены: добавьте секцию retrieval.filters")
+        start = time.perf_counter()
+        if vector is None:
+            vector = self.embed_query(query)
+        with self.tracer.span("faiss_search"):
+            if filters:
+                docs = self.filtered_search.search(vector, self.fetch_k, filters)
+            else:
+                docs = self.vectorstore.similarity_search_by_vector(vector, k=self.fetch_k)
+        self.last_stats = {"dense_ms": (time.perf_counter() - start) * 1000}
+        return docs
+
+    def retrieve(self, query: str, filters: Optional[Dict[str, Any]] = None,
+                 vector: Optional[List[float]] = None) -> List:
+        docs = self.dense_search(query, filters, vector)
+        if self.reranker is not None:
+            with self.tracer.span("rerank"):
+                docs = self.reranker.rerank(query, docs, self.k)
+            self.last_stats.update(self.reranker.last_stats)
+        docs = docs[:self.k]
+        if self.expander is not None:
+            # Статьи, на которые ссылаются найденные, добавляются после них
+            with self.tracer.span("reference_expand"):
+                docs = self.expander.expand(docs)
+        return docs
+
+
+def build_retriever(vectorstore, config: Optional[Dict] = None,
+                    tracer: Optional[Tracer] = None) -> RetrievalPipeline:
+    """Создает конвейер поиска по секции `retrieval` конфига"""
+    config = dict(config or {})
+    reranker_config = config.pop("reranker", None)
+    filters_config = config.pop("filters", None)
+    hierarchy_config = config.pop("hierarchy", None)
+    references_config = config.pop("references", None)
+
+    # Фильтры, ссылки и двухэтапный поиск читают docstore langchain FAISS; ShardedIndex
+    # и HotSwapIndex его не имеют (HotSwapIndex сам строит только фильтры)
+    unsupported = [name for name, section in (("filters", filters_config), ("references", references_config),
+                                              ("hierarchy", hierarchy_config))
+                   if section is not None and not hasattr(vectorstore, "docstore")
+                   and not (name == "filters" and hasattr(vectorstore, "enable_filters"))]
+    if unsupported:
+        raise ValueError(f"Секции retrieval.{', retrieval.'.join(unsupported)} не поддерживаются "
+                         f"для {type(vectorstore).__name__}: нужен индекс langchain FAISS")
+
+    reranker = None
+    if reranker_config is not None:
+        from reranker import CrossEncoderReranker
+
+        reranker = CrossEncoderReranker(**reranker_config)
+
+    filtered_search = None
+    if filters_config is not None and hasattr(vectorstore, "enable_filters"):
+        # HotSwapIndex строит фильтры для каждой своей версии
+        vectorstore.enable_filters(filters_config)
+        filtered_search = vectorstore
+    elif filters_config is not None:
+        from metadata_filter import FilteredSearch
+
+        filtered_search = FilteredSearch(vectorstore, **filters_config)
+
+    expander = None
+    if references_config is not None:
+        from article_graph import ReferenceExpander
+
+        expander = ReferenceExpander(vectorstore, **references_config)
+
+    if hierarchy_config is not None:
+        # Поиск с фильтрами по-прежнему идет по исходному индексу фрагментов
+        from hierarchical_retrieval import HierarchicalSearch
+
+        vectorstore = HierarchicalSearch(vectorstore, **hierarchy_config)
+
+    return RetrievalPipeline(vectorstore, reranker=reranker, tracer=tracer,
+                             filtered_search=filtered_search, expander=expander, **config)
@@ -1,17 +1,19 @@
-from langchain_community.document_loaders import CSVLoader, TextLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_community.vectorstores import FAISS
-from langchain.chains import RetrievalQA
-from datetime import datetime
-# from data_loader import load_data
-import sys
-from legal_consult import LegalConsult
-from dotenv import load_dotenv
-import yaml
+"""
+Консольный диалог с консультантом.
+
+Модули с тяжелыми зависимостями (langchain, torch, FAISS) не импортируются при
+старте: LegalConsult создается и прогревается в фоновом потоке, пока клиент
+вводит первый вопрос. Время импорта проверяется etl/startup_report.py.
+"""
+from concurrent.futures import ThreadPoolExecutor
 import os
 import uuid
 
+import yaml
+
+from transcript_sink import TranscriptSink
+
+
 def load_yaml_to_env(yaml_path):
     with open(yaml_path, 'r') as file:
         secrets = yaml.safe_load(file)
@@ -19,6 +21,12 @@ def load_yaml_to_env(yaml_path):
     os.environ['API_COMPRESSA_KEY'] = secrets['api_keys']['compressa']
 
 
+def load_config(yaml_path):
+    """Конфиг целиком: секции `llm`, `retrieval`, `context`, `tracing`, `transcripts` необязательны"""
+    with open(yaml_path, 'r') as file:
+        return yaml.safe_load(file) or {}
+
+
 role = """
 Ты — профессиональный юридический консультант для граждан РФ. Отвечай строго на основе предоставленного контекста (нормативных документов и архивов консультаций). 
 
@@ -54,45 +62,71 @@ role = """
 }
 """
 
-def dialog(api_key, role):
-    consult = LegalConsult(api_key, role)
+def start_consult(api_key, role, config=None, session_id=None):
+    """Загружает индекс и модели и прогоняет пробный поиск"""
+    from legal_consult import LegalConsult
 
-    # Создаем уникальное имя файла с timestamp
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    unique_id = str(uuid.uuid4())[:8]
-    result_dir = 'data/processed/results/'
-    result_filename = f"dialog_{timestamp}_{unique_id}.txt"
-    result_path = os.path.join(result_dir, result_filename)
-    
-    # Создаем директорию если нужно
-    os.makedirs(os.path.dirname(result_path), exist_ok=True)
-    
-    with open(result_path, 'w', encoding='utf-8') as f:
+    consult = LegalConsult(api_key, role, config, session_id=session_id)
+    consult.warmup()
+    return consult
+
+
+def dialog(api_key, role, config=None, sink=None):
+    config = config or {}
+    session_id = str(uuid.uuid4())[:8]
+
+    # Индекс и модели загружаются в фоне, пока показано приглашение
+    loader = ThreadPoolExecutor(max_workers=1, thread_name_prefix="warmup")
+    pending = loader.submit(start_consult, api_key, role, config, session_id)
+    loader.shutdown(wait=False)
+
+    # Шаги всех сессий пишутся в общие JSONL-сегменты фоновым потоком
+    own_sink = sink is None
+    if own_sink:
+        sink = TranscriptSink(**(config.get("transcripts") or {}))
+
+    try:
         while True:
             client = input("Клиент: ")
-            
-            # Записываем вопрос клиента
-            f.write(f"Клиент: {client}\n")
-            
+
             if client.lower() in ["спасибо", "благодарю", "завершить"]:
                 # Записываем завершение диалога
                 footer = f"\n{'='*50}\nКонсультант: Было приятно помочь!\n{'='*50}"
                 print(footer.strip())
-                f.write(footer)
+                # Консультант, который не загрузился, не отвечал ни на один вопрос
+                turn = pending.result().turn if pending.done() and pending.exception() is None else 0
+                sink.write({"event": "end", "session": session_id, "turn": turn, "question": client})
                 break
-                
-            # Получаем и записываем ответ консультанта
-            consult_answer = consult.get_answer(client)
-            print(f"Консультант: {consult_answer}")  # Выводим в консоль
-            f.write(f"Консультант: {consult_answer}\n\n")  # Записываем в файл
 
+            consult = pending.result()
+            tracer = consult.tracer
+
+            # Получаем и записываем ответ консультанта
+            with tracer.turn(session_id, consult.turn + 1):
+                consult_answer = consult.get_answer(client)
+                print(f"Консультант: {consult_answer}")  # Выводим в консоль
+                with tracer.span("transcript_write"):
+                    try:
+                        sink.write_turn(
+                            session_id, consult.turn, client, consult_answer,
+                            chunk_ids=consult.last_chunk_ids,
+                            timings=consult.last_timings
+                        )
+                    except RuntimeError as e:
+                        # Сбой записи транскрипта не прерывает диалог
+                        print(e)
+            tracer.write_metrics()
+    finally:
+        if own_sink:
+            sink.close()
 
 
 if __name__ == '__main__':
     load_yaml_to_env('configs/llm_config.yaml')
     api_key = os.getenv('API_COMPRESSA_KEY')
+    config = load_config('configs/llm_config.yaml')
 
     with open(f'data/processed/role.txt', 'w') as fl:
         print(role, file=fl)
 
-    dialog(api_key, role)
\ No newline at end of file
+    dialog(api_key, role, config)
\ No newline at end of file
@@ -0,0 +1,191 @@
+"""
+Хранилище состояния сессий для нескольких процессов и серверов.
+
+История диалога LegalConsult (номер шага и реплики клиента и консультанта, без
+системного промпта и контекста каждого шага) сериализуется в JSON, сжимается zlib
+и хранится по ключу session_id со сроком жизни ttl_s. Любой воркер восстанавливает
+сессию одним чтением по ключу перед шагом и сохраняет после, поэтому балансировщику
+не нужна привязка клиента к воркеру.
+
+Каждая запись хранит номер версии. Запись принимается, только если сессия не
+менялась с чтения (оптимистическая блокировка); иначе — SessionConflictError,
+и шаг дописывается к свежей версии.
+
+Интерфейс хранилища (SessionStore):
+    get(session_id) -> Optional[(bytes, int)]   данные и версия; None, если сессии нет или срок истек;
+    put(session_id, data, expected_version) -> int
+                                                запись и продление срока на ttl_s; expected_version —
+                                                версия из get, 0 для новой сессии; возвращает новую версию;
+    delete(session_id).
+Реализации:
+    SQLiteSessionStore — один файл на сервер, WAL, общий для процессов воркеров;
+                         версия проверяется в UPDATE ... WHERE version = ?;
+    RedisSessionStore  — для нескольких серверов: хеш {data, version} с EXPIRE ttl_s,
+                         версия проверяется через WATCH / MULTI.
+
+Секция `sessions` конфига:
+    sessions:
+      backend: sqlite            # sqlite | redis
+      path: "data/processed/sessions.sqlite"
+      ttl_s: 86400
+"""
+from typing import Dict, List, Optional, Tuple
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+SESSIONS_PATH = 'data/processed/sessions.sqlite'
+# Роли, которые сохраняются в истории сессии; контекст шага в истории не нужен
+HISTORY_ROLES = ("human", "assistant")
+
+
+class SessionConflictError(RuntimeError):
+    """Сессию изменил другой процесс после чтения"""
+
+
+def dump_session(turn: int, messages: List[Tuple[str, str]]) -> bytes:
+    return zlib.compress(json.dumps({"turn": turn, "messages": messages}, ensure_ascii=False).encode("utf-8"))
+
+
+def load_session(data: bytes) -> Tuple[int, List[Tuple[str, str]]]:
+    state = json.loads(zlib.decompress(data))
+    return state["turn"], [tuple(message) for message in state["messages"]]
+
+
+class SessionStore:
+    def get(self, session_id: str) -> Optional[Tuple[bytes, int]]:
+        raise NotImplementedError
+
+    def put(self, session_id: str, data: bytes, expected_version: int = 0) -> int:
+        raise NotImplementedError
+
+    def delete(self, session_id: str):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class SQLiteSessionStore(SessionStore):
+    def __init__(self, path: str = SESSIONS_PATH, ttl_s: float = 86400, purge_every: int = 1000):
+        self.path = path
+        self.ttl_s = ttl_s
+        self.purge_every = purge_every
+        self._writes = 0
+        # Соединение SQLite не переживает fork и не делится между потоками — у каждого потока свое
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        connection = self._connection()
+        connection.execute("CREATE TABLE IF NOT EXISTS sessions (id TEXT PRIMARY KEY, data BLOB NOT NULL, "
+                           "expires REAL NOT NULL, version INTEGER NOT NULL DEFAULT 1)")
+        # Файл сессий, созданный до появления версий
+        columns = [row[1] for row in connection.execute("PRAGMA table_info(sessions)")]
+        if "version" not in columns:
+            connection.execute("ALTER TABLE sessions ADD COLUMN version INTEGER NOT NULL DEFAULT 1")
+        connection.execute("CREATE INDEX IF NOT EXISTS sessions_expires ON sessions (expires)")
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection, self._local.pid = connection, os.getpid()
+        return connection
+
+    def get(self, session_id: str) -> Optional[Tuple[bytes, int]]:
+        row = self._connection().execute("SELECT data, version FROM sessions WHERE id = ? AND expires > ?",
+                                         (session_id, time.time())).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def put(self, session_id: str, data: bytes, expected_version: int = 0) -> int:
+        connection = self._connection()
+        now = time.time()
+        if expected_version == 0:
+            # Новая сессия: занимает ключ, только если его нет или прежняя сессия истекла
+            cursor = connection.execute(
+                "INSERT INTO sessions (id, data, expires, version) VALUES (?, ?, ?, 1) "
+                "ON CONFLICT (id) DO UPDATE SET data = excluded.data, expires = excluded.expires, version = 1 "
+                "WHERE sessions.expires <= ?",
+                (session_id, data, now + self.ttl_s, now))
+        else:
+            cursor = connection.execute(
+                "UPDATE sessions SET data = ?, expires = ?, version = version + 1 "
+                "WHERE id = ? AND version = ? AND expires > ?",
+                (data, now + self.ttl_s, session_id, expected_version, now))
+        if cursor.rowcount == 0:
+            raise SessionConflictError(f"Сессия {session_id} изменена после версии {expected_version}")
+        self._writes += 1
+        if self._writes % self.purge_every == 0:
+            self.purge()
+        return expected_version + 1
+
+    def delete(self, session_id: str):
+        self._connection().execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+
+    def purge(self) -> int:
+        """Удаляет истекшие сессии"""
+        return self._connection().execute("DELETE FROM sessions WHERE expires <= ?", (time.time(),)).rowcount
+
+    def close(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+
+class RedisSessionStore(SessionStore):
+    def __init__(self, url: str = "redis://localhost:6379/0", ttl_s: float = 86400, prefix: str = "session:"):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self.ttl_s = ttl_s
+        self.prefix = prefix
+        self._watch_error = redis.WatchError
+        self._response_error = redis.ResponseError
+
+    def get(self, session_id: str) -> Optional[Tuple[bytes, int]]:
+        key = self.prefix + session_id
+        try:
+            data, version = self.client.hmget(key, "data", "version")
+        except self._response_error:
+            # Сессия, записанная строкой до появления версий, начинается заново
+            self.client.delete(key)
+            return None
+        return (data, int(version)) if data is not None else None
+
+    def put(self, session_id: str, data: bytes, expected_version: int = 0) -> int:
+        key = self.prefix + session_id
+        with self.client.pipeline() as pipe:
+            try:
+                # Транзакция не выполнится, если ключ изменят после WATCH
+                pipe.watch(key)
+                version = int(pipe.hget(key, "version") or 0)
+                if version != expected_version:
+                    raise SessionConflictError(f"Сессия {session_id} изменена после версии {expected_version}")
+                pipe.multi()
+                pipe.hset(key, mapping={"data": data, "version": version + 1})
+                pipe.expire(key, int(self.ttl_s))
+                pipe.execute()
+            except self._watch_error:
+                raise SessionConflictError(f"Сессия {session_id} изменена после версии {expected_version}")
+        return expected_version + 1
+
+    def delete(self, session_id: str):
+        self.client.delete(self.prefix + session_id)
+
+    def close(self):
+        self.client.close()
+
+
+def build_session_store(config: Optional[Dict] = None) -> SessionStore:
+    config = dict(config or {})
+    backend = config.pop("backend", "sqlite")
+    if backend == "sqlite":
+        return SQLiteSessionStore(**config)
+    if backend == "redis":
+        return RedisSessionStore(**config)
+    raise ValueError(f"Неизвестное хранилище сессий: {backend}")
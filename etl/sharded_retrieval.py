@@ -0,0 +1,360 @@
+"""
+Шардированный поиск по большому корпусу (RusLawOD целиком).
+
+Корпус делится на шарды по семейству документов (поле метаданных `shard_key`,
+например doc_type или file_name) или поровну. Каждый шард — каталог с
+    vectors.npy — нормированные векторы float32 (читаются через mmap);
+    index.faiss — ANN-индекс шарда, если factory не Flat (открывается с IO_FLAG_MMAP);
+    docs.jsonl + offsets.npy — тексты и метаданные с доступом по номеру строки.
+
+ShardedIndex запускает процессы-воркеры, шарды распределяются между ними по
+размеру. Воркеры запускаются через spawn и импортируют только этот модуль, а не
+модели родителя. Вопрос рассылается всем воркерам параллельно, каждый возвращает свой
+top-k, родитель сливает частичные списки. Ответ ждется не дольше timeout_s; упавший
+воркер обнаруживается во время ожидания, и поиск завершается RuntimeError. Файлы
+шардов открываются через mmap, поэтому их страницы в page cache общие для всех
+воркеров. ShardedIndex можно передать в RetrievalPipeline вместо langchain FAISS
+(секция `shards` конфига).
+
+Пример на одной машине (процессы вместо узлов):
+    python etl/sharded_retrieval.py build --corpus docx --scale 1000000 --num-shards 8
+    python etl/sharded_retrieval.py bench --workers 1 2 4 8
+"""
+from collections import defaultdict
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+
+from tracing import rss_mb
+
+SHARDS_DIR = 'data/processed/shards/'
+
+
+def build_shards(texts: List[str], metadatas: List[Dict], vectors: np.ndarray, directory: str = SHARDS_DIR,
+                 shard_key: Optional[str] = None, num_shards: int = 4, factory: str = "Flat") -> Dict:
+    """Раскладывает корпус по шардам и пишет manifest.json"""
+    import faiss
+
+    groups: Dict[str, List[int]] = defaultdict(list)
+    for i, metadata in enumerate(metadatas):
+        if shard_key:
+            name = str(metadata.get(shard_key) or "other")
+        else:
+            name = f"part{i % num_shards:03d}"
+        groups[name].append(i)
+
+    shards = []
+    offset = 0
+    for number, (name, rows) in enumerate(sorted(groups.items())):
+        path = os.path.join(directory, f"shard_{number:04d}")
+        os.makedirs(path, exist_ok=True)
+        shard_vectors = np.ascontiguousarray(vectors[rows], dtype="float32")
+        np.save(os.path.join(path, "vectors.npy"), shard_vectors)
+
+        if factory != "Flat":
+            index = faiss.index_factory(shard_vectors.shape[1], factory, faiss.METRIC_INNER_PRODUCT)
+            index.train(shard_vectors)
+            index.add(shard_vectors)
+            faiss.write_index(index, os.path.join(path, "index.faiss"))
+
+        offsets = []
+        with open(os.path.join(path, "docs.jsonl"), "wb") as f:
+            for i in rows:
+                offsets.append(f.tell())
+                line = json.dumps({"page_content": texts[i], "metadata": metadatas[i]}, ensure_ascii=False)
+                f.write(line.encode("utf-8") + b"\n")
+        np.save(os.path.join(path, "offsets.npy"), np.asarray(offsets, dtype=np.int64))
+
+        shards.append({"name": name, "path": os.path.basename(path), "offset": offset, "count": len(rows)})
+        offset += len(rows)
+
+    manifest = {"dim": int(vectors.shape[1]), "factory": factory, "shard_key": shard_key,
+                "total": offset, "shards": shards}
+    with open(os.path.join(directory, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    return manifest
+
+
+def top_k(scores: np.ndarray, ids: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """k лучших по скалярному произведению в каждой строке"""
+    if scores.shape[1] > k:
+        part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        scores = np.take_along_axis(scores, part, axis=1)
+        ids = np.take_along_axis(ids, part, axis=1)
+    order = np.argsort(-scores, axis=1)
+    return np.take_along_axis(scores, order, axis=1), np.take_along_axis(ids, order, axis=1)
+
+
+class Shard:
+    def __init__(self, directory: str, offset: int):
+        self.offset = offset
+        self.vectors = np.load(os.path.join(directory, "vectors.npy"), mmap_mode="r")
+        self.index = None
+        index_path = os.path.join(directory, "index.faiss")
+        if os.path.exists(index_path):
+            import faiss
+
+            self.index = faiss.read_index(index_path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+
+    def search(self, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        if self.index is not None:
+            scores, ids = self.index.search(queries, k)
+            ids = np.where(ids >= 0, ids + self.offset, -1)
+            return scores, ids
+        scores = queries @ self.vectors.T
+        ids = np.broadcast_to(np.arange(self.offset, self.offset + len(self.vectors)), scores.shape)
+        return top_k(scores, ids, k)
+
+
+def _worker(shard_specs: List[Tuple[str, int]], requests, responses, worker_id: int):
+    shards = [Shard(path, offset) for path, offset in shard_specs]
+    responses.put(("ready", worker_id, os.getpid()))
+    while True:
+        message = requests.get()
+        if message is None:
+            break
+        request_id, queries, k = message
+        try:
+            parts = [shard.search(queries, k) for shard in shards]
+        except Exception as e:
+            # Ошибка одного запроса не останавливает воркер
+            responses.put((request_id, None, f"shard-worker-{worker_id}: {e!r}"))
+            continue
+        scores = np.hstack([p[0] for p in parts]) if parts else np.empty((len(queries), 0), dtype="float32")
+        ids = np.hstack([p[1] for p in parts]) if parts else np.empty((len(queries), 0), dtype=np.int64)
+        responses.put((request_id, *top_k(scores, ids, k)))
+
+
+class ShardedIndex:
+    def __init__(self, directory: str = SHARDS_DIR, workers: int = 4, embeddings=None, timeout_s: float = 30.0):
+        with open(os.path.join(directory, "manifest.json"), "r", encoding="utf-8") as f:
+            self.manifest = json.load(f)
+        self.directory = directory
+        self.embeddings = embeddings
+        self.timeout_s = timeout_s
+        self._offsets = np.asarray([s["offset"] for s in self.manifest["shards"]], dtype=np.int64)
+        self._doc_offsets: Dict[int, np.ndarray] = {}
+
+        # Крупные шарды раздаются первыми наименее загруженному воркеру
+        assignment: List[List[Tuple[str, int]]] = [[] for _ in range(workers)]
+        load = [0] * workers
+        for shard in sorted(self.manifest["shards"], key=lambda s: -s["count"]):
+            target = load.index(min(load))
+            assignment[target].append((os.path.join(directory, shard["path"]), shard["offset"]))
+            load[target] += shard["count"]
+
+        # spawn, а не fork: ShardedIndex создается, когда в процессе уже загружены модели
+        # и работают потоки (прогрев, трассировка), и форк унаследовал бы их блокировки
+        context = multiprocessing.get_context("spawn")
+        self._responses = context.Queue()
+        self._requests = []
+        self.processes = []
+        for worker_id, specs in enumerate(assignment):
+            requests = context.Queue()
+            process = context.Process(target=_worker, args=(specs, requests, self._responses, worker_id),
+                                      daemon=True, name=f"shard-worker-{worker_id}")
+            process.start()
+            self._requests.append(requests)
+            self.processes.append(process)
+        ready = 0
+        while ready < len(self.processes):
+            try:
+                self._responses.get(timeout=1.0)
+                ready += 1
+            except queue.Empty:
+                self._check_workers()
+
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        self._pending: Dict[int, Dict] = {}
+        self._collector = threading.Thread(target=self._collect, name="shard-collector", daemon=True)
+        self._collector.start()
+
+    def _collect(self):
+        while True:
+            message = self._responses.get()
+            if message is None:
+                break
+            request_id, scores, ids = message
+            with self._lock:
+                # Запрос уже завершился по таймауту или ошибке — поздние ответы отбрасываются
+                pending = self._pending.get(request_id)
+                if pending is None:
+                    continue
+                if scores is None:
+                    del self._pending[request_id]
+                    pending["future"].set_exception(RuntimeError(f"Ошибка поиска в шарде: {ids}"))
+                    continue
+                pending["parts"].append((scores, ids))
+                if len(pending["parts"]) < len(self.processes):
+                    continue
+                del self._pending[request_id]
+            all_scores = np.hstack([p[0] for p in pending["parts"]])
+            all_ids = np.hstack([p[1] for p in pending["parts"]])
+            pending["future"].set_result(top_k(all_scores, all_ids, pending["k"]))
+
+    def search(self, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Оценки и глобальные номера k ближайших фрагментов для каждого вопроса"""
+        queries = np.ascontiguousarray(np.atleast_2d(queries), dtype="float32")
+        future: Future = Future()
+        request_id = next(self._ids)
+        with self._lock:
+            self._pending[request_id] = {"future": future, "parts": [], "k": k}
+        for requests in self._requests:
+            requests.put((request_id, queries, k))
+
+        deadline = time.monotonic() + self.timeout_s
+        try:
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError(f"Шарды не ответили за {self.timeout_s} с")
+                try:
+                    return future.result(timeout=min(remaining, 1.0))
+                except FutureTimeout:
+                    self._check_workers()
+        finally:
+            with self._lock:
+                self._pending.pop(request_id, None)
+
+    def _check_workers(self):
+        dead = [f"{process.name} (код {process.exitcode})" for process in self.processes if not process.is_alive()]
+        if dead:
+            raise RuntimeError(f"Воркеры шардов завершились: {', '.join(dead)}; пересоздайте ShardedIndex")
+
+    def documents(self, ids: Sequence[int]) -> List:
+        from langchain_core.documents import Document
+
+        docs = []
+        for global_id in ids:
+            if global_id < 0:
+                continue
+            number = int(np.searchsorted(self._offsets, global_id, side="right")) - 1
+            shard = self.manifest["shards"][number]
+            path = os.path.join(self.directory, shard["path"])
+            if number not in self._doc_offsets:
+                self._doc_offsets[number] = np.load(os.path.join(path, "offsets.npy"), mmap_mode="r")
+            with open(os.path.join(path, "docs.jsonl"), "rb") as f:
+                f.seek(int(self._doc_offsets[number][global_id - shard["offset"]]))
+                record = json.loads(f.readline())
+            docs.append(Document(page_content=record["page_content"], metadata=record["metadata"]))
+        return docs
+
+    def similarity_search_by_vector(self, vector: List[float], k: int = 4) -> List:
+        _, ids = self.search(np.asarray(vector, dtype="float32"), k)
+        return self.documents(ids[0])
+
+    def worker_rss_mb(self) -> List[float]:
+        return [rss_mb(process.pid) for process in self.processes]
+
+    def close(self):
+        for requests in self._requests:
+            requests.put(None)
+        for process in self.processes:
+            process.join(timeout=5)
+        self._responses.put(None)
+        self._collector.join()
+
+
+def run_benchmark(directory: str = SHARDS_DIR, workers: Sequence[int] = (1, 2, 4), k: int = 5,
+                  batch_size: int = 32, output_dir: str = "data/processed/benchmarks") -> List[Dict]:
+    from benchmark_retrieval import embed_texts, percentile
+    from consultations import build_query_set
+    from context_packer import article_number
+
+    query_set = build_query_set()
+    queries = embed_texts([q["question"] for q in query_set])
+    relevant = [q["relevant"] for q in query_set]
+
+    results = []
+    exact_ids = None
+    for count in workers:
+        start = time.perf_counter()
+        index = ShardedIndex(directory, workers=count)
+        startup_seconds = time.perf_counter() - start
+
+        latencies, ids = [], []
+        for vector in queries:
+            start = time.perf_counter()
+            ids.append(index.search(vector, k)[1][0])
+            latencies.append((time.perf_counter() - start) * 1000)
+        ids = np.stack(ids)
+
+        start = time.perf_counter()
+        for i in range(0, len(queries), batch_size):
+            index.search(queries[i:i + batch_size], k)
+        qps = len(queries) / max(time.perf_counter() - start, 1e-9)
+
+        hits = []
+        for row, rel in zip(ids, relevant):
+            articles = [article_number(doc.metadata) for doc in index.documents(row)]
+            hits.append(1.0 if any(a in rel for a in articles) else 0.0)
+        if exact_ids is None:
+            exact_ids = ids
+
+        result = {
+            "shards": len(index.manifest["shards"]),
+            "num_vectors": index.manifest["total"],
+            "factory": index.manifest["factory"],
+            "workers": count,
+            "startup_seconds": startup_seconds,
+            "latency_p50_ms": percentile(latencies, 50),
+            "latency_p95_ms": percentile(latencies, 95),
+            "latency_p99_ms": percentile(latencies, 99),
+            "qps_batch": qps,
+            f"hit_rate@{k}": float(np.mean(hits)),
+            f"agreement_with_{workers[0]}_workers@{k}": float(np.mean(
+                [len(set(a) & set(b)) / k for a, b in zip(ids, exact_ids)])),
+            "parent_rss_mb": rss_mb(),
+            "worker_rss_mb": index.worker_rss_mb()
+        }
+        results.append(result)
+        print(json.dumps(result, ensure_ascii=False))
+        index.close()
+
+    os.makedirs(output_dir, exist_ok=True)
+    output_path = os.path.join(output_dir, f"sharded_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump({"k": k, "results": results}, f, ensure_ascii=False, indent=2)
+    print(f"Результаты сохранены в {output_path}")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Шардированный поиск по корпусу")
+    parser.add_argument("command", choices=["build", "bench"])
+    parser.add_argument("--directory", default=SHARDS_DIR)
+    parser.add_argument("--corpus", choices=["docx", "html"], default="docx")
+    parser.add_argument("--scale", type=int, default=0, help="размер корпуса с синтетическими помехами")
+    parser.add_argument("--num-shards", type=int, default=4)
+    parser.add_argument("--shard-key", help="поле метаданных, по которому делить корпус")
+    parser.add_argument("--factory", default="Flat")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--k", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        from benchmark_retrieval import embed_texts, load_corpus, synthetic_vectors
+
+        texts, metadatas = load_corpus(args.corpus)
+        vectors = embed_texts(texts)
+        extra = max(0, args.scale - len(texts))
+        if extra:
+            vectors = np.vstack([vectors, synthetic_vectors(vectors, extra)])
+            texts = texts + [""] * extra
+            metadatas = metadatas + [{"synthetic": True}] * extra
+        manifest = build_shards(texts, metadatas, vectors, args.directory, args.shard_key,
+                                args.num_shards, args.factory)
+        print(f"Шардов: {len(manifest['shards'])}, векторов: {manifest['total']}")
+    else:
+        run_benchmark(args.directory, args.workers, args.k)
@@ -0,0 +1,105 @@
+"""
+Отчет о времени холодного старта.
+
+Модуль импортируется в чистом процессе с `python -X importtime`, вывод
+разбирается в таблицу модулей по накопленному времени импорта. С --first-answer
+дополнительно замеряется время от старта процесса до готовности LegalConsult
+и до первого ответа (LLM — заглушка без задержки). --budget-ms завершает
+скрипт с ошибкой, если импорт дольше бюджета, — для проверки регрессий в CI.
+
+Пример:
+    python etl/startup_report.py --module retrieval_qa --top 25 --budget-ms 300
+"""
+from datetime import datetime
+from typing import Dict, List
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+
+ETL_DIR = os.path.dirname(os.path.abspath(__file__))
+# Пути к данным в модулях заданы от корня репозитория
+REPO_DIR = os.path.dirname(ETL_DIR)
+IMPORT_LINE = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)')
+
+FIRST_ANSWER_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+from retrieval_qa import load_config, role, start_consult
+config = load_config(sys.argv[1]) if sys.argv[1] else {}
+config["llm"] = {"backend": "mock", "latency_ms": 0}
+consult = start_consult(None, role, config)
+ready = time.perf_counter()
+consult.get_answer("Могу ли я установить душевую кабину вместо ванной без разрешений?")
+done = time.perf_counter()
+print(json.dumps({"ready_seconds": ready - start, "first_answer_seconds": done - start}))
+"""
+
+
+def parse_importtime(stderr: str) -> List[Dict]:
+    modules = []
+    for line in stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if match:
+            modules.append({
+                "module": match.group(4),
+                "self_ms": int(match.group(1)) / 1000,
+                "cumulative_ms": int(match.group(2)) / 1000,
+                # Отступ в выводе -X importtime показывает глубину вложенности
+                "depth": (len(match.group(3)) - 1) // 2
+            })
+    return modules
+
+
+def _run(args: List[str]) -> subprocess.CompletedProcess:
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [ETL_DIR, os.environ.get("PYTHONPATH")])))
+    return subprocess.run([sys.executable, *args], cwd=REPO_DIR, env=env, capture_output=True, text=True)
+
+
+def import_report(module: str, top: int = 25) -> Dict:
+    result = _run(["-X", "importtime", "-c", f"import {module}"])
+    if result.returncode != 0:
+        raise RuntimeError(f"Импорт {module} завершился ошибкой:\n{result.stderr[-2000:]}")
+
+    modules = parse_importtime(result.stderr)
+    top_level = [m for m in modules if m["depth"] == 0]
+    return {
+        "module": module,
+        "total_ms": sum(m["cumulative_ms"] for m in top_level),
+        "modules_imported": len(modules),
+        "slowest": sorted(modules, key=lambda m: -m["cumulative_ms"])[:top]
+    }
+
+
+def first_answer_report(config_path: str) -> Dict:
+    result = _run(["-c", FIRST_ANSWER_SCRIPT, config_path or ""])
+    if result.returncode != 0:
+        raise RuntimeError(f"Не удалось получить первый ответ:\n{result.stderr[-2000:]}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Время импорта и холодного старта")
+    parser.add_argument("--module", default="retrieval_qa")
+    parser.add_argument("--top", type=int, default=25)
+    parser.add_argument("--first-answer", action="store_true")
+    parser.add_argument("--config", default=os.path.abspath("configs/llm_config.yaml"))
+    parser.add_argument("--budget-ms", type=float)
+    parser.add_argument("--output-dir", default="data/processed/benchmarks")
+    args = parser.parse_args()
+
+    report = import_report(args.module, args.top)
+    if args.first_answer:
+        config_path = args.config if os.path.exists(args.config) else ""
+        report.update(first_answer_report(config_path))
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    output_path = os.path.join(args.output_dir, f"startup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+    if args.budget_ms is not None and report["total_ms"] > args.budget_ms:
+        sys.exit(f"Импорт {args.module}: {report['total_ms']:.0f} мс > бюджета {args.budget_ms:.0f} мс")
@@ -0,0 +1,161 @@
+"""
+Замеры времени этапов консультации.
+
+Каждый шаг диалога (turn) состоит из спанов: эмбеддинг вопроса, поиск в FAISS,
+переранжирование, сборка контекста, время до первого токена и полное время LLM,
+запись транскрипта. Длительности попадают в гистограммы (текстовый формат
+Prometheus) и, по одной строке на шаг, в JSONL-файл трассировки.
+
+При выключенной трассировке span() возвращает общий пустой контекстный
+менеджер, поэтому накладные расходы сводятся к одному вызову метода.
+
+Секция `tracing` конфига:
+    tracing:
+      enabled: true
+      trace_path: "data/processed/traces/trace.jsonl"
+      metrics_path: "data/processed/traces/metrics.prom"
+"""
+from bisect import bisect_left
+from contextlib import contextmanager, nullcontext
+from typing import Dict, List, Optional, Sequence
+import json
+import os
+import threading
+import time
+
+# Границы корзин гистограмм, мс
+DEFAULT_BUCKETS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
+
+_NOOP = nullcontext()
+
+
+def rss_mb(pid="self") -> float:
+    """Текущий RSS процесса в МБ (Linux); по умолчанию — своего"""
+    with open(f"/proc/{pid}/statm") as f:
+        pages = int(f.read().split()[1])
+    return pages * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+
+
+class Histogram:
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = list(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class TurnTrace:
+    def __init__(self, session_id: str, turn: int):
+        self.session_id = session_id
+        self.turn = turn
+        self.started = time.time()
+        self.spans: Dict[str, float] = {}
+
+
+class Tracer:
+    def __init__(self, enabled: bool = False, trace_path: Optional[str] = None,
+                 metrics_path: Optional[str] = None, buckets: Sequence[float] = DEFAULT_BUCKETS,
+                 metric_name: str = "legal_consult_stage_duration_ms"):
+        self.enabled = enabled
+        self.trace_path = trace_path
+        self.metrics_path = metrics_path
+        self.buckets = buckets
+        self.metric_name = metric_name
+        self.histograms: Dict[str, Histogram] = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+        if enabled and trace_path:
+            os.makedirs(os.path.dirname(trace_path) or ".", exist_ok=True)
+
+    @property
+    def current(self) -> Optional[TurnTrace]:
+        return getattr(self._local, "turn", None)
+
+    def record(self, name: str, ms: float):
+        """Добавляет длительность этапа в гистограмму и в текущий шаг диалога"""
+        if not self.enabled:
+            return
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram(self.buckets)
+            histogram.observe(ms)
+        turn = self.current
+        if turn is not None:
+            turn.spans[name] = turn.spans.get(name, 0.0) + ms
+
+    def span(self, name: str):
+        if not self.enabled:
+            return _NOOP
+        return self._span(name)
+
+    @contextmanager
+    def _span(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, (time.perf_counter() - start) * 1000)
+
+    def turn(self, session_id: str, turn: int):
+        """Границы шага диалога; вложенный вызов присоединяется к уже открытому шагу"""
+        if not self.enabled or self.current is not None:
+            return _NOOP
+        return self._turn(session_id, turn)
+
+    @contextmanager
+    def _turn(self, session_id: str, turn: int):
+        trace = TurnTrace(session_id, turn)
+        self._local.turn = trace
+        start = time.perf_counter()
+        try:
+            yield trace
+        finally:
+            self.record("turn_total", (time.perf_counter() - start) * 1000)
+            self._local.turn = None
+            self._write_trace(trace)
+
+    def _write_trace(self, trace: TurnTrace):
+        if not self.trace_path:
+            return
+        line = json.dumps({
+            "session": trace.session_id,
+            "turn": trace.turn,
+            "ts": trace.started,
+            "spans_ms": {name: round(ms, 3) for name, ms in trace.spans.items()}
+        }, ensure_ascii=False)
+        with self._lock, open(self.trace_path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+    def prometheus_text(self) -> str:
+        """Гистограммы в текстовом формате экспозиции Prometheus"""
+        lines: List[str] = [
+            f"# HELP {self.metric_name} Duration of consultation pipeline stages in milliseconds.",
+            f"# TYPE {self.metric_name} histogram"
+        ]
+        with self._lock:
+            for stage, histogram in sorted(self.histograms.items()):
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    lines.append(f'{self.metric_name}_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+                lines.append(f'{self.metric_name}_bucket{{stage="{stage}",le="+Inf"}} {histogram.count}')
+                lines.append(f'{self.metric_name}_sum{{stage="{stage}"}} {histogram.sum:.3f}')
+                lines.append(f'{self.metric_name}_count{{stage="{stage}"}} {histogram.count}')
+        return "\n".join(lines) + "\n"
+
+    def write_metrics(self):
+        """Атомарно перезаписывает файл метрик (формат textfile-коллектора node_exporter)"""
+        if not (self.enabled and self.metrics_path):
+            return
+        os.makedirs(os.path.dirname(self.metrics_path) or ".", exist_ok=True)
+        tmp_path = self.metrics_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(self.prometheus_text())
+        os.replace(tmp_path, self.metrics_path)
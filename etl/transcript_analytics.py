@@ -0,0 +1,226 @@
+"""
+Аналитика вопросов граждан по сохраненным диалогам.
+
+ingest переводит транскрипты (JSONL-сегменты и старые dialog_*.txt) в колоночный
+Parquet-датасет, разбитый по датам (date=YYYY-MM-DD). Уже загруженные файлы
+запоминаются в манифесте, повторный запуск добавляет только новые.
+
+Запросы выполняются векторно над колонками pyarrow с отсечением партиций по датам:
+    python etl/transcript_analytics.py ingest
+    python etl/transcript_analytics.py top-questions --limit 20 --since 2025-05-01
+    python etl/transcript_analytics.py unanswered
+    python etl/transcript_analytics.py articles --limit 30
+"""
+from datetime import datetime
+from typing import Dict, List, Optional
+import argparse
+import glob
+import json
+import os
+
+from citation_check import reference_article
+from consultations import cited_articles
+from transcript_sink import TRANSCRIPTS_DIR
+from transcripts import (NOT_FOUND_ANSWER, RESULTS_DIR, iter_segment_records, parse_answer_json,
+                         parse_dialog_file, segment_paths)
+
+ANALYTICS_DIR = 'data/processed/analytics/transcripts/'
+MANIFEST_NAME = '_ingested.json'
+
+
+def answer_articles(answer: str) -> List[str]:
+    """Статьи ЖК РФ, на которые ссылается ответ (поле sources или текст)"""
+    data = parse_answer_json(answer)
+    if data is not None:
+        articles = [reference_article(s.get("reference", "")) for s in data.get("sources") or []
+                    if isinstance(s, dict)]
+        return [a for a in dict.fromkeys(articles) if a]
+    return cited_articles(answer)
+
+
+def normalize_question(question: str) -> str:
+    return " ".join(question.lower().replace("ё", "е").split()).rstrip("?!. ")
+
+
+def make_row(source: str, session: str, turn: int, ts: datetime, question: str, answer: str,
+             timings: Optional[Dict[str, float]] = None) -> Dict:
+    timings = timings or {}
+    return {
+        "date": ts.date().isoformat(),
+        "ts": ts,
+        "source": source,
+        "session": session,
+        "turn": turn,
+        "question": question,
+        "question_norm": normalize_question(question),
+        "answer_chars": len(answer),
+        "not_found": NOT_FOUND_ANSWER in answer,
+        "articles": answer_articles(answer),
+        "retrieval_ms": timings.get("retrieval_ms"),
+        "llm_ms": timings.get("llm_ms")
+    }
+
+
+def rows_from_file(path: str) -> List[Dict]:
+    source = os.path.basename(path)
+    if path.endswith(".jsonl"):
+        return [
+            make_row(source, r["session"], r["turn"], datetime.fromtimestamp(r["ts"]), r["question"], r["answer"],
+                     r.get("timings_ms"))
+            for r in iter_segment_records(path) if r.get("event") == "turn"
+        ]
+
+    dialog = parse_dialog_file(path)
+    started = dialog["started"] or datetime.fromtimestamp(os.path.getmtime(path))
+    return [
+        make_row(source, dialog["session"], number, started, turn["question"], turn["answer"])
+        for number, turn in enumerate(dialog["turns"], 1)
+    ]
+
+
+def schema():
+    import pyarrow as pa
+
+    return pa.schema([
+        ("date", pa.string()),
+        ("ts", pa.timestamp("s")),
+        ("source", pa.string()),
+        ("session", pa.string()),
+        ("turn", pa.int32()),
+        ("question", pa.string()),
+        ("question_norm", pa.string()),
+        ("answer_chars", pa.int32()),
+        ("not_found", pa.bool_()),
+        ("articles", pa.list_(pa.string())),
+        ("retrieval_ms", pa.float32()),
+        ("llm_ms", pa.float32())
+    ])
+
+
+def ingest(results_dir: str = RESULTS_DIR, transcripts_dir: str = TRANSCRIPTS_DIR,
+           output_dir: str = ANALYTICS_DIR) -> int:
+    """Добавляет в датасет строки из новых или изменившихся файлов транскриптов"""
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+
+    manifest_path = os.path.join(output_dir, MANIFEST_NAME)
+    manifest: Dict[str, List[float]] = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+
+    paths = sorted(glob.glob(os.path.join(results_dir, "dialog_*.txt"))) + segment_paths(transcripts_dir)
+    # Активный сегмент дописывается, поэтому файл отслеживается по размеру и mtime
+    new_paths = [
+        p for p in paths
+        if manifest.get(p) != [os.path.getsize(p), os.path.getmtime(p)]
+    ]
+
+    rows = []
+    for path in new_paths:
+        rows.extend(rows_from_file(path))
+
+    if rows:
+        table = pa.Table.from_pylist(rows, schema=schema())
+        # Дописанные с прошлой загрузки файлы читаются целиком, их старые строки заменяются.
+        # Переписываются только партиции-даты, где эти файлы уже есть; остальные не трогаются
+        replaced = [os.path.basename(p) for p in new_paths if p in manifest]
+        existing_files = []
+        if replaced:
+            import pyarrow.compute as pc
+
+            existing = ds.dataset(output_dir, format="parquet", partitioning="hive", schema=schema(),
+                                  exclude_invalid_files=True)
+            stale = pc.field("source").isin(replaced)
+            dates = pc.unique(existing.to_table(columns=["date"], filter=stale)["date"])
+            if len(dates):
+                in_dates = pc.field("date").isin(dates)
+                kept = existing.to_table(filter=in_dates & ~stale)
+                table = pa.concat_tables([kept, table])
+                existing_files = [fragment.path for fragment in existing.get_fragments(filter=in_dates)]
+
+        stamp = datetime.now().strftime("%Y%m%d%H%M%S%f")
+        ds.write_dataset(
+            table, output_dir, format="parquet",
+            partitioning=ds.partitioning(pa.schema([("date", pa.string())]), flavor="hive"),
+            basename_template=f"part-{stamp}-{{i}}.parquet",
+            existing_data_behavior="overwrite_or_ignore"
+        )
+        for old_file in existing_files:
+            os.remove(old_file)
+
+    for path in new_paths:
+        manifest[path] = [os.path.getsize(path), os.path.getmtime(path)]
+    os.makedirs(output_dir, exist_ok=True)
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+    return len(rows)
+
+
+def load_table(columns: List[str], since: Optional[str] = None, until: Optional[str] = None,
+               data_dir: str = ANALYTICS_DIR):
+    """Нужные колонки за период; лишние партиции-даты не читаются"""
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+
+    dataset = ds.dataset(data_dir, format="parquet", partitioning="hive", schema=schema(),
+                         exclude_invalid_files=True)
+    condition = None
+    if since:
+        condition = pc.field("date") >= since
+    if until:
+        upper = pc.field("date") <= until
+        condition = upper if condition is None else condition & upper
+    return dataset.to_table(columns=columns, filter=condition)
+
+
+def top_questions(limit: int = 20, **period) -> List[Dict]:
+    table = load_table(["question_norm"], **period)
+    counts = table.group_by("question_norm").aggregate([("question_norm", "count")])
+    counts = counts.sort_by([("question_norm_count", "descending")]).slice(0, limit)
+    return counts.rename_columns(["question", "count"]).to_pylist()
+
+
+def unanswered(**period) -> List[Dict]:
+    """Доля ответов «Информация не найдена» по дням"""
+    import pyarrow.compute as pc
+
+    table = load_table(["date", "not_found"], **period)
+    table = table.append_column("not_found_int", pc.cast(table["not_found"], "int32"))
+    daily = table.group_by("date").aggregate([("not_found_int", "sum"), ("not_found_int", "count")])
+    rates = pc.divide(pc.cast(daily["not_found_int_sum"], "float64"), daily["not_found_int_count"])
+    daily = daily.append_column("rate", rates).sort_by("date")
+    return daily.rename_columns(["date", "not_found", "answers", "rate"]).to_pylist()
+
+
+def article_hits(limit: int = 30, **period) -> List[Dict]:
+    import pyarrow.compute as pc
+
+    table = load_table(["articles"], **period)
+    counts = pc.value_counts(pc.list_flatten(table["articles"]))
+    ordered = pc.array_sort_indices(counts.field("counts"), order="descending")
+    top = counts.take(ordered)[:limit]
+    return [{"article": item["values"], "count": item["counts"]} for item in top.to_pylist()]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Аналитика вопросов по сохраненным диалогам")
+    parser.add_argument("command", choices=["ingest", "top-questions", "unanswered", "articles"])
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--since", help="YYYY-MM-DD")
+    parser.add_argument("--until", help="YYYY-MM-DD")
+    args = parser.parse_args()
+
+    period = {"since": args.since, "until": args.until}
+    if args.command == "ingest":
+        print(f"Добавлено шагов диалога: {ingest()}")
+    elif args.command == "top-questions":
+        result = top_questions(args.limit, **period)
+    elif args.command == "unanswered":
+        result = unanswered(**period)
+    else:
+        result = article_hits(args.limit, **period)
+
+    if args.command != "ingest":
+        print(json.dumps(result, ensure_ascii=False, indent=2, default=str))
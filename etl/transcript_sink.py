@@ -0,0 +1,194 @@
+"""
+Фоновая запись транскриптов консультаций.
+
+Вместо отдельного dialog_*.txt на каждую сессию шаги всех сессий дописываются
+структурированными JSONL-записями в общие сегменты
+    data/processed/transcripts/transcripts_<дата>_<время>_<pid>_<номер>.jsonl
+
+write() только кладет запись в очередь; фоновый поток пишет пакетами, делает
+fsync по выбранной политике и начинает новый сегмент по размеру или смене суток.
+Ошибка записи не останавливает поток: пакет отбрасывается, следующий пишется в
+новый сегмент, а сама ошибка поднимается из ближайшего write() или close().
+
+Секция `transcripts` конфига:
+    transcripts:
+      directory: "data/processed/transcripts"
+      batch_size: 256
+      flush_interval_ms: 200
+      fsync: interval           # always | interval | never
+      fsync_interval_s: 1.0
+      max_segment_mb: 64
+"""
+from datetime import datetime
+from typing import Dict, List, Optional
+import json
+import os
+import queue
+import threading
+import time
+
+TRANSCRIPTS_DIR = 'data/processed/transcripts/'
+FSYNC_POLICIES = ("always", "interval", "never")
+
+_STOP = object()
+
+
+class TranscriptSink:
+    def __init__(self, directory: str = TRANSCRIPTS_DIR, batch_size: int = 256,
+                 flush_interval_ms: float = 200, fsync: str = "interval", fsync_interval_s: float = 1.0,
+                 max_segment_mb: float = 64, max_queue: int = 100000):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"Неизвестная политика fsync: {fsync}")
+
+        self.directory = directory
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval_s
+        self.max_segment_bytes = int(max_segment_mb * 2 ** 20)
+
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max_queue)
+        self._file = None
+        self._segment_day = None
+        self._segment_bytes = 0
+        self._segment_number = 0
+        self._last_fsync = time.monotonic()
+        self.records_written = 0
+        self.records_dropped = 0
+        self.error: Optional[BaseException] = None
+        self.segments: List[str] = []
+
+        os.makedirs(directory, exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name="transcript-sink", daemon=True)
+        self._thread.start()
+
+    def write(self, record: Dict):
+        """Ставит запись в очередь; блокирует только при переполнении очереди"""
+        self._raise_error()
+        # Запись вызывающего не меняется: метка времени добавляется в копию
+        record = dict(record)
+        record.setdefault("ts", time.time())
+        self._queue.put(record)
+
+    def write_turn(self, session: str, turn: int, question: str, answer: str,
+                   chunk_ids: Optional[List] = None, timings: Optional[Dict[str, float]] = None):
+        self.write({
+            "event": "turn",
+            "session": session,
+            "turn": turn,
+            "question": question,
+            "answer": answer,
+            "chunk_ids": chunk_ids or [],
+            "timings_ms": timings or {}
+        })
+
+    def close(self):
+        """Дописывает очередь и закрывает текущий сегмент"""
+        self._queue.put(_STOP)
+        self._thread.join()
+        self._raise_error()
+
+    def _raise_error(self):
+        """Поднимает ошибку фонового потока один раз"""
+        error, self.error = self.error, None
+        if error is not None:
+            raise RuntimeError(f"Ошибка записи транскриптов: {error}") from error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _open_segment(self):
+        if self._file is not None:
+            self._sync(force=True)
+            self._file.close()
+
+        now = datetime.now()
+        self._segment_number += 1
+        path = os.path.join(
+            self.directory,
+            f"transcripts_{now.strftime('%Y%m%d_%H%M%S')}_{os.getpid()}_{self._segment_number:04d}.jsonl"
+        )
+        self._file = open(path, "a", encoding="utf-8")
+        self._segment_day = now.date()
+        self._segment_bytes = 0
+        self.segments.append(path)
+
+    def _sync(self, force: bool = False):
+        self._file.flush()
+        if self.fsync == "never":
+            return
+        now = time.monotonic()
+        if force or self.fsync == "always" or now - self._last_fsync >= self.fsync_interval:
+            os.fsync(self._file.fileno())
+            self._last_fsync = now
+
+    def _write_batch(self, batch: List[Dict]):
+        if self._file is None or self._segment_day != datetime.now().date() \
+                or self._segment_bytes >= self.max_segment_bytes:
+            self._open_segment()
+
+        data = "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in batch)
+        self._file.write(data)
+        self._segment_bytes += len(data.encode("utf-8"))
+        self.records_written += len(batch)
+        self._sync()
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                # В простое досинхронизируем уже записанное по политике interval
+                if self._file is not None:
+                    try:
+                        self._sync()
+                    except Exception as e:
+                        self._fail(e, 0)
+                continue
+
+            batch = []
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    break
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+
+            if batch:
+                try:
+                    self._write_batch(batch)
+                except Exception as e:
+                    self._fail(e, len(batch))
+
+        if self._file is not None:
+            try:
+                self._sync(force=True)
+                self._file.close()
+            except Exception as e:
+                self._fail(e, 0)
+            self._file = None
+
+    def _fail(self, error: BaseException, dropped: int):
+        """Запоминает ошибку и бросает сегмент: следующий пакет откроет новый"""
+        print(f"Не удалось записать транскрипты ({dropped} записей): {error}")
+        self.records_dropped += dropped
+        self.error = error
+        if self._file is not None:
+            try:
+                self._file.close()
+            except Exception:
+                pass
+            self._file = None
@@ -0,0 +1,128 @@
+"""
+Разбор сохраненных диалогов.
+
+Сейчас шаги пишутся JSONL-сегментами data/processed/transcripts/ (см. transcript_sink.py).
+Старые диалоги лежат в data/processed/results/dialog_<дата>_<время>_<id>.txt, формат:
+    Клиент: вопрос
+    Консультант: ответ (может занимать несколько строк)
+
+    Клиент: Спасибо
+
+    ==================================================
+    Консультант: Было приятно помочь!
+    ==================================================
+"""
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional
+import glob
+import json
+import os
+import re
+
+from transcript_sink import TRANSCRIPTS_DIR
+
+RESULTS_DIR = 'data/processed/results/'
+DIALOG_NAME = re.compile(r'dialog_(\d{8}_\d{6})_([0-9a-f]+)\.txt$')
+NOT_FOUND_ANSWER = "Информация не найдена"
+
+CLIENT_PREFIX = "Клиент: "
+CONSULTANT_PREFIX = "Консультант: "
+FOOTER_LINE = "=" * 50
+
+
+def parse_dialog_text(text: str) -> List[Dict[str, str]]:
+    """Возвращает шаги диалога [{'question': ..., 'answer': ...}] без финальной благодарности"""
+    turns = []
+    question, answer_lines = None, None
+
+    def flush():
+        if question is not None and answer_lines is not None:
+            turns.append({'question': question, 'answer': "\n".join(answer_lines).strip()})
+
+    for line in text.split("\n"):
+        if line == FOOTER_LINE:
+            break
+        if line.startswith(CLIENT_PREFIX):
+            flush()
+            question, answer_lines = line[len(CLIENT_PREFIX):].strip(), None
+        elif line.startswith(CONSULTANT_PREFIX) and answer_lines is None:
+            answer_lines = [line[len(CONSULTANT_PREFIX):]]
+        elif answer_lines is not None:
+            answer_lines.append(line)
+    flush()
+
+    return turns
+
+
+def parse_dialog_file(path: str) -> Dict:
+    """Сессия из файла диалога: идентификатор, время начала и шаги"""
+    with open(path, 'r', encoding='utf-8') as f:
+        text = f.read()
+
+    match = DIALOG_NAME.search(os.path.basename(path))
+    started: Optional[datetime] = None
+    session = os.path.splitext(os.path.basename(path))[0]
+    if match:
+        started = datetime.strptime(match.group(1), "%Y%m%d_%H%M%S")
+        session = match.group(2)
+
+    return {
+        'session': session,
+        'started': started,
+        'path': path,
+        'turns': parse_dialog_text(text)
+    }
+
+
+def segment_paths(transcripts_dir: str = TRANSCRIPTS_DIR) -> List[str]:
+    return sorted(glob.glob(os.path.join(transcripts_dir, 'transcripts_*.jsonl')))
+
+
+def iter_segment_records(path: str) -> Iterator[Dict]:
+    """Записи одного JSONL-сегмента; недописанная последняя строка пропускается"""
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                continue
+
+
+def iter_jsonl_dialogs(transcripts_dir: str = TRANSCRIPTS_DIR) -> Iterator[Dict]:
+    """Сессии из JSONL-сегментов; шаги одной сессии могут лежать в разных сегментах"""
+    sessions: Dict[str, Dict] = {}
+    for path in segment_paths(transcripts_dir):
+        for record in iter_segment_records(path):
+            if record.get('event') != 'turn':
+                continue
+            session = sessions.setdefault(record['session'], {
+                'session': record['session'],
+                'started': datetime.fromtimestamp(record['ts']),
+                'path': path,
+                'turns': []
+            })
+            session['turns'].append({'question': record['question'], 'answer': record['answer']})
+    yield from sessions.values()
+
+
+def iter_dialogs(results_dir: str = RESULTS_DIR, transcripts_dir: str = TRANSCRIPTS_DIR) -> Iterator[Dict]:
+    for path in sorted(glob.glob(os.path.join(results_dir, 'dialog_*.txt'))):
+        yield parse_dialog_file(path)
+    yield from iter_jsonl_dialogs(transcripts_dir)
+
+
+def parse_answer_json(answer: str) -> Optional[Dict]:
+    """Ответ в формате JSON из role-промпта (допускается обертка ```json ... ```)"""
+    text = answer.strip()
+    if text.startswith("```"):
+        text = text.strip("`")
+        if text.startswith("json"):
+            text = text[len("json"):]
+    start, end = text.find("{"), text.rfind("}")
+    if start == -1 or end <= start:
+        return None
+    try:
+        data = json.loads(text[start:end + 1])
+    except json.JSONDecodeError:
+        return None
+    return data if isinstance(data, dict) else None
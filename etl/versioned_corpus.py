@@ -0,0 +1,289 @@
+"""
+Версионированный корпус: редакции статей и актов с запросами «на дату».
+
+Каждая загрузка корпуса добавляет только изменившиеся тексты. Редакция хранится
+дельтой к редакции, действовавшей на ее дату (построчные замены difflib); после
+keyframe_every дельт подряд пишется полный текст, чтобы восстановление не
+проходило длинную цепочку. Утративший силу текст записывается «надгробием».
+Метаданные (статус, заголовок) хранятся у каждой редакции: корпус на прошлую дату
+показывает тогдашний статус акта. Редакция с тем же текстом, но новыми
+метаданными записывается пустой дельтой.
+
+Файлы в data/processed/versioned_corpus/:
+    revisions.jsonl  записи редакций (полный текст или дельта), только дозапись;
+    revisions.idx    по строке на редакцию: ключ, дата начала действия, смещение
+                     и длина записи — читается при открытии, тексты не читаются.
+
+Представление на дату (PointInTimeView) для каждого ключа выбирает последнюю
+редакцию с valid_from <= даты и восстанавливает текст от полного по цепочке дельт.
+
+Примеры:
+    python etl/versioned_corpus.py ingest-code --corpus docx --valid-from 2024-03-01
+    python etl/versioned_corpus.py ingest-documents data/raw/RusLawOD/*.parquet
+    python etl/versioned_corpus.py export --as-of 2020-01-01 --output data/processed/corpus_2020.jsonl
+"""
+from bisect import bisect_right, insort
+from difflib import SequenceMatcher
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+import argparse
+import hashlib
+import json
+import os
+import threading
+
+VERSIONED_DIR = 'data/processed/versioned_corpus/'
+REPEALED_STATUSES = ("Утратил силу", "Отменен", "Не действует")
+
+
+def make_delta(old: str, new: str) -> List:
+    """Построчные замены: [начало, конец, новые строки] по строкам старого текста"""
+    a, b = old.splitlines(keepends=True), new.splitlines(keepends=True)
+    matcher = SequenceMatcher(None, a, b, autojunk=False)
+    return [[i1, i2, "".join(b[j1:j2])] for tag, i1, i2, j1, j2 in matcher.get_opcodes() if tag != "equal"]
+
+
+def apply_delta(old: str, delta: List) -> str:
+    lines = old.splitlines(keepends=True)
+    parts, position = [], 0
+    for start, end, replacement in delta:
+        parts.extend(lines[position:start])
+        parts.append(replacement)
+        position = end
+    parts.extend(lines[position:])
+    return "".join(parts)
+
+
+def text_hash(text: Optional[str]) -> Optional[str]:
+    return hashlib.md5(text.encode("utf-8")).hexdigest() if text is not None else None
+
+
+class Revision:
+    __slots__ = ("valid_from", "offset", "length", "base", "depth", "hash", "metadata")
+
+    def __init__(self, valid_from: str, offset: int, length: int, base: Optional[int], depth: int,
+                 hash: Optional[str], metadata: Optional[Dict] = None):
+        self.valid_from = valid_from
+        self.offset = offset
+        self.length = length
+        # Номер редакции, к которой записана дельта; None — полный текст
+        self.base = base
+        self.depth = depth
+        self.hash = hash
+        self.metadata = metadata
+
+
+class VersionedCorpus:
+    def __init__(self, directory: str = VERSIONED_DIR, keyframe_every: int = 8):
+        self.directory = directory
+        self.keyframe_every = keyframe_every
+        os.makedirs(directory, exist_ok=True)
+        self.data_path = os.path.join(directory, "revisions.jsonl")
+        self.index_path = os.path.join(directory, "revisions.idx")
+        # Редакции ключа в порядке записи и их порядок по valid_from
+        self.revisions: Dict[str, List[Revision]] = {}
+        self.timelines: Dict[str, List[Tuple[str, int]]] = {}
+        self._lock = threading.Lock()
+
+        if os.path.exists(self.index_path):
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    entry = json.loads(line)
+                    self._index(entry["key"], Revision(entry["valid_from"], entry["offset"], entry["length"],
+                                                       entry["base"], entry["depth"], entry["hash"],
+                                                       entry.get("metadata")))
+
+    def _index(self, key: str, revision: Revision):
+        revisions = self.revisions.setdefault(key, [])
+        revisions.append(revision)
+        # Догруженная старая редакция встает в середину хронологии
+        insort(self.timelines.setdefault(key, []), (revision.valid_from, len(revisions) - 1))
+
+    def _read(self, revision: Revision) -> Dict:
+        with open(self.data_path, "rb") as f:
+            f.seek(revision.offset)
+            return json.loads(f.read(revision.length))
+
+    def text_of(self, key: str, number: int) -> Optional[str]:
+        """Текст редакции: от полного текста вперед по цепочке дельт"""
+        revisions = self.revisions[key]
+        chain = [number]
+        while revisions[chain[-1]].base is not None:
+            chain.append(revisions[chain[-1]].base)
+        text = self._read(revisions[chain[-1]]).get("text")
+        for n in reversed(chain[:-1]):
+            text = apply_delta(text, self._read(revisions[n])["delta"])
+        return text
+
+    def revision_at(self, key: str, date: str) -> Optional[int]:
+        """Номер редакции, действующей на дату"""
+        timeline = self.timelines.get(key)
+        if not timeline:
+            return None
+        # Из редакций с одной датой действует записанная последней
+        position = bisect_right(timeline, (date, len(self.revisions[key]))) - 1
+        return timeline[position][1] if position >= 0 else None
+
+    def get(self, key: str, date: str) -> Optional[str]:
+        number = self.revision_at(key, date)
+        return self.text_of(key, number) if number is not None else None
+
+    def metadata_at(self, key: str, date: str) -> Dict:
+        number = self.revision_at(key, date)
+        return (self.revisions[key][number].metadata or {}) if number is not None else {}
+
+    def add(self, key: str, text: Optional[str], valid_from: str, metadata: Optional[Dict] = None) -> bool:
+        """
+        Добавляет редакцию; False — текст и метаданные совпадают с действующей на эту дату
+        редакцией. Без metadata редакция наследует метаданные действующей.
+        """
+        with self._lock:
+            number = self.revision_at(key, valid_from)
+            current = self.revisions[key][number] if number is not None else None
+            digest = text_hash(text)
+            if metadata is None and current is not None:
+                metadata = current.metadata
+            if current is not None and current.hash == digest and (metadata or None) == (current.metadata or None):
+                return False
+
+            # Дельта к действующей на дату редакции; длинная цепочка и надгробия прерываются полным текстом
+            base = number if current is not None and current.hash is not None and text is not None \
+                and current.depth + 1 < self.keyframe_every else None
+            record = {"key": key, "valid_from": valid_from}
+            if base is None:
+                record["text"] = text
+            else:
+                record["delta"] = make_delta(self.text_of(key, base), text)
+
+            line = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+            with open(self.data_path, "ab") as f:
+                offset = f.tell()
+                f.write(line)
+            depth = current.depth + 1 if base is not None else 0
+            entry = {"key": key, "valid_from": valid_from, "offset": offset, "length": len(line),
+                     "base": base, "depth": depth, "hash": digest}
+            if metadata:
+                entry["metadata"] = metadata
+            with open(self.index_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            self._index(key, Revision(valid_from, offset, len(line), base, depth, digest, metadata or None))
+            return True
+
+    def as_of(self, date: str) -> "PointInTimeView":
+        return PointInTimeView(self, date)
+
+    def stats(self) -> Dict:
+        revisions = [r for rs in self.revisions.values() for r in rs]
+        return {
+            "keys": len(self.revisions),
+            "revisions": len(revisions),
+            "full_texts": sum(r.base is None for r in revisions),
+            "bytes": os.path.getsize(self.data_path) if os.path.exists(self.data_path) else 0,
+        }
+
+
+class PointInTimeView:
+    """Корпус в редакции на дату date (ISO, YYYY-MM-DD)"""
+
+    def __init__(self, corpus: VersionedCorpus, date: str):
+        self.corpus = corpus
+        self.date = date
+
+    def get(self, key: str) -> Optional[str]:
+        return self.corpus.get(key, self.date)
+
+    def items(self) -> Iterator[Tuple[str, str]]:
+        for key in self.corpus.revisions:
+            text = self.get(key)
+            if text is not None:
+                yield key, text
+
+    def texts_and_metadatas(self) -> Tuple[List[str], List[Dict]]:
+        """Вход для построения индекса FAISS по корпусу на дату"""
+        texts, metadatas = [], []
+        for key, text in self.items():
+            texts.append(text)
+            # Метаданные редакции на дату, а не последней загруженной
+            metadatas.append(dict(self.corpus.metadata_at(key, self.date), version_key=key, as_of=self.date))
+        return texts, metadatas
+
+
+def iso_date(value) -> Optional[str]:
+    from metadata_filter import parse_date
+
+    date = parse_date(value)
+    return None if str(date) == "NaT" else str(date)
+
+
+def code_articles(corpus: str) -> Iterator[Tuple[str, str, Dict]]:
+    """Статьи ЖК РФ: текст статьи — фрагменты в порядке следования"""
+    from benchmark_retrieval import load_corpus
+    from context_packer import article_number
+
+    texts, metadatas = load_corpus(corpus)
+    articles: Dict[str, Tuple[List[str], Dict]] = {}
+    for text, metadata in zip(texts, metadatas):
+        number = article_number(metadata)
+        if number:
+            articles.setdefault(number, ([], {"article_number": number,
+                                               "article": metadata.get("article", "")}))[0].append(text)
+    for number, (parts, metadata) in articles.items():
+        yield f"ЖК РФ/{number}", "\n".join(parts), metadata
+
+
+def ingest_documents(corpus: VersionedCorpus, documents: Iterable[Dict]) -> int:
+    """
+    Акты RusLawOD: ключ — pravogovruNd, утратившие силу — надгробия.
+
+    Редакция датируется актуальностью текста (actual_datetimeIPS, в data_loader —
+    scrape_timestamp): дата принятия docdateIPS у всех редакций акта одна и остается
+    только в метаданных.
+    """
+    added = 0
+    for document in documents:
+        identification = document.get("metadata", {}).get("identification", {})
+        key = str(identification.get("pravogovruNd") or document.get("id"))
+        valid_from = iso_date(identification.get("actual_datetimeIPS")) \
+            or iso_date(identification.get("scrape_timestamp"))
+        if not valid_from:
+            continue
+        repealed = any(status in str(identification.get("status", "")) for status in REPEALED_STATUSES)
+        text = None if repealed else document.get("content", {}).get("text")
+        metadata = {k: identification[k] for k in ("heading", "doc_type", "issuedByIPS", "status")
+                    if k in identification}
+        if identification.get("docdateIPS"):
+            metadata["docdateIPS"] = iso_date(identification["docdateIPS"])
+        added += corpus.add(key, text, valid_from, metadata)
+    return added
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Версионированный корпус")
+    parser.add_argument("command", choices=["ingest-code", "ingest-documents", "export", "stats"])
+    parser.add_argument("paths", nargs="*", help="Parquet-файлы RusLawOD для ingest-documents")
+    parser.add_argument("--directory", default=VERSIONED_DIR)
+    parser.add_argument("--corpus", choices=["docx", "html"], default="docx")
+    parser.add_argument("--valid-from", help="дата вступления загружаемой редакции ЖК РФ в силу")
+    parser.add_argument("--as-of")
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    store = VersionedCorpus(args.directory)
+    if args.command == "ingest-code":
+        if not args.valid_from:
+            parser.error("укажите --valid-from")
+        added = sum(store.add(key, text, iso_date(args.valid_from), metadata)
+                    for key, text, metadata in code_articles(args.corpus))
+        print(f"Новых редакций: {added}")
+    elif args.command == "ingest-documents":
+        from document_store import iter_parquet_documents
+
+        print(f"Новых редакций: {ingest_documents(store, iter_parquet_documents(args.paths))}")
+    elif args.command == "export":
+        if not args.as_of or not args.output:
+            parser.error("укажите --as-of и --output")
+        texts, metadatas = store.as_of(iso_date(args.as_of)).texts_and_metadatas()
+        with open(args.output, "w", encoding="utf-8") as f:
+            for text, metadata in zip(texts, metadatas):
+                f.write(json.dumps({"text": text, "metadata": metadata}, ensure_ascii=False) + "\n")
+        print(f"Текстов на {args.as_of}: {len(texts)}")
+    print(json.dumps(store.stats(), ensure_ascii=False))
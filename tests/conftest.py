@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Модули ETL импортируются так же, как при запуске `python etl/<модуль>.py`
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "etl"))
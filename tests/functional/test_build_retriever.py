@@ -0,0 +1,31 @@
+import pytest
+
+from retrieval import build_retriever
+
+
+class NoDocstoreIndex:
+    """Хранилище без docstore, как ShardedIndex"""
+
+
+class HotSwapLike:
+    def __init__(self):
+        self.filters = None
+
+    def enable_filters(self, config):
+        self.filters = config
+
+
+@pytest.mark.parametrize("section", ["filters", "references", "hierarchy"])
+def test_sections_needing_docstore_are_rejected(section):
+    with pytest.raises(ValueError, match=f"retrieval.{section}.*NoDocstoreIndex"):
+        build_retriever(NoDocstoreIndex(), {section: {}})
+
+
+def test_hot_swap_index_builds_filters_itself():
+    index = HotSwapLike()
+    retriever = build_retriever(index, {"filters": {"fields": ["status"]}})
+    assert retriever.filtered_search is index
+    assert index.filters == {"fields": ["status"]}
+
+    with pytest.raises(ValueError, match="retrieval.references"):
+        build_retriever(index, {"filters": {}, "references": {}})
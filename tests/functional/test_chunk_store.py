@@ -0,0 +1,21 @@
+from chunk_store import ChunkStore
+
+
+def test_metadata_round_trip_with_nested_values():
+    document = {"source": "JKRF.docx", "document_type": "law", "file_name": "JKRF.docx"}
+    metadatas = [
+        dict(document, point_number=1, refs=["ст. 29", "ст. 30"], extra={"tags": ["a"]}, chunk_index=0),
+        dict(document, point_number=1, refs=["ст. 29", "ст. 30"], extra={"tags": ["a"]}, chunk_index=1),
+        dict(document, point_number=2, refs=[], extra={}),
+    ]
+    store = ChunkStore.from_texts(["первый", "второй", "третий"], metadatas)
+
+    assert store.metadatas() == metadatas
+    assert isinstance(store.metadata(0)["refs"], list)
+    # Фрагменты одного пункта делят один набор метаданных, позиция хранится отдельно
+    assert len(store.documents) == 1
+    assert len(store.extras) == 2
+    # Изменение полученных метаданных не портит хранилище
+    store.metadata(0)["refs"].append("ст. 31")
+    assert store.metadata(0)["refs"] == ["ст. 29", "ст. 30"]
+    assert store[1].text == "второй"
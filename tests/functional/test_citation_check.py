@@ -0,0 +1,40 @@
+from citation_check import NgramIndex, check_source, reference_article
+
+TEXTS = [
+    "Статья 29. Самовольные переустройство и (или) перепланировка помещения в многоквартирном доме",
+    "Собственник помещения обязан привести такое помещение в прежнее состояние",
+    "Статья 30. Права и обязанности собственника жилого помещения",
+]
+ARTICLES = ["29", "29", "30"]
+
+
+def test_short_quote_matches_article():
+    index = NgramIndex(TEXTS, ARTICLES, n=3)
+    result = check_source(index, {"reference": "ст. 29 ЖК РФ", "text": "прежнее состояние"}, 0.8)
+    assert result["quote_exact"]
+    assert result["quote_in_article"]
+    assert result["grounded"]
+
+
+def test_other_code_reference_is_not_grounded():
+    index = NgramIndex(TEXTS, ARTICLES, n=3)
+    assert reference_article("ГК РФ, ст. 29") is None
+    assert reference_article("ЖК РФ, ст. 29") == "29"
+    assert reference_article("ст. 30") == "30"
+
+    result = check_source(index, {"reference": "ГК РФ, ст. 29", "text": "прежнее состояние"}, 0.8)
+    assert result["other_act"]
+    assert not result["reference_known"]
+    assert not result["grounded"]
+
+
+def test_quote_repeated_in_other_article_matches_cited_article():
+    text = "собственник обязан поддерживать помещение в надлежащем состоянии не допуская бесхозяйственного обращения"
+    index = NgramIndex([f"Статья 10. {text}", f"Статья 30. {text}"], ["10", "30"], n=3)
+    for article in ("10", "30"):
+        result = check_source(index, {"reference": f"ст. {article} ЖК РФ", "text": text}, 0.8)
+        assert result["quote_exact"]
+        assert result["quote_in_article"]
+        assert result["grounded"]
+    # Короткая цитата тоже сначала ищется в цитируемой статье
+    assert check_source(index, {"reference": "ст. 30 ЖК РФ", "text": "собственник обязан"}, 0.8)["grounded"]
@@ -0,0 +1,120 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from llm_backends import MockLLMBackend
+from llm_client import LLMClient, RetryableLLMError
+
+MESSAGES = [("human", "Вопрос")]
+
+
+class FlakyBackend(MockLLMBackend):
+    """Первые failures вызовов завершаются временной ошибкой"""
+
+    def __init__(self, failures: int, **kwargs):
+        super().__init__(**kwargs)
+        self.failures = failures
+
+    def sample_latency(self) -> float:
+        latency = super().sample_latency()
+        if self.calls <= self.failures:
+            raise RetryableLLMError("mock failure")
+        return latency
+
+
+class SlowFirstBackend(MockLLMBackend):
+    """Первый вызов отвечает за slow_ms, остальные — за latency_ms"""
+
+    def __init__(self, slow_ms: float, **kwargs):
+        super().__init__(**kwargs)
+        self.slow_ms = slow_ms
+
+    def sample_latency(self) -> float:
+        latency = super().sample_latency()
+        return self.slow_ms / 1000 if self.calls == 1 else latency
+
+
+class InFlightBackend(MockLLMBackend):
+    """Запоминает наибольшее число одновременных вызовов"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._counter = threading.Lock()
+
+    def invoke(self, messages):
+        with self._counter:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            return super().invoke(messages)
+        finally:
+            with self._counter:
+                self.in_flight -= 1
+
+
+class LocalBackend(InFlightBackend):
+    concurrent = False
+
+
+def run_concurrently(client, count):
+    with ThreadPoolExecutor(max_workers=count) as executor:
+        return list(executor.map(lambda _: client.invoke(MESSAGES), range(count)))
+
+
+def test_retries_transient_errors():
+    backend = FlakyBackend(failures=2)
+    client = LLMClient(backend, max_retries=3, backoff_ms=1)
+    assert client.invoke(MESSAGES).content == backend.answer
+    assert backend.calls == 3
+    client.close()
+
+
+def test_gives_up_after_max_retries():
+    backend = MockLLMBackend(failure_rate=1.0)
+    client = LLMClient(backend, max_retries=2, backoff_ms=1)
+    with pytest.raises(RetryableLLMError):
+        client.invoke(MESSAGES)
+    assert backend.calls == 3
+    client.close()
+
+
+def test_hedged_request_answers_before_slow_one():
+    backend = SlowFirstBackend(slow_ms=2000, latency_ms=10)
+    client = LLMClient(backend, hedge_after_ms=50)
+    start = time.perf_counter()
+    client.invoke(MESSAGES)
+    assert time.perf_counter() - start < 1.0
+    assert backend.calls == 2
+    client.close()
+
+
+def test_concurrent_requests_are_batched():
+    backend = MockLLMBackend(latency_ms=10)
+    client = LLMClient(backend, batch_window_ms=200, max_batch_size=4)
+    responses = run_concurrently(client, 4)
+    assert [r.content for r in responses] == [backend.answer] * 4
+    assert backend.last_stats["batch_size"] == 4
+    client.close()
+
+
+def test_max_concurrency_limits_requests_in_flight():
+    backend = InFlightBackend(latency_ms=30)
+    client = LLMClient(backend, max_concurrency=2)
+    run_concurrently(client, 8)
+    assert backend.max_in_flight == 2
+    client.close()
+
+
+def test_local_backend_is_called_one_request_at_a_time():
+    backend = LocalBackend(latency_ms=20)
+    client = LLMClient(backend, max_concurrency=4)
+    run_concurrently(client, 6)
+    assert backend.max_in_flight == 1
+    client.close()
+
+    with pytest.raises(ValueError, match="Хеджирование"):
+        LLMClient(backend, hedge_after_ms=100)
@@ -0,0 +1,21 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from metadata_filter import MetadataIndex
+
+
+def test_rare_and_frequent_values_select_same_rows():
+    metadatas = [{"article_number": str(i % 250), "status": "Действует" if i % 4 else "Утратил силу",
+                  "classifier": "010.000,020.000" if i % 3 == 0 else None} for i in range(4000)]
+    index = MetadataIndex(metadatas, ["article_number", "status", "classifier"])
+
+    # Номер статьи хранится списком фрагментов, статус — маской
+    assert index.bitmaps["article_number"]["7"].dtype == np.int32
+    assert index.bitmaps["status"]["Действует"].dtype == np.uint8
+
+    ids = index.ids({"article_number": ["7", "8"], "status": "Действует", "classifier": "020.000"})
+    expected = [i for i, m in enumerate(metadatas)
+                if m["article_number"] in ("7", "8") and m["status"] == "Действует" and i % 3 == 0]
+    assert ids.tolist() == expected
+    assert index.ids({"article_number": "нет такой"}).tolist() == []
@@ -0,0 +1,35 @@
+import signal
+import time
+
+from prefork_server import PreforkServer
+
+
+class CrashingServer(PreforkServer):
+    """Воркер падает сразу после запуска, модель не загружается"""
+
+    def load(self):
+        pass
+
+    def _serve(self):
+        raise RuntimeError("worker failed to start")
+
+
+def test_crash_loop_stops_master_with_backoff(monkeypatch):
+    # Обработчики сигналов мастера не должны остаться в процессе pytest
+    monkeypatch.setattr(signal, "signal", lambda *args: None)
+    server = CrashingServer("key", "role", workers=1, restart_delay_s=0.05, max_fast_crashes=3)
+    start = time.monotonic()
+    assert server.run() == 1
+    # Перезапуски откладываются на 0.05 и 0.1 с
+    assert time.monotonic() - start >= 0.15
+    assert server.pids == []
+
+
+def test_worker_that_ran_long_enough_resets_crash_count():
+    server = CrashingServer("key", "role", workers=1, min_uptime_s=10, max_fast_crashes=2)
+    server._started = {1: time.monotonic() - 60}
+    server._fast_crashes = 1
+    server._worker_exited(1, 0)
+    assert server._fast_crashes == 0
+    assert not server._crash_loop
+    assert len(server._respawn_at) == 1
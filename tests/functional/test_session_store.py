@@ -0,0 +1,35 @@
+import pytest
+
+from session_store import SQLiteSessionStore, SessionConflictError, dump_session, load_session
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = SQLiteSessionStore(str(tmp_path / "sessions.sqlite"), ttl_s=60)
+    yield store
+    store.close()
+
+
+def test_versions_reject_stale_writes(store):
+    assert store.get("s1") is None
+    assert store.put("s1", dump_session(1, [("human", "вопрос"), ("assistant", "ответ")]), 0) == 1
+    data, version = store.get("s1")
+    assert load_session(data) == (1, [("human", "вопрос"), ("assistant", "ответ")])
+    assert version == 1
+
+    assert store.put("s1", dump_session(2, []), 1) == 2
+    # Второй воркер прочитал версию 1 и пишет поверх нее
+    with pytest.raises(SessionConflictError):
+        store.put("s1", dump_session(2, []), 1)
+    # Новая сессия не перезаписывает существующую
+    with pytest.raises(SessionConflictError):
+        store.put("s1", dump_session(1, []), 0)
+    assert store.get("s1")[1] == 2
+
+
+def test_expired_session_starts_over(tmp_path):
+    store = SQLiteSessionStore(str(tmp_path / "sessions.sqlite"), ttl_s=-1)
+    store.put("s1", dump_session(1, []), 0)
+    assert store.get("s1") is None
+    assert store.put("s1", dump_session(1, []), 0) == 1
+    store.close()
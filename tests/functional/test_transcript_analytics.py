@@ -0,0 +1,70 @@
+import json
+import os
+from datetime import datetime
+
+import pytest
+
+pytest.importorskip("pyarrow")
+
+from transcript_analytics import article_hits, ingest, top_questions, unanswered
+
+DAY_1 = datetime(2025, 5, 1, 12).timestamp()
+DAY_2 = datetime(2025, 5, 2, 12).timestamp()
+DAY_3 = datetime(2025, 5, 3, 12).timestamp()
+
+
+def write_segment(path, records):
+    with open(path, "a", encoding="utf-8") as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+def turn(session, number, ts, question, answer):
+    return {"event": "turn", "session": session, "turn": number, "ts": ts, "question": question,
+            "answer": answer, "timings_ms": {"retrieval_ms": 5.0, "llm_ms": 100.0}}
+
+
+@pytest.fixture
+def dataset(tmp_path):
+    results_dir, transcripts_dir, output_dir = (str(tmp_path / name) for name in ("results", "transcripts", "out"))
+    os.makedirs(results_dir)
+    os.makedirs(transcripts_dir)
+    segment = os.path.join(transcripts_dir, "transcripts_20250501_120000_1_0001.jsonl")
+    write_segment(segment, [
+        turn("a", 1, DAY_1, "Кто платит за капремонт?", "Собственник, ст. 158 ЖК РФ"),
+        turn("b", 1, DAY_1, "Кто платит за капремонт", "Согласно ст. 158 ЖК РФ и ст. 169 ЖК РФ"),
+        turn("c", 1, DAY_2, "Можно ли завести козу?", "Информация не найдена"),
+    ])
+    assert ingest(results_dir, transcripts_dir, output_dir) == 3
+    return results_dir, transcripts_dir, output_dir, segment
+
+
+def test_queries(dataset):
+    *_, output_dir, _ = dataset
+    assert top_questions(1, data_dir=output_dir) == [{"question": "кто платит за капремонт", "count": 2}]
+    assert article_hits(data_dir=output_dir) == [{"article": "158", "count": 2}, {"article": "169", "count": 1}]
+    assert [(d["date"], d["not_found"], d["answers"], d["rate"]) for d in unanswered(data_dir=output_dir)] == [
+        ("2025-05-01", 0, 2, 0.0), ("2025-05-02", 1, 1, 1.0)]
+    assert unanswered(since="2025-05-02", data_dir=output_dir)[0]["date"] == "2025-05-02"
+
+
+def test_reingest_rewrites_only_affected_partitions(dataset):
+    results_dir, transcripts_dir, output_dir, segment = dataset
+    untouched = os.path.join(transcripts_dir, "transcripts_20250502_120000_2_0001.jsonl")
+    write_segment(untouched, [turn("d", 1, DAY_2, "Можно ли завести козу", "Информация не найдена"),
+                              turn("d", 2, DAY_3, "А кролика?", "Информация не найдена")])
+    assert ingest(results_dir, transcripts_dir, output_dir) == 2
+    day_2_files = set(os.listdir(os.path.join(output_dir, "date=2025-05-02")))
+    day_3_files = set(os.listdir(os.path.join(output_dir, "date=2025-05-03")))
+
+    # Дописанный сегмент читается заново, его старые строки заменяются
+    write_segment(segment, [turn("a", 2, DAY_1, "А за лифт?", "ст. 154 ЖК РФ")])
+    assert ingest(results_dir, transcripts_dir, output_dir) == 4
+
+    assert sum(d["answers"] for d in unanswered(data_dir=output_dir)) == 6
+    assert top_questions(1, data_dir=output_dir)[0]["count"] == 2
+    # Сегмент есть и во второй дате — ее партиция переписана, но строки другого сегмента сохранены
+    assert set(os.listdir(os.path.join(output_dir, "date=2025-05-02"))) != day_2_files
+    assert [d["answers"] for d in unanswered(since="2025-05-02", until="2025-05-02", data_dir=output_dir)] == [2]
+    # Партиция без строк дописанного сегмента не переписывается
+    assert set(os.listdir(os.path.join(output_dir, "date=2025-05-03"))) == day_3_files
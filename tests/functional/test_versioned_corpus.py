@@ -0,0 +1,43 @@
+import pytest
+
+pytest.importorskip("numpy")
+
+from versioned_corpus import VersionedCorpus, ingest_documents
+
+
+def act(actual_date, text, status="Действует"):
+    identification = {"pravogovruNd": 102090645, "docdateIPS": "2004-12-29", "scrape_timestamp": actual_date,
+                      "status": status, "heading": "Жилищный кодекс Российской Федерации"}
+    return {"metadata": {"identification": identification}, "content": {"text": text}}
+
+
+def test_revisions_are_dated_by_actual_date(tmp_path):
+    corpus = VersionedCorpus(str(tmp_path))
+    added = ingest_documents(corpus, [
+        act("2010-01-01 00:00:00", "Статья 1\nредакция 2010\n"),
+        act("2015-01-01", "Статья 1\nредакция 2015\n"),
+        act("2020-01-01", "Статья 1\nредакция 2015\n", status="Утратил силу"),
+    ])
+    assert added == 3
+
+    # Индекс читается заново, как при следующем запуске
+    corpus = VersionedCorpus(str(tmp_path))
+    assert corpus.get("102090645", "2009-12-31") is None
+    assert corpus.get("102090645", "2012-06-01") == "Статья 1\nредакция 2010\n"
+    assert corpus.get("102090645", "2016-06-01") == "Статья 1\nредакция 2015\n"
+    assert corpus.get("102090645", "2021-01-01") is None
+
+    texts, metadatas = corpus.as_of("2016-06-01").texts_and_metadatas()
+    assert texts == ["Статья 1\nредакция 2015\n"]
+    assert metadatas[0]["status"] == "Действует"
+    assert metadatas[0]["docdateIPS"] == "2004-12-29"
+
+
+def test_metadata_change_without_text_change_is_a_revision(tmp_path):
+    corpus = VersionedCorpus(str(tmp_path))
+    assert corpus.add("a", "текст", "2020-01-01", {"status": "Действует"})
+    assert not corpus.add("a", "текст", "2021-01-01", {"status": "Действует"})
+    assert corpus.add("a", "текст", "2022-01-01", {"status": "Не вступил в силу"})
+    assert corpus.metadata_at("a", "2021-06-01") == {"status": "Действует"}
+    assert corpus.metadata_at("a", "2022-06-01") == {"status": "Не вступил в силу"}
+    assert corpus.get("a", "2022-06-01") == "текст"